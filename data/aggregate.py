@@ -0,0 +1,91 @@
+# Constant-memory aggregation of result files that are too large to load at
+# once. Parsers read a file in chunks of rows, sized to stay under a memory
+# ceiling, and fold each chunk into fixed-size aggregates (counts, sums,
+# sketches and per-second bins) instead of collecting every sample. Counts,
+# sums, means, minimums and maximums are exact; percentiles come from
+# sketch.LatencySketch and are within its relative error of the exact ones.
+import io
+import numpy as np
+import pandas as pd
+
+import sketch
+
+# Default memory ceiling for one chunk of parsed rows.
+MEMORY_MB = 64
+
+# Approximate size of one parsed value in a chunk. Strings, such as the
+# sink_id column, are held as Python objects.
+STRING_BYTES = 64
+
+
+def add_arguments(parser):
+    parser.add_argument(
+            '--memory-mb',
+            type=int,
+            default=MEMORY_MB,
+            help="Approximate memory ceiling for each chunk of rows read when summarizing in a sketch.")
+
+
+def chunk_rows(memory_mb, dtype):
+    # The number of rows with the given column types that fit in memory_mb.
+    # Counts the row index as well as the columns.
+    row_bytes = 8 + sum(STRING_BYTES if t is str else np.dtype(t).itemsize for t in dtype.values())
+    return max(1, int(memory_mb * 1024 * 1024 // row_bytes))
+
+
+def read_csv_chunks(f, dtype, memory_mb=MEMORY_MB):
+    # Yield DataFrames with the columns in dtype, from consecutive chunks of
+    # the CSV. An empty file, or one with only a header, as when a run is
+    # collected before any sink logged, yields none.
+    try:
+        chunks = pd.read_csv(f,
+                             usecols=list(dtype),
+                             dtype=dtype,
+                             float_precision='round_trip',
+                             chunksize=chunk_rows(memory_mb, dtype))
+    except pd.errors.EmptyDataError:
+        return
+    for chunk in chunks:
+        if len(chunk):
+            yield chunk
+
+
+def timestamps_in_seconds(f):
+    # Ray logs fractional seconds, Flink logs integer milliseconds. Peek at
+    # the first record of a binary file to find out which one we have. A file
+    # without records can be either.
+    lines = f.peek(io.DEFAULT_BUFFER_SIZE).decode().split('\n')
+    rows = [line.strip().split(',') for line in lines[1:] if line.strip()]
+    if not rows:
+        return False
+    column = lines[0].strip().split(',').index('timestamp')
+    return column < len(rows[0]) and '.' in rows[0][column]
+
+
+class SecondBins(object):
+    # A LatencySketch of the values in each second.
+    def __init__(self, error):
+        self.error = error
+        self.sketches = {}
+
+    def add(self, seconds, values):
+        order = np.argsort(seconds, kind='stable')
+        new_seconds, starts = np.unique(seconds[order], return_index=True)
+        for second, group in zip(new_seconds.tolist(), np.split(values[order], starts[1:])):
+            if second not in self.sketches:
+                self.sketches[second] = sketch.LatencySketch(self.error)
+            self.sketches[second].add(group)
+
+    def seconds(self):
+        return sorted(self.sketches)
+
+    def __getitem__(self, second):
+        return self.sketches[second]
+
+
+def merge(sketches, error):
+    # A single sketch of all the values in the given sketches.
+    merged = sketch.LatencySketch(error)
+    for other in sketches:
+        merged.merge(other)
+    return merged
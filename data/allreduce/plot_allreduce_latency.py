@@ -4,13 +4,24 @@ NUM_ROUNDS = 20
 
 
 import os
-import re
+import sys
 from collections import namedtuple
 import numpy as np
 import matplotlib.pyplot as plt
 import copy
 import csv
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+from results import open_results
+from catalog import Catalog
+from finished import last_finished_times
+import cache
+import profiling
+import stats
+
+# Bump this whenever the parsers below change, to invalidate cached results.
+PARSER_VERSION = 1
+
 FIELDS = [
     'workers',
     'shards',
@@ -19,6 +30,11 @@ FIELDS = [
     'bytes',
 ]
 Label = namedtuple('Label', FIELDS)
+MPI_FIELDS = [
+    'workers',
+    'bytes',
+]
+MPILabel = namedtuple('MPILabel', MPI_FIELDS)
 
 # Dummy GCS value so we can identify MPI values.
 MPI_GCS = 2
@@ -129,90 +145,77 @@ def plot(rows, workers, shards, gcs, bytes, group_by_field, sort_by_fields, reve
         plt.show()
     return rows
 
+@cache.columns('allreduce-finished', PARSER_VERSION)
+def parse_finished_times(results, filename, num_rounds):
+    # Only the last rounds are plotted, so only read the end of the log.
+    return {'latency': last_finished_times(results.buffer(filename), num_rounds)}
+
+@cache.columns('allreduce-mpi-steps', PARSER_VERSION)
+def parse_mpi_steps(results, filename):
+    latencies = []
+    with results.open(filename) as f:
+        for line in f.readlines():
+            fields = line.split(',')
+            if len(fields) == 2 or len(fields) == 3:
+                try:
+                    step = int(fields[0])
+                except:
+                    continue
+                latencies.append(float(fields[1]) / 1e3)
+    return {'latency': np.array(latencies, dtype=np.float64)}
+
 def parse_lineage_stash(directory, all_latencies):
-    regex = 'latency-'
-    for field in FIELDS:
-        regex += '(?P<{field}>.*)-{field}-'.format(field=field)
-    for filename in os.listdir(directory):
-        g = re.match(regex, filename)
-        if g is None:
-            continue
-        else:
-            print(filename)
-        fields = g.groupdict()
-        fields['bytes'] = int(fields['bytes']) * 4 // 1e6
-        for field, val in fields.items():
-            fields[field] = int(val)
-        label = Label(**fields)
-        latencies = []
-        with open(os.path.join(directory, filename), 'r') as f:
-            for line in f.readlines():
-                if "Finished" in line:
-                    latency = line.split(' ')[-1]
-                    latencies.append(float(latency))
+    results = open_results(directory)
+    for filename, label in Catalog(results, 'latency-', Label).select():
+        print(filename)
+        label = label._replace(bytes=int(label.bytes * 4 // 1e6))
+        latencies = parse_finished_times(results, filename, NUM_ROUNDS)['latency']
         if len(latencies) > 0:
-            latencies = latencies[-NUM_ROUNDS:]
+            latencies = latencies.tolist()
             all_latencies[label] = latencies
             print(label, np.mean(latencies), np.std(latencies))
 
 def parse_mpi(directory, all_latencies):
-    MPI_FIELDS = [
-        'workers',
-        'bytes',
-    ]
-
-    regex = 'mpi-latency-'
-    for field in MPI_FIELDS:
-        regex += '(?P<{field}>.*)-{field}-'.format(field=field)
-
-    for filename in os.listdir(directory):
-        g = re.match(regex, filename)
-        if g is None:
-            continue
-        else:
-            print(filename)
-        fields = g.groupdict()
-        for field, val in fields.items():
-            fields[field] = int(val)
-        fields['bytes'] = int(fields['bytes']) * 4 // 1e6
+    results = open_results(directory)
+    for filename, mpi_label in Catalog(results, 'mpi-latency-', MPILabel).select():
+        print(filename)
+        fields = mpi_label._asdict()
+        fields['bytes'] = fields['bytes'] * 4 // 1e6
         fields['gcs'] = MPI_GCS
         fields['shards'] = 1
         fields['gcsdelay'] = 0
         label = Label(**fields)
-        latencies = []
-        with open(os.path.join(directory, filename), 'r') as f:
-            for line in f.readlines():
-                fields = line.split(',')
-                if len(fields) == 2 or len(fields) == 3:
-                    try:
-                        step = int(fields[0])
-                    except:
-                        continue
-                    latencies.append(float(fields[1]) / 1e3)
+        latencies = parse_mpi_steps(results, filename)['latency']
         if len(latencies) > 0:
-            latencies = latencies[-NUM_ROUNDS:]
+            latencies = latencies[-NUM_ROUNDS:].tolist()
             all_latencies[label] = latencies
 
 
-def main(directory, save_filename):
+def main(directory, save_filename, replicates=stats.REPLICATES, confidence=stats.CONFIDENCE, jobs=1):
     all_latencies = {}
-    parse_lineage_stash(directory, all_latencies)
-    parse_mpi(directory, all_latencies)
+    # The files are listed as they are parsed.
+    with profiling.stage('parse') as parsed:
+        parse_lineage_stash(directory, all_latencies)
+        parse_mpi(directory, all_latencies)
+        parsed.records += sum(len(values) for values in all_latencies.values())
 
-    means = [(label, (np.mean(values) * 1e3, np.std(values) * 1000)) for label, values in all_latencies.items()]
+    with profiling.stage('aggregate') as aggregated:
+        means = [(label, (np.mean(values) * 1e3, np.std(values) * 1000)) for label, values in all_latencies.items()]
+        aggregated.records += parsed.records
     print(means)
 
     plotted_rows = []
     num_workers = means[0][0].workers
-    plotted_rows += plot(means,
-        num_workers,
-        None,
-        None,
-        None,
-        'bytes',
-        ['gcs', 'gcsdelay'],
-        reverse=True,
-        save_filename=save_filename)
+    with profiling.stage('render'):
+        plotted_rows += plot(means,
+            num_workers,
+            None,
+            None,
+            None,
+            'bytes',
+            ['gcs', 'gcsdelay'],
+            reverse=True,
+            save_filename=save_filename)
 
     if save_filename is not None:
         # Write the plotted stats to an output CSV file.
@@ -221,15 +224,24 @@ def main(directory, save_filename):
         # Stable sort.
         for field in reversed(order):
             plotted_rows.sort(key=lambda row: getattr(row[0], field))
+        # Bootstrap confidence intervals over the rounds, in ms.
+        samples = [np.array(all_latencies[label]) * 1e3 for label, _ in plotted_rows]
+        with profiling.stage('aggregate') as aggregated:
+            intervals = stats.bootstrap_all(samples, jobs, replicates=replicates, confidence=confidence)
+            aggregated.records += sum(len(sample) for sample in samples)
         with open(csv_filename, 'w+') as f:
-            fields = FIELDS + ['mean', 'stddev']
+            fields = FIELDS + ['mean', 'stddev', 'count', 'p50', 'p99'] + stats.interval_fields()
             w = csv.DictWriter(f, fields)
             w.writeheader()
-            for label, value in plotted_rows:
+            for (label, value), samples, interval in zip(plotted_rows, samples, intervals):
                 row = label._asdict()
                 mean, stddev = value
                 row['mean'] = mean
                 row['stddev'] = stddev
+                row['count'] = len(samples)
+                row['p50'] = np.percentile(samples, 50)
+                row['p99'] = np.percentile(samples, 99)
+                row.update(stats.interval_row(interval))
                 w.writerow(row)
 
 if __name__ == '__main__':
@@ -238,11 +250,22 @@ if __name__ == '__main__':
     parser.add_argument(
             '--directory',
             type=str,
-            default='.')
+            default='.',
+            help="Directory or .tar.gz archive with the data files.")
     parser.add_argument(
             '--save-filename',
             type=str,
             default=None)
+    parser.add_argument(
+            '--jobs',
+            type=int,
+            default=1,
+            help="Number of processes to compute confidence intervals with.")
+    stats.add_arguments(parser)
+    cache.add_arguments(parser)
+    profiling.add_arguments(parser)
     args = parser.parse_args()
+    cache.configure_from_args(args)
+    profiling.configure_from_args(args)
 
-    main(args.directory, args.save_filename)
+    main(args.directory, args.save_filename, args.bootstrap_replicates, args.confidence, args.jobs)
@@ -1,10 +1,33 @@
 import re
 import matplotlib.pyplot as plt
 import os
-
+import sys
+from collections import namedtuple
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+from results import open_results
+from catalog import Catalog
+from finished import finished_times
+import changepoint
+import profiling
+
+
+FIELDS = [
+    'workers',
+    'shards',
+    'gcs',
+    'gcsdelay',
+    'bytes',
+]
+Label = namedtuple('Label', FIELDS)
 
 CHECKPOINT_INTERVAL = 150
+# The iteration at which a node is killed. Only used if no failure is
+# detected in the MPI run.
 FAILURE_STEP = 280
+# Number of iterations to plot before and after the failure.
+BEFORE_FAILURE = 9
+AFTER_FAILURE = 15
 
 MPI_LABEL = 'OpenMPI+checkpoint'
 WRITEFIRST_LABEL = 'WriteFirst'
@@ -12,21 +35,18 @@ LINEAGE_STASH_LABEL = 'Lineage stash'
 
 def parse_mpi(directory):
     mpi_times = []
-    for filename in os.listdir(directory):
-        if 'failure-mpi' not in filename:
-            continue
-        with open(os.path.join(directory, filename), 'r') as f:
-            for line in f.readlines():
-                fields = line.split(',')
-                if len(fields) == 3:
-                    try:
-                        step = int(fields[0])
-                    except:
-                        continue
-                    current_time = float(fields[2]) / 1e3
-                    if step != len(mpi_times):
-                        continue
-                    mpi_times.append(current_time)
+    for filename, f in open_results(directory).files('.*failure-mpi'):
+        for line in f.readlines():
+            fields = line.split(',')
+            if len(fields) == 3:
+                try:
+                    step = int(fields[0])
+                except:
+                    continue
+                current_time = float(fields[2]) / 1e3
+                if step != len(mpi_times):
+                    continue
+                mpi_times.append(current_time)
 
     print(len(mpi_times))
     mpi_latencies = []
@@ -40,41 +60,50 @@ def parse_mpi(directory):
 def parse_lineage_stash(directory):
     writefirst_latencies = []
     lineage_stash_latencies = []
-    for filename in os.listdir(directory):
-        if not filename.startswith('failure-latency'):
-            continue
-        if '0-gcs-' in filename:
+    catalog = Catalog(open_results(directory), 'failure-latency-', Label)
+    for filename, label in catalog.select():
+        if label.gcs == 0:
             latencies = lineage_stash_latencies
         else:
             latencies = writefirst_latencies
 
-        with open(os.path.join(directory, filename), 'r') as f:
-            for line in f.readlines():
-                if "Finished" in line:
-                    latency = line.split(' ')[-1]
-                    latencies.append(float(latency))
+        latencies += finished_times(catalog.results.buffer(filename)).tolist()
     print("WriteFirst recovery time:", max(writefirst_latencies))
     print("Lineage stash recovery time:", max(lineage_stash_latencies))
     return writefirst_latencies, lineage_stash_latencies
 
 
 
-def plot(latencies, save_filename, lineage_stash_offset):
+def plot(latencies, save_filename, lineage_stash_offset=None):
     fig, ax = plt.subplots()
 
-    START = 275
-    END = 299
-    SAVE = False
-
-    # The Ray runs don't kill at exactly round 280.
-    OFFSETS = {
-        MPI_LABEL: 0,
-        LINEAGE_STASH_LABEL: lineage_stash_offset,
-        WRITEFIRST_LABEL: lineage_stash_offset,
-    }
+    # The runs don't all fail at exactly the same iteration, so find the
+    # failure in each one and line them up with the MPI run.
+    failures = {}
+    for label, points in latencies:
+        block = changepoint.failure_block(points, log=True)
+        failures[label] = None if block is None else block[0]
+        print(label, "failure at iteration:", failures[label])
+    if lineage_stash_offset is None:
+        offsets = changepoint.align(failures, MPI_LABEL)
+    else:
+        offsets = {
+            MPI_LABEL: 0,
+            LINEAGE_STASH_LABEL: -lineage_stash_offset,
+            WRITEFIRST_LABEL: -lineage_stash_offset,
+        }
+    failure = failures[MPI_LABEL]
+    if failure is None:
+        failure = FAILURE_STEP
+    START = failure - BEFORE_FAILURE
+    END = failure + AFTER_FAILURE
 
     for label, points in latencies:
-        plt.plot(range(START, END), points[START+OFFSETS[label]:END+OFFSETS[label]], label=label, linewidth=2)
+        # Iteration i of this run is plotted at i + offset.
+        first = max(START - offsets[label], 0)
+        points = points[first:END - offsets[label]]
+        x = first + offsets[label]
+        plt.plot(range(x, x + len(points)), points, label=label, linewidth=2)
     ax.set_yscale('log')
     #ax.set_ylim(0.3)
 
@@ -89,13 +118,18 @@ def plot(latencies, save_filename, lineage_stash_offset):
     else:
         plt.show()
 
-def main(directory, save_filename, lineage_stash_offset):
+def main(directory, save_filename, lineage_stash_offset=None):
     latencies = []
-    latencies.append((MPI_LABEL, parse_mpi(directory)))
-    writefirst_latencies, lineage_stash_latencies = parse_lineage_stash(directory)
-    latencies.append((WRITEFIRST_LABEL, writefirst_latencies))
-    latencies.append((LINEAGE_STASH_LABEL, lineage_stash_latencies))
-    plot(latencies, save_filename, lineage_stash_offset)
+    # The files are listed as they are parsed.
+    with profiling.stage('parse') as parsed:
+        latencies.append((MPI_LABEL, parse_mpi(directory)))
+        writefirst_latencies, lineage_stash_latencies = parse_lineage_stash(directory)
+        latencies.append((WRITEFIRST_LABEL, writefirst_latencies))
+        latencies.append((LINEAGE_STASH_LABEL, lineage_stash_latencies))
+        parsed.records += sum(len(values) for _, values in latencies)
+    # Detects the failures as well as plotting.
+    with profiling.stage('render'):
+        plot(latencies, save_filename, lineage_stash_offset)
 
 
 if __name__ == '__main__':
@@ -104,16 +138,19 @@ if __name__ == '__main__':
     parser.add_argument(
             '--directory',
             type=str,
-            default='.')
+            default='.',
+            help="Directory or .tar.gz archive with the data files.")
     parser.add_argument(
             '--lineage-stash-offset',
             type=int,
-            default=0,
-            help="How much to offset the lineage stash plots by, since the failure time is not exact.")
+            default=None,
+            help="How much to offset the lineage stash plots by. By default, the failures are detected and the runs aligned automatically.")
     parser.add_argument(
             '--save-filename',
             type=str,
             default=None)
+    profiling.add_arguments(parser)
     args = parser.parse_args()
+    profiling.configure_from_args(args)
 
     main(args.directory, args.save_filename, args.lineage_stash_offset)
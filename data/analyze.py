@@ -0,0 +1,241 @@
+# One entry point for all of the plots and summaries, e.g.
+#   python analyze.py streaming-cdf --directory streaming/4-workers-m4-xlarge.tar.gz --save-filename cdf.png
+#   python analyze.py mpi-stats ../mpi-bench/mpi-results-pernode.txt
+#   python analyze.py report --output-dir figures
+# Each subcommand calls the main() of the script that it is named after, with
+# the same options. Everything runs in this process: numpy, pandas and
+# matplotlib are imported once, each directory or archive is listed once, and
+# parsed files are kept in memory (see cache.MemoryCache), so that plots of
+# the same results do not parse them again. `report` renders every figure in
+# the manifest (see render.py), plus the MPI stats if given their results,
+# into a scratch directory unless --output-dir or --in-place is given.
+import os
+import sys
+
+DATA_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, DATA_DIR)
+import aggregate
+import cache
+import profiling
+import render
+import results
+import stats
+
+MPI_STATS_SCRIPT = os.path.join(DATA_DIR, os.pardir, 'mpi-bench', 'gen_stats.py')
+
+
+def script(path):
+    return render.load_script(os.path.normpath(os.path.join(DATA_DIR, path)))
+
+
+def gen_stats():
+    return script(MPI_STATS_SCRIPT)
+
+
+def add_results_arguments(parser):
+    parser.add_argument(
+            '--directory',
+            type=str,
+            required=True,
+            help="Directory or .tar.gz archive with the data files.")
+    parser.add_argument(
+            '--save-filename',
+            type=str,
+            default=None)
+
+
+def add_sketch_arguments(parser):
+    parser.add_argument(
+            '--sketch-error',
+            type=float,
+            default=None,
+            help="If set, summarize latencies in a fixed-memory sketch with this relative error instead of keeping every sample.")
+    aggregate.add_arguments(parser)
+
+
+def add_jobs_argument(parser):
+    parser.add_argument(
+            '--jobs',
+            type=int,
+            default=1,
+            help="Number of processes to parse the data files and compute confidence intervals with.")
+
+
+def add_mpi_stats_arguments(parser):
+    parser.add_argument(
+            '--sizes',
+            type=int,
+            nargs='*',
+            default=None,
+            help="Values of num_float32 to summarize, by default the ones in gen_stats.py. Pass no values for all of them.")
+    parser.add_argument(
+            '--for-paper',
+            action='store_true',
+            help="Print (mean,std), pairs instead of CSV rows.")
+    parser.add_argument(
+            '--csv-filename',
+            type=str,
+            default=None,
+            help="Also write every statistic for each size and number of nodes to this CSV.")
+
+
+def streaming_cdf(args):
+    script('streaming/plot_latency_cdf.py').main(
+        args.directory, args.save_filename, args.sketch_error, args.memory_mb)
+
+
+def streaming_recovery(args):
+    script('streaming/plot_recovery.py').main(
+        args.directory, args.save_filename, args.flink_offset, args.sketch_error, args.memory_mb,
+        args.detected_window)
+
+
+def micro_cdf(args):
+    script('microbenchmark/plot_latency_cdf.py').main(
+        args.directory, args.save_filename, args.sketch_error, args.jobs, args.memory_mb,
+        args.bootstrap_replicates, args.confidence)
+
+
+def micro_lineage(args):
+    script('microbenchmark/plot_uncommitted_lineage.py').main(
+        args.directory, args.save_filename, args.jobs)
+
+
+def allreduce_latency(args):
+    script('allreduce/plot_allreduce_latency.py').main(
+        args.directory, args.save_filename, args.bootstrap_replicates, args.confidence, args.jobs)
+
+
+def allreduce_recovery(args):
+    script('allreduce/plot_allreduce_recovery.py').main(
+        args.directory, args.save_filename, args.lineage_stash_offset)
+
+
+def mpi_stats(args, patterns=None):
+    module = gen_stats()
+    sizes = module.SIZES if args.sizes is None else args.sizes or None
+    module.main(patterns or args.filenames, sizes, args.for_paper, csv_filename=args.csv_filename)
+
+
+def report(args):
+    entries = render.load_manifest(args.manifest)
+    # Only overwrite the checked-in figures and CSVs when asked to.
+    output_dir = None
+    if not args.in_place:
+        output_dir = os.path.abspath(args.output_dir)
+        if not os.path.isdir(output_dir):
+            os.makedirs(output_dir)
+        print("Writing the report to", output_dir)
+    rendered = [render.render(entry, output_dir) for entry in entries]
+    num_failed = render.print_rendered(entries, rendered)
+
+    if args.mpi_results:
+        print("==> {}".format(' '.join(args.mpi_results)))
+        cwd = os.getcwd()
+        try:
+            os.chdir(output_dir or cwd)
+            mpi_stats(args, [os.path.join(cwd, pattern) for pattern in args.mpi_results])
+        finally:
+            os.chdir(cwd)
+    return num_failed
+
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(description='Plot and summarize the results.')
+    cache.add_arguments(parser)
+    parser.add_argument(
+            '--memory-cache-mb',
+            type=int,
+            default=cache.MAX_MEMORY_MB,
+            help="Maximum size of the parsed files kept in memory. Least recently used files are dropped first.")
+    profiling.add_arguments(parser)
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    subparser = subparsers.add_parser('streaming-cdf', help="Latency CDF of the streaming benchmark.")
+    add_results_arguments(subparser)
+    add_sketch_arguments(subparser)
+    subparser.set_defaults(run=streaming_cdf)
+
+    subparser = subparsers.add_parser('streaming-recovery', help="Latency and throughput of the streaming benchmark during a failure.")
+    add_results_arguments(subparser)
+    subparser.add_argument(
+            '--flink-offset',
+            type=int,
+            default=None,
+            help="The amount to offset Flink by. By default, the failures are detected and the systems aligned automatically.")
+    subparser.add_argument(
+            '--detected-window',
+            action='store_true',
+            help="Summarize the latencies during and after recovery from the detected failure and recovery of each system.")
+    add_sketch_arguments(subparser)
+    subparser.set_defaults(run=streaming_recovery)
+
+    subparser = subparsers.add_parser('micro-cdf', help="Task latency CDFs of the microbenchmark.")
+    add_results_arguments(subparser)
+    add_sketch_arguments(subparser)
+    add_jobs_argument(subparser)
+    stats.add_arguments(subparser)
+    subparser.set_defaults(run=micro_cdf)
+
+    subparser = subparsers.add_parser('micro-lineage', help="Uncommitted lineage of the microbenchmark.")
+    add_results_arguments(subparser)
+    add_jobs_argument(subparser)
+    subparser.set_defaults(run=micro_lineage)
+
+    subparser = subparsers.add_parser('allreduce-latency', help="Allreduce iteration times.")
+    add_results_arguments(subparser)
+    add_jobs_argument(subparser)
+    stats.add_arguments(subparser)
+    subparser.set_defaults(run=allreduce_latency)
+
+    subparser = subparsers.add_parser('allreduce-recovery', help="Allreduce iteration times during a failure.")
+    add_results_arguments(subparser)
+    subparser.add_argument(
+            '--lineage-stash-offset',
+            type=int,
+            default=None,
+            help="How much to offset the lineage stash plots by. By default, the failures are detected and the runs aligned automatically.")
+    subparser.set_defaults(run=allreduce_recovery)
+
+    subparser = subparsers.add_parser('mpi-stats', help="Summary of the MPI allreduce times.")
+    subparser.add_argument(
+            'filenames',
+            type=str,
+            nargs='+',
+            help="Result files or glob patterns. All of them are summarized together.")
+    add_mpi_stats_arguments(subparser)
+    subparser.set_defaults(run=mpi_stats)
+
+    subparser = subparsers.add_parser('report', help="Render every figure in the manifest, and the MPI stats.")
+    subparser.add_argument(
+            '--manifest',
+            type=str,
+            default=os.path.join(DATA_DIR, 'figures.json'),
+            help="JSON list of {script, directory, options} entries. See render.py.")
+    subparser.add_argument(
+            '--output-dir',
+            type=str,
+            default=render.REPORT_DIR,
+            help="Directory to write all figures to.")
+    subparser.add_argument(
+            '--in-place',
+            action='store_true',
+            help="Write each figure to its script's directory instead, replacing the checked-in figures and CSVs.")
+    subparser.add_argument(
+            '--mpi-results',
+            type=str,
+            nargs='*',
+            default=[],
+            help="MPI result files or glob patterns to summarize as well.")
+    add_mpi_stats_arguments(subparser)
+    subparser.set_defaults(run=report)
+
+    args = parser.parse_args()
+    cache.configure(None if args.no_cache else args.cache_dir, args.cache_size_mb, memory=True,
+                    memory_mb=args.memory_cache_mb)
+    results.share()
+    profiling.configure_from_args(args)
+
+    num_failed = args.run(args)
+    sys.exit(1 if num_failed else 0)
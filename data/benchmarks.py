@@ -0,0 +1,269 @@
+# Benchmarks for the parsers and aggregations behind the plots. Each one is
+# run on synthetic results (see synthetic.py) for clusters of several sizes,
+# in a fresh process so that its peak RSS is its own, and reports the best
+# time over --repeat runs and the number of records (input lines) per second.
+#
+# Results are saved as JSON in --results-dir, named after the date and git
+# commit, so that runs can be compared over time:
+#   python benchmarks.py
+#   python benchmarks.py --workers 64 --compare <earlier results>.json
+import contextlib
+import datetime
+import json
+import os
+import subprocess
+import sys
+import time
+from collections import OrderedDict
+
+DATA_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, DATA_DIR)
+import cache
+import profiling
+import synthetic
+
+BENCHMARK_DIR = os.path.join(cache.CACHE_DIR, 'benchmarks')
+RESULTS_DIR = os.path.join(cache.CACHE_DIR, 'benchmark-results')
+WORKERS = [4, 64, 256, 1024]
+
+
+def script_path(script):
+    return os.path.normpath(os.path.join(DATA_DIR, os.pardir, script))
+
+
+def failure_files(directory, prefix):
+    from results import open_results
+    results = open_results(directory)
+    return results, [filename for filename in results.listdir() if filename.startswith(prefix)]
+
+
+def streaming_cdf_latencies(module, directory):
+    results, filenames = failure_files(directory, 'failure-latency-')
+    for filename in filenames:
+        module.parse_latencies(results, filename)
+
+
+def streaming_recovery_latencies(module, directory):
+    results, filenames = failure_files(directory, 'failure-latency-')
+    for filename in filenames:
+        module.parse_latencies(results, filename, False, 0)
+
+
+def streaming_recovery_sketch_latencies(module, directory):
+    results, filenames = failure_files(directory, 'failure-latency-')
+    for filename in filenames:
+        module.sketch_latencies(results, filename, False, 0, 0.01)
+
+
+def streaming_recovery_throughputs(module, directory):
+    results, filenames = failure_files(directory, 'failure-throughput-')
+    for filename in filenames:
+        module.parse_throughputs(results, filename, False, 0)
+
+
+def microbenchmark_latencies(module, directory):
+    module.parse_latencies(module.latency_catalog(directory))
+
+
+def microbenchmark_lineage(module, directory):
+    module.parse_lineage(module.lineage_catalog(directory))
+
+
+def allreduce_lineage_stash(module, directory):
+    module.parse_lineage_stash(directory, {})
+
+
+def allreduce_mpi(module, directory):
+    module.parse_mpi(directory, {})
+
+
+def allreduce_recovery_lineage_stash(module, directory):
+    module.parse_lineage_stash(directory)
+
+
+def allreduce_recovery_mpi(module, directory):
+    module.parse_mpi(directory)
+
+
+def mpi_group_stats(module, directory):
+    module.main([os.path.join(directory, 'mpi-results-pernode.txt')], synthetic.ALLREDUCE_SIZES, False)
+
+
+# Map from benchmark name to (dataset, prefix of the files it reads, number
+# of passes over them, script, function). The function is called with the
+# script's module and the dataset's directory. Records are counted as the
+# lines in the files, even if the parser stops early, as plot_recovery.py
+# does after the first sink.
+BENCHMARKS = OrderedDict([
+    ('streaming.cdf.parse_latencies',
+     ('streaming', 'failure-latency-', 1, 'data/streaming/plot_latency_cdf.py', streaming_cdf_latencies)),
+    ('streaming.recovery.parse_latencies',
+     ('streaming', 'failure-latency-', 1, 'data/streaming/plot_recovery.py', streaming_recovery_latencies)),
+    ('streaming.recovery.sketch_latencies',
+     ('streaming', 'failure-latency-', 1, 'data/streaming/plot_recovery.py', streaming_recovery_sketch_latencies)),
+    ('streaming.recovery.parse_throughputs',
+     ('streaming', 'failure-throughput-', 1, 'data/streaming/plot_recovery.py', streaming_recovery_throughputs)),
+    ('microbenchmark.parse_latencies',
+     ('microbenchmark-latency', 'latency-', 1, 'data/microbenchmark/plot_latency_cdf.py', microbenchmark_latencies)),
+    ('microbenchmark.parse_lineage',
+     ('microbenchmark-lineage', 'lineage-', 1, 'data/microbenchmark/plot_uncommitted_lineage.py', microbenchmark_lineage)),
+    ('allreduce.parse_lineage_stash',
+     ('allreduce', 'latency-', 1, 'data/allreduce/plot_allreduce_latency.py', allreduce_lineage_stash)),
+    ('allreduce.parse_mpi',
+     ('allreduce', 'mpi-latency-', 1, 'data/allreduce/plot_allreduce_latency.py', allreduce_mpi)),
+    ('allreduce.recovery.parse_lineage_stash',
+     ('allreduce', 'failure-latency-', 1, 'data/allreduce/plot_allreduce_recovery.py', allreduce_recovery_lineage_stash)),
+    ('allreduce.recovery.parse_mpi',
+     ('allreduce', 'failure-mpi-latency-', 1, 'data/allreduce/plot_allreduce_recovery.py', allreduce_recovery_mpi)),
+    ('gen_stats.group_stats',
+     ('mpi', 'mpi-results-pernode', 1, 'mpi-bench/gen_stats.py', mpi_group_stats)),
+])
+
+
+def generate(directory, num_workers, jobs):
+    # Write the datasets for one cluster size, unless they already exist.
+    marker = os.path.join(directory, '.complete')
+    if os.path.exists(marker):
+        return
+    synthetic.generate(directory, num_workers, jobs=jobs, rate=10)
+    open(marker, 'w').close()
+
+
+def count_records(directory, prefix):
+    records = 0
+    for filename in os.listdir(directory):
+        if filename.startswith(prefix):
+            with open(os.path.join(directory, filename), 'rb') as f:
+                records += sum(chunk.count(b'\n') for chunk in iter(lambda: f.read(1 << 20), b''))
+    return records
+
+
+def run_one(name, directory, repeat):
+    # Runs in the benchmark's own process. Prints the best time and the peak
+    # RSS as JSON.
+    from render import load_script
+    _, _, _, script, benchmark = BENCHMARKS[name]
+    # Import the script before starting the clock.
+    module = load_script(script_path(script))
+    seconds = []
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        for _ in range(repeat):
+            start = time.perf_counter()
+            benchmark(module, directory)
+            seconds.append(time.perf_counter() - start)
+    print(json.dumps({'seconds': min(seconds), 'peak_rss_mb': profiling.peak_rss_mb()}))
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=DATA_DIR,
+                                       stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def load_results(filename):
+    with open(filename) as f:
+        results = json.load(f)['results']
+    return dict(((result['benchmark'], result['workers']), result) for result in results)
+
+
+def main(names, workers, repeat, benchmark_dir, results_dir, compare, jobs):
+    previous = load_results(compare) if compare is not None else {}
+    results = []
+    print("{:40} {:>7} {:>10} {:>9} {:>12} {:>9} {:>8}".format(
+        'benchmark', 'workers', 'records', 'seconds', 'records/s', 'RSS (MB)', 'change'))
+    for num_workers in workers:
+        directory = os.path.join(benchmark_dir, '{}-workers'.format(num_workers))
+        generate(directory, num_workers, jobs)
+        for name in names:
+            dataset, prefix, passes, _, _ = BENCHMARKS[name]
+            dataset_dir = os.path.join(directory, dataset)
+            output = subprocess.check_output([
+                sys.executable, os.path.abspath(__file__), '--run', name, dataset_dir,
+                '--repeat', str(repeat)])
+            result = json.loads(output.decode().strip().split('\n')[-1])
+            result['benchmark'] = name
+            result['workers'] = num_workers
+            result['records'] = passes * count_records(dataset_dir, prefix)
+            result['records_per_second'] = result['records'] / result['seconds']
+            results.append(result)
+
+            change = ''
+            if (name, num_workers) in previous:
+                change = '{:+.1%}'.format(result['seconds'] / previous[(name, num_workers)]['seconds'] - 1)
+            print("{:40} {:>7} {:>10} {:>9.3f} {:>12.0f} {:>9.1f} {:>8}".format(
+                name, num_workers, result['records'], result['seconds'],
+                result['records_per_second'], result['peak_rss_mb'], change))
+
+    if not os.path.isdir(results_dir):
+        os.makedirs(results_dir)
+    now = datetime.datetime.now()
+    commit = git_commit()
+    filename = os.path.join(results_dir, '{}-{}.json'.format(
+        now.strftime('%y-%m-%d-%H-%M-%S'), commit or 'unknown'))
+    with open(filename, 'w') as f:
+        json.dump({
+            'date': now.isoformat(),
+            'commit': commit,
+            'python': sys.version.split()[0],
+            'results': results,
+        }, f, indent=2)
+    print("Saved results to", filename)
+
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(description='Benchmark the parsers.')
+    parser.add_argument(
+            '--benchmarks',
+            type=str,
+            nargs='+',
+            default=list(BENCHMARKS),
+            choices=list(BENCHMARKS),
+            help="Benchmarks to run.")
+    parser.add_argument(
+            '--workers',
+            type=int,
+            nargs='+',
+            default=WORKERS,
+            help="Cluster sizes to generate synthetic results for.")
+    parser.add_argument(
+            '--repeat',
+            type=int,
+            default=3,
+            help="Number of times to run each benchmark. The best time is reported.")
+    parser.add_argument(
+            '--benchmark-dir',
+            type=str,
+            default=BENCHMARK_DIR,
+            help="Directory to write the synthetic results to.")
+    parser.add_argument(
+            '--results-dir',
+            type=str,
+            default=RESULTS_DIR,
+            help="Directory to save the benchmark results in.")
+    parser.add_argument(
+            '--jobs',
+            type=int,
+            default=os.cpu_count(),
+            help="Number of processes to generate the synthetic results with.")
+    parser.add_argument(
+            '--compare',
+            type=str,
+            default=None,
+            help="Earlier results file to compare the times against.")
+    parser.add_argument(
+            '--run',
+            type=str,
+            nargs=2,
+            default=None,
+            metavar=('BENCHMARK', 'DIRECTORY'),
+            help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run is not None:
+        run_one(args.run[0], args.run[1], args.repeat)
+    else:
+        main(args.benchmarks, args.workers, args.repeat, args.benchmark_dir,
+             args.results_dir, args.compare, args.jobs)
@@ -0,0 +1,220 @@
+# On-disk cache of parsed result files. Parsers that return a dict of NumPy
+# columns can be wrapped with @columns(name, version). Entries are keyed by the
+# file's location, size and mtime plus the parser name, version and arguments,
+# and stored as one .npy file per column so that repeat runs memory-map them
+# instead of re-parsing. Bump a parser's version whenever its output changes.
+#
+# The cache is disabled unless configure() is called, which the plot scripts
+# do from the command line. Run this file with --clear to empty it. When one
+# process makes several plots, as analyze.py does, configure(memory=True)
+# also keeps parsed files in memory, up to memory_mb, so that each is parsed
+# or loaded once.
+import functools
+import hashlib
+import os
+import shutil
+from collections import OrderedDict
+import numpy as np
+
+CACHE_DIR = os.environ.get(
+    'LINEAGE_STASH_CACHE_DIR',
+    os.path.join(os.path.expanduser('~'), '.cache', 'lineage-stash-artifact'))
+MAX_CACHE_MB = 1024
+MAX_MEMORY_MB = 1024
+
+_cache = None
+
+
+def entry_key(name, version, results, filename, args):
+    size, mtime = results.stat(filename)
+    key = repr((name, version, os.path.abspath(results.path), filename,
+                size, mtime, args))
+    return hashlib.sha1(key.encode()).hexdigest()
+
+
+class ParseCache(object):
+    def __init__(self, directory=CACHE_DIR, max_bytes=MAX_CACHE_MB * 1024 * 1024):
+        self.directory = directory
+        self.max_bytes = max_bytes
+
+    def key(self, name, version, results, filename, args):
+        return entry_key(name, version, results, filename, args)
+
+    def get(self, key):
+        entry = os.path.join(self.directory, key)
+        if not os.path.isdir(entry):
+            return None
+        columns = {}
+        for column_filename in os.listdir(entry):
+            column = column_filename[:-len('.npy')]
+            columns[column] = np.load(os.path.join(entry, column_filename), mmap_mode='r')
+        # Mark the entry as recently used.
+        os.utime(entry, None)
+        return columns
+
+    def put(self, key, columns):
+        entry = os.path.join(self.directory, key)
+        # Write to a temporary directory first so that readers never see a
+        # partially written entry.
+        tmp = os.path.join(self.directory, 'tmp-{}-{}'.format(os.getpid(), key))
+        os.makedirs(tmp)
+        for column, values in columns.items():
+            np.save(os.path.join(tmp, column + '.npy'), np.asarray(values))
+        try:
+            os.rename(tmp, entry)
+        except OSError:
+            # Another process already cached this file.
+            shutil.rmtree(tmp)
+        self.evict()
+
+    def entries(self):
+        # Return (last used, size in bytes, path) for each entry.
+        entries = []
+        for key in os.listdir(self.directory):
+            if key.startswith('tmp-'):
+                continue
+            entry = os.path.join(self.directory, key)
+            size = sum(os.path.getsize(os.path.join(entry, f)) for f in os.listdir(entry))
+            entries.append((os.path.getmtime(entry), size, entry))
+        return entries
+
+    def evict(self):
+        # Remove the least recently used entries until we are under the cap.
+        entries = sorted(self.entries())
+        total = sum(size for _, size, _ in entries)
+        for _, size, entry in entries:
+            if total <= self.max_bytes:
+                break
+            shutil.rmtree(entry, ignore_errors=True)
+            total -= size
+
+    def clear(self):
+        if os.path.isdir(self.directory):
+            shutil.rmtree(self.directory)
+
+
+def columns_size(columns):
+    return sum(np.asarray(values).nbytes for values in columns.values())
+
+
+class MemoryCache(object):
+    # Keeps parsed files in memory for the life of the process, in front of
+    # the cache on disk if there is one. Least recently used entries are
+    # dropped once they add up to more than max_bytes.
+    def __init__(self, disk=None, max_bytes=MAX_MEMORY_MB * 1024 * 1024):
+        self.disk = disk
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.sizes = {}
+        self.total = 0
+
+    def key(self, name, version, results, filename, args):
+        return entry_key(name, version, results, filename, args)
+
+    def get(self, key):
+        if key in self.entries:
+            self.entries.move_to_end(key)
+            return self.entries[key]
+        if self.disk is not None:
+            cached = self.disk.get(key)
+            if cached is not None:
+                self.add(key, cached)
+            return cached
+        return None
+
+    def put(self, key, columns):
+        self.add(key, columns)
+        if self.disk is not None:
+            self.disk.put(key, columns)
+
+    def add(self, key, columns):
+        if key in self.entries:
+            self.total -= self.sizes.pop(key)
+            del self.entries[key]
+        self.entries[key] = columns
+        self.sizes[key] = columns_size(columns)
+        self.total += self.sizes[key]
+        self.evict()
+
+    def evict(self):
+        # Keep the entry that was just added, even if it is over the cap on
+        # its own.
+        while self.total > self.max_bytes and len(self.entries) > 1:
+            key, _ = self.entries.popitem(last=False)
+            self.total -= self.sizes.pop(key)
+
+
+def configure(cache_dir=CACHE_DIR, max_mb=MAX_CACHE_MB, memory=False, memory_mb=MAX_MEMORY_MB):
+    global _cache
+    if cache_dir is None:
+        _cache = None
+    else:
+        if not os.path.isdir(cache_dir):
+            os.makedirs(cache_dir)
+        _cache = ParseCache(cache_dir, max_mb * 1024 * 1024)
+    if memory:
+        _cache = MemoryCache(_cache, memory_mb * 1024 * 1024)
+
+
+def add_arguments(parser):
+    parser.add_argument(
+            '--cache-dir',
+            type=str,
+            default=CACHE_DIR,
+            help="Directory to cache parsed result files in.")
+    parser.add_argument(
+            '--cache-size-mb',
+            type=int,
+            default=MAX_CACHE_MB,
+            help="Maximum size of the cache. Least recently used entries are evicted first.")
+    parser.add_argument(
+            '--no-cache',
+            action='store_true',
+            help="Always parse the result files from scratch.")
+
+
+def configure_from_args(args):
+    if args.no_cache:
+        configure(None)
+    else:
+        configure(args.cache_dir, args.cache_size_mb)
+
+
+def columns(name, version):
+    # Decorator for parse(results, filename, *args) -> {column: array}.
+    def decorator(parse):
+        @functools.wraps(parse)
+        def wrapper(results, filename, *args):
+            if _cache is None:
+                return parse(results, filename, *args)
+            key = _cache.key(name, version, results, filename, args)
+            cached = _cache.get(key)
+            if cached is not None:
+                return cached
+            parsed = parse(results, filename, *args)
+            _cache.put(key, parsed)
+            return parsed
+        return wrapper
+    return decorator
+
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(description='Manage the parsed results cache.')
+    parser.add_argument(
+            '--cache-dir',
+            type=str,
+            default=CACHE_DIR)
+    parser.add_argument(
+            '--clear',
+            action='store_true',
+            help="Remove all cached entries.")
+    args = parser.parse_args()
+
+    cache = ParseCache(args.cache_dir)
+    if args.clear:
+        cache.clear()
+    elif os.path.isdir(args.cache_dir):
+        entries = cache.entries()
+        print("{} entries, {:.1f} MB in {}".format(
+            len(entries), sum(size for _, size, _ in entries) / 1e6, args.cache_dir))
@@ -0,0 +1,73 @@
+# Index of the result files in a directory or archive. Result filenames
+# encode the experiment's configuration as a series of <value>-<field>-
+# pairs after a prefix, e.g.
+#   latency-64-workers-1-shards-0-gcs-5-gcsdelay-...-failures-<date>.csv
+# A Catalog lists the results once, parses each name into a Label namedtuple
+# and indexes the files by the value of each field, so that queries such as
+#   catalog.select(gcs=0, gcsdelay=[0, 1, 5], failures=8)
+# never have to rescan the listing or open any files.
+import re
+from collections import OrderedDict
+from collections import defaultdict
+
+
+def label_regex(prefix, fields):
+    regex = prefix
+    for field in fields:
+        regex += '(?P<{field}>.*)-{field}-'.format(field=field)
+    return regex
+
+
+class Catalog(object):
+    def __init__(self, results, prefix, label_type):
+        self.results = results
+        self.label_type = label_type
+        self.regex = label_regex(prefix, label_type._fields)
+        # Map from filename to Label, in listing order.
+        self._labels = OrderedDict()
+        # Map from field to value to the filenames with that value.
+        self._index = dict((field, defaultdict(set)) for field in label_type._fields)
+        for filename in results.listdir():
+            g = re.match(self.regex, filename)
+            if g is None:
+                continue
+            fields = g.groupdict()
+            for field, val in fields.items():
+                fields[field] = int(val)
+            self._add(filename, label_type(**fields))
+
+    def _add(self, filename, label):
+        self._labels[filename] = label
+        for field, val in label._asdict().items():
+            self._index[field][val].add(filename)
+
+    def __len__(self):
+        return len(self._labels)
+
+    def __contains__(self, filename):
+        return filename in self._labels
+
+    def label(self, filename):
+        return self._labels[filename]
+
+    def select(self, **query):
+        # Return (filename, label) for each file matching the query, in
+        # listing order. Each keyword is a field and either a single value or
+        # a collection of accepted values.
+        matches = None
+        for field, values in query.items():
+            if not isinstance(values, (list, tuple, set, frozenset)):
+                values = [values]
+            filenames = set()
+            for val in values:
+                filenames.update(self._index[field].get(val, ()))
+            if matches is None:
+                matches = filenames
+            else:
+                matches &= filenames
+        return [(filename, label) for filename, label in self._labels.items()
+                if matches is None or filename in matches]
+
+    def values(self, field):
+        # The distinct values of a field, sorted.
+        return sorted(val for val, filenames in self._index[field].items() if filenames)
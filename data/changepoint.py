@@ -0,0 +1,112 @@
+# Change-point detection for the recovery plots, to find when a failure
+# started and when the system recovered without tuning offsets by hand.
+#
+# A run's throughput or iteration times are modelled as piecewise constant:
+# a normal level, then a failure block at a different level, then the normal
+# level again (an "epidemic" change-point). The block that best explains the
+# series, in the least-squares sense, is found by scoring every candidate
+# (start, end) at once from prefix sums. Latencies and iteration times can be
+# fit on a log scale, where a spike is a change in level rather than in a
+# few outliers. A block is only reported if its mean differs from the rest
+# of the series by at least `min_change`, in relative terms, so a run without
+# a failure is not given one.
+import numpy as np
+
+MIN_CHANGE = 0.25
+
+# Number of candidate starts to score at a time, to bound the memory used on
+# long series.
+BLOCK_ROWS = 256
+
+
+def _prefix_sums(values):
+    return (np.concatenate([[0], np.cumsum(values)]),
+            np.concatenate([[0], np.cumsum(values * values)]))
+
+
+def _sse(count, total, squares):
+    # Sum of squared deviations from the mean of each segment.
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return squares - np.where(count > 0, total * total / count, 0)
+
+
+def _differs(inside, outside, min_change):
+    return abs(inside - outside) >= min_change * abs(outside)
+
+
+def _fit_values(values, log):
+    if log:
+        # Latencies can be slightly negative from clock skew.
+        return np.log(np.maximum(values, 1e-9))
+    return values
+
+
+def failure_block(values, min_change=MIN_CHANGE, log=False):
+    # Returns (start, end) such that values[start:end] is the failure block,
+    # or None if there is none.
+    values = np.asarray(values, dtype=np.float64)
+    n = len(values)
+    if n < 3:
+        return None
+    sums, squares = _prefix_sums(_fit_values(values, log))
+    ends = np.arange(1, n + 1)
+    best = (np.inf, None)
+    for first in range(0, n, BLOCK_ROWS):
+        starts = np.arange(first, min(first + BLOCK_ROWS, n))[:, None]
+        inside = ends - starts
+        inside_sum = sums[ends] - sums[starts]
+        inside_squares = squares[ends] - squares[starts]
+        cost = (_sse(inside, inside_sum, inside_squares) +
+                _sse(n - inside, sums[n] - inside_sum, squares[n] - inside_squares))
+        # The block must be non-empty and leave some of the series outside it.
+        cost[(inside <= 0) | (inside >= n)] = np.inf
+        i, j = np.unravel_index(np.argmin(cost), cost.shape)
+        if cost[i, j] < best[0]:
+            best = (cost[i, j], (first + i, j + 1))
+    if best[1] is None:
+        return None
+
+    start, end = best[1]
+    outside = np.concatenate([values[:start], values[end:]])
+    if not _differs(values[start:end].mean(), outside.mean(), min_change):
+        return None
+    return start, end
+
+
+def level_shift(values, min_change=MIN_CHANGE, log=False):
+    # Returns the index at which the series settles at a new level, or None
+    # if there is no such shift. Used to find when a system recovered,
+    # starting from the failure.
+    values = np.asarray(values, dtype=np.float64)
+    n = len(values)
+    if n < 2:
+        return None
+    sums, squares = _prefix_sums(_fit_values(values, log))
+    splits = np.arange(1, n)
+    cost = (_sse(splits, sums[splits], squares[splits]) +
+            _sse(n - splits, sums[n] - sums[splits], squares[n] - squares[splits]))
+    split = splits[np.argmin(cost)]
+    if not _differs(values[:split].mean(), values[split:].mean(), min_change):
+        return None
+    return split
+
+
+def settled(values, start, min_change=MIN_CHANGE):
+    # Returns the first index from start on at which the series is within
+    # min_change of the level that it settles at, the median of
+    # values[start:]. A backlog drains gradually, so the best split found by
+    # level_shift can still be in the middle of the ramp down.
+    values = np.asarray(values, dtype=np.float64)
+    level = np.median(values[start:])
+    within = np.flatnonzero(values[start:] <= (1 + min_change) * level)
+    return start + within[0] if len(within) else None
+
+
+def align(onsets, reference):
+    # The offset to add to each series' x values so that its failure lines up
+    # with the reference series'. Series without a detected failure are not
+    # moved.
+    if onsets.get(reference) is None:
+        return dict((key, 0) for key in onsets)
+    return dict((key, 0 if onset is None else onsets[reference] - onset)
+                for key, onset in onsets.items())
@@ -0,0 +1,222 @@
+# Compare the summary CSV of a new run against a baseline, such as the ones
+# checked in next to the plot scripts, and flag regressions:
+#   python compare.py allreduce/64-workers.csv <new run>.csv
+#   python compare.py microbenchmark/latency-64-workers.csv <new run>.csv
+# Rows are matched on the label fields that both CSVs have (every column
+# that is not a statistic), in a single join over the whole sweep. A metric
+# regressed if it got worse by at least --threshold, in relative terms, and
+# the change is significant:
+#   - if either CSV has a bootstrap confidence interval for the metric
+#     (<metric>_low, <metric>_high), the new interval must lie entirely on
+#     the worse side of the baseline's interval or value;
+#   - otherwise, for means with a stddev and a count in both CSVs, a
+#     one-sided Welch test must reject at --alpha;
+#   - otherwise, the change cannot be tested, and it is reported separately
+#     as UNTESTED instead of as a regression.
+# A baseline without a count column, such as one from an older run, can be
+# given one with --count. Latencies are better when lower, throughputs when
+# higher. Exits with status 1 if anything regressed, so that it can gate a
+# release.
+import math
+import sys
+import numpy as np
+import pandas as pd
+
+METRICS = ['mean', 'p50', 'p90', 'p95', 'p99', 'throughput']
+# Columns that describe a statistic rather than label a row.
+STAT_COLUMNS = ['stddev', 'count']
+THRESHOLD = 0.1
+ALPHA = 0.05
+
+_normal_sf = np.vectorize(lambda z: 0.5 * math.erfc(z / math.sqrt(2)), otypes=[np.float64])
+
+
+def higher_is_better(metric):
+    return 'throughput' in metric
+
+
+def is_stat(column):
+    return (column in METRICS or column in STAT_COLUMNS or
+            column.endswith('_low') or column.endswith('_high'))
+
+
+def label_fields(baseline, new):
+    return [column for column in baseline.columns
+            if column in new.columns and not is_stat(column)]
+
+
+def join(baseline, new, fields):
+    # Rows that were plotted more than once are written more than once, so
+    # keep one of each.
+    baseline = baseline.drop_duplicates(subset=fields)
+    new = new.drop_duplicates(subset=fields)
+    # Suffix every statistic, including ones that only one side has.
+    baseline = baseline.rename(columns=lambda c: c if c in fields else c + '_baseline')
+    new = new.rename(columns=lambda c: c if c in fields else c + '_new')
+    return baseline.merge(new, on=fields, how='outer', indicator=True)
+
+
+def _column(joined, name, suffix):
+    name = '{}_{}'.format(name, suffix)
+    if name in joined:
+        return joined[name].values.astype(np.float64)
+    return np.full(len(joined), np.nan)
+
+
+def welch_p_value(mean, baseline_mean, stddev, baseline_stddev, count, baseline_count):
+    # One-sided p-value that the new mean is not above the baseline's. Uses
+    # the normal approximation to the t distribution, which is close for the
+    # 20 or more samples behind each row.
+    with np.errstate(divide='ignore', invalid='ignore'):
+        error = np.sqrt(stddev ** 2 / count + baseline_stddev ** 2 / baseline_count)
+        z = (mean - baseline_mean) / error
+    return _normal_sf(z)
+
+
+def compare_metric(joined, metric, threshold=THRESHOLD, alpha=ALPHA):
+    # Returns a frame with one row per joined row, for one metric.
+    baseline = _column(joined, metric, 'baseline')
+    new = _column(joined, metric, 'new')
+    # Flip the sign of metrics that are better when higher, so that an
+    # increase is always worse.
+    sign = -1 if higher_is_better(metric) else 1
+    with np.errstate(divide='ignore', invalid='ignore'):
+        change = (new - baseline) / np.abs(baseline)
+
+    # Bound the values from the side that would show a regression. Without an
+    # interval, the bound is the value itself.
+    new_low = _column(joined, metric + '_low', 'new')
+    new_high = _column(joined, metric + '_high', 'new')
+    baseline_low = _column(joined, metric + '_low', 'baseline')
+    baseline_high = _column(joined, metric + '_high', 'baseline')
+    if sign < 0:
+        new_low, new_high = -new_high, -new_low
+        baseline_low, baseline_high = -baseline_high, -baseline_low
+    has_interval = ~np.isnan(new_low) | ~np.isnan(baseline_high)
+    new_bound = np.where(np.isnan(new_low), sign * new, new_low)
+    baseline_bound = np.where(np.isnan(baseline_high), sign * baseline, baseline_high)
+    outside = new_bound > baseline_bound
+
+    p_value = np.full(len(joined), np.nan)
+    if metric == 'mean':
+        p_value = welch_p_value(
+            sign * new, sign * baseline,
+            _column(joined, 'stddev', 'new'), _column(joined, 'stddev', 'baseline'),
+            _column(joined, 'count', 'new'), _column(joined, 'count', 'baseline'))
+    has_test = ~has_interval & ~np.isnan(p_value)
+
+    test = np.where(has_interval, 'interval', np.where(has_test, 'welch', 'none'))
+    significant = np.where(has_interval, outside, np.where(has_test, p_value < alpha, False))
+    worse = sign * change >= threshold
+    return pd.DataFrame({
+        'metric': metric,
+        'baseline': baseline,
+        'new': new,
+        'change': change,
+        'test': test,
+        'p_value': p_value,
+        'regression': worse & significant,
+        'untested': worse & (test == 'none'),
+    }, index=joined.index)
+
+
+def compare(baseline, new, metrics=None, threshold=THRESHOLD, alpha=ALPHA):
+    # Returns the label fields and a frame with one row per matched row and
+    # metric, along with the rows that are only in one of the CSVs.
+    fields = label_fields(baseline, new)
+    assert fields, "No label fields in common"
+    if metrics is None:
+        metrics = [metric for metric in METRICS
+                   if metric in baseline.columns and metric in new.columns]
+    joined = join(baseline, new, fields)
+    matched = joined[joined['_merge'] == 'both'].reset_index(drop=True)
+    unmatched = joined[joined['_merge'] != 'both'][fields + ['_merge']]
+
+    comparisons = []
+    for metric in metrics:
+        comparison = compare_metric(matched, metric, threshold, alpha)
+        comparisons.append(pd.concat([matched[fields], comparison], axis=1))
+    return fields, pd.concat(comparisons, ignore_index=True), unmatched
+
+
+def fill_count(summary, count):
+    # Rows of a summary CSV without a count column were each over count
+    # samples.
+    if count is not None and 'count' not in summary.columns:
+        summary = summary.assign(count=count)
+    return summary
+
+
+def main(baseline_filename, new_filename, metrics=None, threshold=THRESHOLD, alpha=ALPHA,
+         csv_filename=None, count=None):
+    baseline = fill_count(pd.read_csv(baseline_filename), count)
+    new = fill_count(pd.read_csv(new_filename), count)
+    fields, comparisons, unmatched = compare(baseline, new, metrics, threshold, alpha)
+
+    for _, row in unmatched.iterrows():
+        where = 'baseline' if row['_merge'] == 'left_only' else 'new run'
+        print("WARNING: only in the {}: {}".format(
+            where, ', '.join('{}={}'.format(field, row[field]) for field in fields)))
+    regressions = comparisons[comparisons['regression']]
+    for _, row in regressions.iterrows():
+        print("REGRESSION {} {}: {:.4g} -> {:.4g} ({:+.1%}, test: {})".format(
+            ', '.join('{}={}'.format(field, row[field]) for field in fields),
+            row['metric'], row['baseline'], row['new'], row['change'], row['test']))
+    untested = comparisons[comparisons['untested']]
+    for _, row in untested.iterrows():
+        print("UNTESTED {} {}: {:.4g} -> {:.4g} ({:+.1%}, no interval or count to test it)".format(
+            ', '.join('{}={}'.format(field, row[field]) for field in fields),
+            row['metric'], row['baseline'], row['new'], row['change']))
+    print("{} of {} comparisons regressed by at least {:.0%}".format(
+        len(regressions), len(comparisons), threshold))
+    if len(untested):
+        print("{} more got worse by at least {:.0%} but could not be tested".format(
+            len(untested), threshold))
+
+    if csv_filename is not None:
+        comparisons.to_csv(csv_filename, index=False)
+    return regressions
+
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(description='Compare a summary CSV against a baseline.')
+    parser.add_argument(
+            'baseline',
+            type=str,
+            help="Summary CSV to compare against.")
+    parser.add_argument(
+            'new',
+            type=str,
+            help="Summary CSV of the new run.")
+    parser.add_argument(
+            '--metrics',
+            type=str,
+            nargs='*',
+            default=None,
+            help="Metrics to compare. By default, all of {} that both CSVs have.".format(', '.join(METRICS)))
+    parser.add_argument(
+            '--threshold',
+            type=float,
+            default=THRESHOLD,
+            help="Smallest relative change that counts as a regression.")
+    parser.add_argument(
+            '--alpha',
+            type=float,
+            default=ALPHA,
+            help="Significance level of the Welch test.")
+    parser.add_argument(
+            '--csv-filename',
+            type=str,
+            default=None,
+            help="Also write every comparison to this CSV.")
+    parser.add_argument(
+            '--count',
+            type=int,
+            default=None,
+            help="Number of samples behind each row of a CSV that has no count column.")
+    args = parser.parse_args()
+
+    regressions = main(args.baseline, args.new, args.metrics, args.threshold, args.alpha,
+                       args.csv_filename, args.count)
+    sys.exit(1 if len(regressions) else 0)
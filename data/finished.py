@@ -0,0 +1,52 @@
+# Readers for the "Finished in <seconds>" line that the Ray allreduce
+# benchmark logs after each iteration. Both take a bytes-like buffer, such as
+# the memory map returned by results.buffer(filename), and return the same
+# times as reading the log line by line, keeping the lines that contain
+# "Finished" and parsing the last word of each.
+import numpy as np
+
+FINISHED = b'Finished'
+
+
+def last_finished_times(buf, n):
+    # The times of the last n iterations. Scans backwards from the end of the
+    # log, so only its tail is ever read.
+    times = []
+    end = len(buf)
+    while len(times) < n:
+        i = buf.rfind(FINISHED, 0, end)
+        if i < 0:
+            break
+        line_start = buf.rfind(b'\n', 0, i) + 1
+        line_end = buf.find(b'\n', i)
+        if line_end < 0:
+            line_end = len(buf)
+        times.append(float(buf[line_start:line_end].split(b' ')[-1]))
+        end = line_start
+    times.reverse()
+    return np.array(times, dtype=np.float64)
+
+
+def finished_times(buf):
+    # The times of all iterations, found with one vectorized search over the
+    # bytes of the log instead of splitting it into lines.
+    data = np.frombuffer(buf, dtype=np.uint8)
+    pattern = np.frombuffer(FINISHED, dtype=np.uint8)
+    if len(data) < len(pattern):
+        return np.array([], dtype=np.float64)
+    # Narrow down the positions where each successive byte of the pattern
+    # matches.
+    matches = np.flatnonzero(data[:len(data) - len(pattern) + 1] == pattern[0])
+    for i in range(1, len(pattern)):
+        matches = matches[data[matches + i] == pattern[i]]
+
+    # The end of each line with a match, counting each line once.
+    newlines = np.flatnonzero(data == ord('\n'))
+    line_ends = np.unique(np.append(newlines, len(data))[np.searchsorted(newlines, matches)])
+    line_starts = np.append(-1, newlines)[np.searchsorted(newlines, line_ends)] + 1
+    # The last word starts after the line's last space.
+    spaces = np.flatnonzero(data == ord(' '))
+    last_spaces = np.append(-1, spaces)[np.searchsorted(spaces, line_ends)]
+    word_starts = np.maximum(last_spaces + 1, line_starts)
+    return np.array([float(buf[start:end]) for start, end in zip(word_starts, line_ends)],
+                    dtype=np.float64)
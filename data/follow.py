@@ -0,0 +1,335 @@
+# Follow mode for logs of experiments that are still running. Each follower
+# remembers how far into its file it has read, parses only the bytes that were
+# appended since the last refresh and folds them into running aggregates, so a
+# refresh costs time proportional to the new data rather than to the file.
+# Latencies are kept in one sketch per second (see sketch.py), and only the
+# seconds of throughput that changed are recomputed. If a file is truncated or
+# replaced, its follower starts over from the header with empty aggregates.
+#
+# The streaming followers read the CSVs written by collect_latencies, with the
+# same rules as plot_recovery.py: latencies are taken from the first sink only,
+# records older than the newest one seen so far are skipped, and times are
+# seconds since the sink's first record. The allreduce follower reads the
+# "Finished" iteration times from a Ray worker log.
+import collections
+import io
+import os
+import time
+import numpy as np
+import pandas as pd
+
+from sketch import LatencySketch
+
+
+class Tail(object):
+    # Reads the complete lines appended to a file since the last call.
+    def __init__(self, path):
+        self.path = path
+        self.offset = 0
+        self._inode = None
+        self._partial = b''
+        # Whether the last read started over from the beginning of the file,
+        # so that what was read before it no longer applies.
+        self.restarted = False
+
+    def read(self):
+        self.restarted = False
+        try:
+            st = os.stat(self.path)
+        except OSError:
+            # The run has not created the file yet.
+            return b''
+        size = st.st_size
+        if size < self.offset or (self._inode is not None and st.st_ino != self._inode):
+            # The file was truncated or replaced, so start over.
+            self.offset = 0
+            self._partial = b''
+            self.restarted = True
+        self._inode = st.st_ino
+        if size == self.offset:
+            return b''
+        with open(self.path, 'rb') as f:
+            f.seek(self.offset)
+            data = f.read(size - self.offset)
+        self.offset += len(data)
+        # Hold back a trailing line that has not been completely written yet.
+        data = self._partial + data
+        end = data.rfind(b'\n') + 1
+        self._partial = data[end:]
+        return data[:end]
+
+
+class CSVFollower(object):
+    def __init__(self, path, columns):
+        self.tail = Tail(path)
+        self.columns = columns
+        self.reset()
+
+    def reset(self):
+        # Forget everything read so far. Subclasses also clear their
+        # aggregates.
+        self.header = None
+        self.in_seconds = None
+        self.num_records = 0
+
+    def read(self):
+        # Returns the new rows as a DataFrame, or None.
+        data = self.tail.read()
+        if self.tail.restarted:
+            self.reset()
+        if self.header is None:
+            if b'\n' not in data:
+                return None
+            header, data = data.split(b'\n', 1)
+            self.header = header.decode().strip().split(',')
+        if not data:
+            return None
+        if self.in_seconds is None:
+            # Ray logs fractional seconds, Flink logs integer milliseconds.
+            row = data.split(b'\n', 1)[0].decode().strip().split(',')
+            self.in_seconds = '.' in row[self.header.index('timestamp')]
+        rows = pd.read_csv(io.BytesIO(data),
+                           names=self.header,
+                           usecols=self.columns,
+                           dtype=dict((column, str if column == 'sink_id' else np.float64)
+                                      for column in self.columns),
+                           float_precision='round_trip')
+        self.num_records += len(rows)
+        return rows
+
+    def seconds(self, timestamps, first_timestamp):
+        seconds = timestamps - first_timestamp
+        if not self.in_seconds:
+            seconds /= 1000
+        return seconds.astype(np.int64)
+
+
+def newer_than_seen(timestamps, max_timestamp):
+    # Whether each record is newer than every record before it, starting from
+    # max_timestamp. Also returns the new max.
+    previous = np.empty(len(timestamps))
+    previous[0] = max_timestamp
+    np.maximum.accumulate(timestamps[:-1], out=previous[1:])
+    np.maximum(previous, max_timestamp, out=previous)
+    return timestamps > previous, max(max_timestamp, timestamps.max())
+
+
+class LatencyFollower(CSVFollower):
+    # Rolling percentiles over the latencies of the last `window` seconds.
+    def __init__(self, path, flink, window=10, error=0.01):
+        self.flink = flink
+        self.window = window
+        self.error = error
+        super(LatencyFollower, self).__init__(path, ['sink_id', 'timestamp', 'latency'])
+
+    def reset(self):
+        super(LatencyFollower, self).reset()
+        self.operator = None
+        self.first_timestamp = None
+        self.max_timestamp = None
+        self.done = False
+        # Map from second to a sketch of the latencies sent in that second,
+        # for the seconds in the window.
+        self.latencies = collections.OrderedDict()
+        self.count = 0
+        self.total = 0.0
+
+    def refresh(self):
+        rows = self.read()
+        if rows is None or self.done or len(rows) == 0:
+            return
+        if self.operator is None:
+            self.operator = rows['sink_id'].values[0]
+            self.first_timestamp = rows['timestamp'].values[0]
+            self.max_timestamp = self.first_timestamp
+        # Stop at the first record from another sink.
+        other = np.flatnonzero(rows['sink_id'].values != self.operator)
+        if len(other):
+            rows = rows.iloc[:other[0]]
+            self.done = True
+        if len(rows) == 0:
+            return
+
+        timestamps = rows['timestamp'].values
+        latencies = rows['latency'].values
+        if self.flink:
+            # Skip Flink records replayed during recovery.
+            newer, self.max_timestamp = newer_than_seen(timestamps, self.max_timestamp)
+            timestamps = timestamps[newer]
+            latencies = latencies[newer]
+        if self.in_seconds:
+            latencies = latencies * 1000
+        seconds = self.seconds(timestamps, self.first_timestamp)
+        self.count += len(latencies)
+        self.total += latencies.sum()
+
+        order = np.argsort(seconds, kind='stable')
+        new_seconds, starts = np.unique(seconds[order], return_index=True)
+        for second, group in zip(new_seconds.tolist(), np.split(latencies[order], starts[1:])):
+            if second not in self.latencies:
+                self.latencies[second] = LatencySketch(self.error)
+            self.latencies[second].add(group)
+        # Seconds can arrive out of order, so drop any that fell out of the
+        # window rather than only the oldest.
+        latest = max(self.latencies)
+        for second in [second for second in self.latencies if second <= latest - self.window]:
+            del self.latencies[second]
+
+    def percentile(self, q):
+        # Within the sketch's relative error. Costs time proportional to the
+        # window, not to the number of latencies in it.
+        if not self.latencies:
+            return np.nan
+        window = LatencySketch(self.error)
+        for second in self.latencies.values():
+            window.merge(second)
+        return window.percentile(q)
+
+    def mean(self):
+        return self.total / self.count if self.count else np.nan
+
+
+class ThroughputFollower(CSVFollower):
+    # Total throughput per second: the sum over sinks of the mean throughput
+    # that each sink reported in that second.
+    def __init__(self, path):
+        super(ThroughputFollower, self).__init__(path, ['sink_id', 'timestamp', 'cur_time', 'throughput'])
+
+    def reset(self):
+        super(ThroughputFollower, self).reset()
+        # Map from sink to (first cur_time, newest timestamp seen).
+        self.operators = {}
+        # Map from second to sink to [sum, count].
+        self.seconds_seen = collections.defaultdict(lambda: collections.defaultdict(lambda: [0.0, 0]))
+        # Map from second to its total throughput, and the seconds whose
+        # total changed since throughputs() was last called.
+        self.totals = {}
+        self.changed = set()
+
+    def refresh(self):
+        rows = self.read()
+        if rows is None or len(rows) == 0:
+            return
+        sink_ids = rows['sink_id'].values
+        updated = set()
+        for operator in pd.unique(sink_ids):
+            mine = sink_ids == operator
+            timestamps = rows['timestamp'].values[mine]
+            cur_times = rows['cur_time'].values[mine]
+            throughputs = rows['throughput'].values[mine]
+            if operator not in self.operators:
+                # The sink's first record sets its start time and is not
+                # counted, since it is not newer than itself.
+                self.operators[operator] = (cur_times[0], timestamps[0])
+            first_time, max_timestamp = self.operators[operator]
+            newer, max_timestamp = newer_than_seen(timestamps, max_timestamp)
+            self.operators[operator] = (first_time, max_timestamp)
+
+            seconds = self.seconds(cur_times[newer], first_time)
+            throughputs = throughputs[newer]
+            new_seconds, inverse = np.unique(seconds, return_inverse=True)
+            sums = np.bincount(inverse, throughputs)
+            counts = np.bincount(inverse)
+            for second, total, count in zip(new_seconds.tolist(), sums, counts):
+                point = self.seconds_seen[second][operator]
+                point[0] += total
+                point[1] += count
+            updated.update(new_seconds.tolist())
+        for second in updated:
+            self.totals[second] = sum(total / count for total, count in self.seconds_seen[second].values())
+        self.changed |= updated
+
+    def throughputs(self):
+        # Returns [(second, throughput)] for the seconds that changed since
+        # the last call, in order. See totals for every second.
+        changed = sorted(self.changed)
+        self.changed = set()
+        return [(second, self.totals[second]) for second in changed]
+
+
+class FinishedFollower(object):
+    # The time of each iteration, from the "Finished" lines of an allreduce log.
+    def __init__(self, path):
+        self.tail = Tail(path)
+        self.times = []
+
+    def refresh(self):
+        data = self.tail.read()
+        if self.tail.restarted:
+            self.times = []
+        for line in data.decode().split('\n'):
+            if "Finished" in line:
+                self.times.append(float(line.split(' ')[-1]))
+
+    def last(self, n):
+        return self.times[-n:]
+
+
+def main(latency_filename, throughput_filename, allreduce_filename, flink, window, interval, num_rounds):
+    followers = []
+    if latency_filename is not None:
+        followers.append(LatencyFollower(latency_filename, flink, window))
+    if throughput_filename is not None:
+        followers.append(ThroughputFollower(throughput_filename))
+    if allreduce_filename is not None:
+        followers.append(FinishedFollower(allreduce_filename))
+    assert followers, "Nothing to follow"
+
+    while True:
+        for follower in followers:
+            follower.refresh()
+            if isinstance(follower, LatencyFollower):
+                print("latency: {} records, mean={}, last {}s p50={} p90={} p99={}".format(
+                    follower.count, follower.mean(), window,
+                    follower.percentile(50), follower.percentile(90), follower.percentile(99)))
+            elif isinstance(follower, ThroughputFollower):
+                throughputs = follower.throughputs()
+                print("throughput: {} seconds changed, {}".format(len(throughputs), throughputs[-5:]))
+            else:
+                times = follower.last(num_rounds)
+                print("allreduce: {} iterations, last {} mean={}".format(
+                    len(follower.times), len(times), np.mean(times) if times else np.nan))
+        time.sleep(interval)
+
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(description='Follow the logs of a running experiment.')
+    parser.add_argument(
+            '--latency-filename',
+            type=str,
+            default=None,
+            help="Streaming latency CSV to follow.")
+    parser.add_argument(
+            '--throughput-filename',
+            type=str,
+            default=None,
+            help="Streaming throughput CSV to follow.")
+    parser.add_argument(
+            '--allreduce-filename',
+            type=str,
+            default=None,
+            help="Allreduce worker log to follow for \"Finished\" iteration times.")
+    parser.add_argument(
+            '--flink',
+            action='store_true',
+            help="The streaming logs are from Flink.")
+    parser.add_argument(
+            '--window',
+            type=int,
+            default=10,
+            help="Number of seconds to compute rolling latency percentiles over.")
+    parser.add_argument(
+            '--num-rounds',
+            type=int,
+            default=20,
+            help="Number of recent allreduce iterations to average.")
+    parser.add_argument(
+            '--interval',
+            type=float,
+            default=5,
+            help="Seconds between refreshes.")
+    args = parser.parse_args()
+
+    main(args.latency_filename, args.throughput_filename, args.allreduce_filename,
+         args.flink, args.window, args.interval, args.num_rounds)
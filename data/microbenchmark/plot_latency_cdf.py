@@ -1,10 +1,19 @@
-import re
 import os
+import sys
+import functools
 from collections import namedtuple
 import numpy as np
 import csv
 import matplotlib.pyplot as plt
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+from results import open_results
+from catalog import Catalog
+import aggregate
+import profiling
+import sketch
+import stats
+
 
 FIELDS = [
     'workers',
@@ -33,50 +42,52 @@ def label_to_str(label, num_nodes):
     else:
         return "{}+{}ms, $f$={}".format(system, label.gcsdelay, f)
 
-def parse_latencies(directory):
-    regex = 'latency-'
-    for field in FIELDS:
-        regex +='(?P<{field}>.*)-{field}-'.format(field=field)
-
+def parse_latency_file(f, sketch_error=None, memory_mb=aggregate.MEMORY_MB):
+    if sketch_error is None:
+        latencies = []
+        reader = csv.DictReader(f)
+        for row in reader:
+            latency = row['latency']
+            latency = float(latency)
+            latencies.append(latency)
+        return np.array(latencies)
+
+    latency_sketch = sketch.LatencySketch(sketch_error)
+    for chunk in aggregate.read_csv_chunks(f, {'latency': np.float64}, memory_mb):
+        latency_sketch.add(chunk['latency'].values)
+    return latency_sketch
+
+def latency_catalog(directory):
+    return Catalog(open_results(directory), 'latency-', Label)
+
+def parse_latencies(catalog, sketch_error=None, jobs=1, memory_mb=aggregate.MEMORY_MB):
+    parse = functools.partial(parse_latency_file, sketch_error=sketch_error, memory_mb=memory_mb)
     results = {}
     num_nodes = None
-    for filename in os.listdir(directory):
-        g = re.match(regex, filename)
-        if g is None:
-            continue
-        fields = g.groupdict()
-        for field, val in fields.items():
-            fields[field] = int(val)
-        label = Label(**fields)
-        latencies = []
-        lineage_sizes = []
-        lineage_size_weights = []
-        with open(os.path.join(directory, filename), 'r') as f:
-            reader = csv.DictReader(f)
-            for row in reader:
-                latency = row['latency']
-                latency = float(latency)
-                latencies.append(latency)
-        results[label] = np.array(latencies)
-        print(label, np.mean(latencies))
+    for filename, latencies in catalog.results.map(parse, catalog.regex, jobs):
+        label = catalog.label(filename)
+        results[label] = latencies
+        print(label, sketch.mean(latencies))
 
         if num_nodes is None:
             num_nodes = label.workers
         assert num_nodes == label.workers
     return results, num_nodes
 
-def plot_rows(fields, results, save_filename, num_nodes):
+def plot_rows(fields, catalog, results, save_filename, num_nodes, cdfs=None):
+    # cdfs caches the points on each label's CDF, for labels that are plotted
+    # in several groups.
+    if cdfs is None:
+        cdfs = {}
     rows = []
-    for label, row in results.items():
-        skip = False
-        for filter_field in fields:
-            val = getattr(label, filter_field[0])
-            if val not in filter_field[1]:
-                skip = True
-                break
-        if not skip:
-            print(label)
-            rows.append((label, row))
+    labels = set()
+    for _, label in catalog.select(**dict(fields)):
+        # There is only one result per label, even if there were several runs.
+        if label in labels:
+            continue
+        labels.add(label)
+        print(label)
+        rows.append((label, results[label]))
 
     rows.sort(key=lambda item: item[0].gcsdelay)
     rows.sort(key=lambda item: -1 * item[0].failures)
@@ -86,10 +97,10 @@ def plot_rows(fields, results, save_filename, num_nodes):
     lines = []
     labels = []
     for label, row in rows:
-        n, bin, patches = plt.hist(row, 1000, normed=True, cumulative=True,
-                 histtype='step', alpha=0.8, linewidth=3)
-        patches[0].set_xy(patches[0].get_xy()[:-1])
-        line, = plt.plot([], [], color=patches[0].get_edgecolor())
+        if label not in cdfs:
+            cdfs[label] = sketch.ecdf(row)
+        x, y = cdfs[label]
+        line, = plt.plot(x, y, drawstyle='steps-post', alpha=0.8, linewidth=3)
         lines.append(line)
         labels.append(label_to_str(label, num_nodes))
 
@@ -117,26 +128,39 @@ def plot_rows(fields, results, save_filename, num_nodes):
 
     return rows
 
-def save_csv(csv_filename, plotted_rows):
+def save_csv(csv_filename, plotted_rows, replicates=stats.REPLICATES, confidence=stats.CONFIDENCE, jobs=1):
     order = ['nondeterminism', 'gcs', 'gcsdelay']
 
     # Stable sort.
     for field in reversed(order):
         plotted_rows.sort(key=lambda row: getattr(row[0], field))
 
+    # Bootstrap confidence intervals for the mean, p50 and p99 of each row.
+    intervals = stats.bootstrap_all([value for _, value in plotted_rows], jobs,
+                                    replicates=replicates, confidence=confidence)
+
     with open(csv_filename, 'w+') as f:
-        fields = FIELDS + ['p50', 'p90', 'p95', 'p99']
+        fields = FIELDS + ['p50', 'p90', 'p95', 'p99', 'mean', 'count'] + stats.interval_fields()
         w = csv.DictWriter(f, fields)
         w.writeheader()
-        for label, value in plotted_rows:
+        for (label, value), interval in zip(plotted_rows, intervals):
             row = label._asdict()
             for p in [50, 90, 95, 99]:
-                row['p{}'.format(p)] = np.percentile(value, p)
+                row['p{}'.format(p)] = sketch.percentile(value, p)
+            row['mean'] = sketch.mean(value)
+            row['count'] = len(value)
+            row.update(stats.interval_row(interval))
             w.writerow(row)
 
 
-def main(directory, save_filename):
-    results, num_nodes = parse_latencies(directory)
+def main(directory, save_filename, sketch_error=None, jobs=1, memory_mb=aggregate.MEMORY_MB,
+         replicates=stats.REPLICATES, confidence=stats.CONFIDENCE):
+    with profiling.stage('list') as listed:
+        catalog = latency_catalog(directory)
+        listed.records += len(catalog)
+    with profiling.stage('parse') as parsed:
+        results, num_nodes = parse_latencies(catalog, sketch_error, jobs, memory_mb)
+        parsed.records += sum(len(latencies) for latencies in results.values())
 
     filter_fields = [
         [
@@ -157,13 +181,17 @@ def main(directory, save_filename):
     ]
 
     plotted_rows = []
+    cdfs = {}
     for fields in filter_fields:
-        plotted_rows += plot_rows(fields, results, save_filename, num_nodes)
+        with profiling.stage('render'):
+            plotted_rows += plot_rows(fields, catalog, results, save_filename, num_nodes, cdfs)
 
     if save_filename is not None:
         csv_filename = '.'.join(save_filename.split('.')[:-1])
         csv_filename += '.csv'
-        save_csv(csv_filename, plotted_rows)
+        with profiling.stage('aggregate') as aggregated:
+            save_csv(csv_filename, plotted_rows, replicates, confidence, jobs)
+            aggregated.records += sum(len(value) for _, value in plotted_rows)
 
 if __name__ == '__main__':
     import argparse
@@ -171,11 +199,26 @@ if __name__ == '__main__':
     parser.add_argument(
         '--directory',
         default='latency-19-08-26-03-20-32',
-        help="Relative path to the directory with data files. Should be in format 'latency-<date>'"
+        help="Relative path to the directory or .tar.gz archive with data files. Should be in format 'latency-<date>'"
         )
     parser.add_argument(
             '--save-filename',
             type=str,
             default=None)
+    parser.add_argument(
+            '--sketch-error',
+            type=float,
+            default=None,
+            help="If set, summarize latencies in a fixed-memory sketch with this relative error instead of keeping every sample.")
+    parser.add_argument(
+            '--jobs',
+            type=int,
+            default=1,
+            help="Number of processes to parse the data files and compute confidence intervals with.")
+    aggregate.add_arguments(parser)
+    stats.add_arguments(parser)
+    profiling.add_arguments(parser)
     args = parser.parse_args()
-    main(args.directory, args.save_filename)
+    profiling.configure_from_args(args)
+    main(args.directory, args.save_filename, args.sketch_error, args.jobs, args.memory_mb,
+         args.bootstrap_replicates, args.confidence)
@@ -1,11 +1,17 @@
 import csv
-import re
 import os
+import sys
 from collections import defaultdict
 from collections import namedtuple
 import matplotlib.pyplot as plt
 import numpy as np
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+from results import open_results
+from catalog import Catalog
+import profiling
+import stats
+
 FIELDS = [
     'workers',
     'shards',
@@ -18,40 +24,37 @@ FIELDS = [
 
 Label = namedtuple('Label', FIELDS)
 
-def parse_lineage(directory):
-    regex = 'lineage-'
-    for field in FIELDS:
-        regex +='(?P<{field}>.*)-{field}-'.format(field=field)
-
+def parse_lineage_file(f):
+    # Returns the aggregate uncommitted lineage per num_tasks, as a pair of
+    # arrays.
+    lineages = defaultdict(lambda: defaultdict(int))
+    reader = csv.DictReader(f)
+    for row in reader:
+        worker = row['worker']
+        num_tasks, size = int(row['num_tasks']), int(row['uncommitted_lineage'])
+        lineages[worker][num_tasks] = size
+
+    aggregate_sizes = defaultdict(int)
+    for worker, lineage_sizes in lineages.items():
+        for num_tasks, size in lineage_sizes.items():
+            aggregate_sizes[num_tasks] += size
+    return (np.array(list(aggregate_sizes.keys()), dtype=np.int64),
+            np.array(list(aggregate_sizes.values()), dtype=np.int64))
+
+def lineage_catalog(directory):
+    return Catalog(open_results(directory), 'lineage-', Label)
+
+def parse_lineage(catalog, jobs=1):
     results = {}
     num_nodes = None
-    for filename in os.listdir(directory):
-        g = re.match(regex, filename)
-        if g is None:
-            continue
-        fields = g.groupdict()
-        for field, val in fields.items():
-            fields[field] = int(val)
-        label = Label(**fields)
-        lineages = defaultdict(lambda: defaultdict(int))
-        with open(os.path.join(directory, filename), 'r') as f:
-            reader = csv.DictReader(f)
-            for row in reader:
-                worker = row['worker']
-                num_tasks, size = int(row['num_tasks']), int(row['uncommitted_lineage'])
-                lineages[worker][num_tasks] = size
-
-        aggregate_sizes = defaultdict(int)
-        for worker, lineage_sizes in lineages.items():
-            for num_tasks, size in lineage_sizes.items():
-                aggregate_sizes[num_tasks] += size
-
-        unpacked = []
-        for size, weight in aggregate_sizes.items():
-            unpacked += [size] * weight
-        median = np.median(unpacked)
-        quantile_1 = np.quantile(unpacked, 0.25)
-        quantile_3 = np.quantile(unpacked, 0.75)
+    for filename, aggregate_sizes in catalog.results.map(parse_lineage_file, catalog.regex, jobs):
+        label = catalog.label(filename)
+
+        # Each num_tasks value is weighted by its aggregate lineage size.
+        values, weights = aggregate_sizes
+        median = stats.weighted_median(values, weights)
+        quantile_1 = stats.weighted_quantile(values, weights, 0.25)
+        quantile_3 = stats.weighted_quantile(values, weights, 0.75)
         results[label] = (median, median - quantile_1, quantile_3 - median)
 
         if num_nodes is None:
@@ -100,32 +103,43 @@ def save_csv(csv_filename, rows):
                 })
 
 
-def main(directory, save_filename):
-    results, num_nodes = parse_lineage(directory)
+def main(directory, save_filename, jobs=1):
+    with profiling.stage('list') as listed:
+        catalog = lineage_catalog(directory)
+        listed.records += len(catalog)
+    with profiling.stage('parse') as parsed:
+        results, num_nodes = parse_lineage(catalog, jobs)
+        # The files are reduced to their aggregate lineage as they are read,
+        # so count the files.
+        parsed.records += len(results)
 
 
     x_field = 'task'
     row_field = 'failures'
 
-    rows = defaultdict(list)
-    for label, value in results.items():
-        assert label.gcs == 0 and label.nondeterminism == 1
-        key = getattr(label, row_field)
-        if key == -1:
-            key = num_nodes
-        row_label = key
-        rows[row_label].append((getattr(label, x_field), value))
-    for _, row in rows.items():
-        row.sort(key=lambda item: item[0])
-    rows = list(rows.items())
-    rows.sort(key=lambda row: row[0])
-
-    plot(rows, save_filename)
+    with profiling.stage('aggregate') as aggregated:
+        rows = defaultdict(list)
+        for label, value in results.items():
+            assert label.gcs == 0 and label.nondeterminism == 1
+            key = getattr(label, row_field)
+            if key == -1:
+                key = num_nodes
+            row_label = key
+            rows[row_label].append((getattr(label, x_field), value))
+            aggregated.records += 1
+        for _, row in rows.items():
+            row.sort(key=lambda item: item[0])
+        rows = list(rows.items())
+        rows.sort(key=lambda row: row[0])
+
+    with profiling.stage('render'):
+        plot(rows, save_filename)
 
     if save_filename is not None:
         csv_filename = '.'.join(save_filename.split('.')[:-1])
         csv_filename += '.csv'
-        save_csv(csv_filename, rows)
+        with profiling.stage('save'):
+            save_csv(csv_filename, rows)
 
 
 if __name__ == '__main__':
@@ -134,11 +148,18 @@ if __name__ == '__main__':
     parser.add_argument(
         '--directory',
         default='data/19-04-11-15-58-01',
-        help="Relative path to the directory with data files. Should be in format 'latency-<date>'"
+        help="Relative path to the directory or .tar.gz archive with data files. Should be in format 'lineage-<date>'"
         )
     parser.add_argument(
             '--save-filename',
             type=str,
             default=None)
+    parser.add_argument(
+            '--jobs',
+            type=int,
+            default=1,
+            help="Number of processes to parse the data files with.")
+    profiling.add_arguments(parser)
     args = parser.parse_args()
-    main(args.directory, args.save_filename)
+    profiling.configure_from_args(args)
+    main(args.directory, args.save_filename, args.jobs)
@@ -0,0 +1,180 @@
+# Stage-level profiling of the plot scripts. Each script's main wraps its
+# stages (listing the result files, parsing them, aggregating and rendering
+# the plot) in stage(name), which records the wall time, CPU time, number of
+# records processed and peak RSS of the stage. A stage that runs more than
+# once, such as parsing one file per system, adds up over its calls.
+#
+# Profiling is disabled unless configure() is called, which the scripts do
+# from the command line with --profile. The stages are then written as JSON
+# when the script exits:
+#   python streaming/plot_latency_cdf.py --directory 4-workers --profile profile.json
+# With --profile-dump, every stage also runs under cProfile and the profile of
+# the slowest one is dumped for pstats or snakeviz.
+import atexit
+import cProfile
+import contextlib
+import json
+import resource
+import sys
+import time
+from collections import OrderedDict
+
+_profiler = None
+
+
+def peak_rss_mb():
+    # On Linux, ru_maxrss carries over from the parent process across exec,
+    # so prefer the high water mark of this process's own address space.
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) / 1024
+    except IOError:
+        pass
+    # ru_maxrss is in KB on Linux and in bytes on macOS.
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return maxrss / 1024 / (1024 if sys.platform == 'darwin' else 1)
+
+
+def reset_peak_rss():
+    # Reset the high water mark so that the next stage's peak is its own.
+    # Needs Linux 4.0 or later. Otherwise, peaks are since the process started.
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+    except (IOError, OSError):
+        pass
+
+
+def cpu_seconds():
+    # Includes worker processes that have exited, such as those of a
+    # ProcessPoolExecutor that was shut down within the stage.
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return time.process_time() + children.ru_utime + children.ru_stime
+
+
+class Stage(object):
+    def __init__(self, name):
+        self.name = name
+        self.calls = 0
+        self.wall_seconds = 0.0
+        self.cpu_seconds = 0.0
+        # Parsers and aggregations add the number of records they processed.
+        self.records = 0
+        self.peak_rss_mb = 0.0
+        self.profile = None
+
+    def to_json(self):
+        return OrderedDict([
+            ('name', self.name),
+            ('calls', self.calls),
+            ('wall_seconds', self.wall_seconds),
+            ('cpu_seconds', self.cpu_seconds),
+            ('records', int(self.records)),
+            ('records_per_second', self.records / self.wall_seconds if self.wall_seconds else None),
+            ('peak_rss_mb', self.peak_rss_mb),
+        ])
+
+
+class Profiler(object):
+    def __init__(self, filename, dump_filename=None):
+        self.filename = filename
+        self.dump_filename = dump_filename
+        self.stages = OrderedDict()
+        # Stages that are running, outermost first.
+        self.running = []
+        self.start = time.perf_counter()
+
+    def update_peaks(self):
+        peak = peak_rss_mb()
+        for running in self.running:
+            running.peak_rss_mb = max(running.peak_rss_mb, peak)
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        if name not in self.stages:
+            self.stages[name] = Stage(name)
+        stage = self.stages[name]
+        # Only one cProfile profiler can be enabled at a time, so nested
+        # stages are profiled as part of the outermost one.
+        profile = None
+        if self.dump_filename is not None and not self.running:
+            if stage.profile is None:
+                stage.profile = cProfile.Profile()
+            profile = stage.profile
+
+        # Close out the peaks of the enclosing stages before resetting.
+        self.update_peaks()
+        reset_peak_rss()
+        self.running.append(stage)
+        start_wall = time.perf_counter()
+        start_cpu = cpu_seconds()
+        if profile is not None:
+            profile.enable()
+        try:
+            yield stage
+        finally:
+            if profile is not None:
+                profile.disable()
+            stage.calls += 1
+            stage.wall_seconds += time.perf_counter() - start_wall
+            stage.cpu_seconds += cpu_seconds() - start_cpu
+            self.update_peaks()
+            self.running.pop()
+
+    def slowest(self):
+        stages = [stage for stage in self.stages.values() if stage.profile is not None]
+        if not stages:
+            return None
+        return max(stages, key=lambda stage: stage.wall_seconds)
+
+    def save(self):
+        slowest = self.slowest()
+        if slowest is not None:
+            slowest.profile.dump_stats(self.dump_filename)
+        profile = OrderedDict([
+            ('command', sys.argv),
+            ('wall_seconds', time.perf_counter() - self.start),
+            ('stages', [stage.to_json() for stage in self.stages.values()]),
+            ('dumped_stage', None if slowest is None else slowest.name),
+        ])
+        with open(self.filename, 'w') as f:
+            json.dump(profile, f, indent=2)
+
+
+def configure(filename, dump_filename=None):
+    global _profiler
+    if filename is None:
+        _profiler = None
+    else:
+        _profiler = Profiler(filename, dump_filename)
+        atexit.register(_profiler.save)
+
+
+def add_arguments(parser):
+    parser.add_argument(
+            '--profile',
+            type=str,
+            default=None,
+            help="Write the wall time, CPU time, records and peak memory of each stage to this JSON file.")
+    parser.add_argument(
+            '--profile-dump',
+            type=str,
+            default=None,
+            help="With --profile, also run each stage under cProfile and dump the slowest one's stats to this file.")
+
+
+def configure_from_args(args):
+    configure(args.profile, args.profile_dump)
+
+
+def stage(name):
+    # Context manager around one stage of a script, which yields the Stage so
+    # that the number of records can be added to it:
+    #   with profiling.stage('parse') as parsed:
+    #       latencies = parse_latencies(results, filename)
+    #       parsed.records += len(latencies)
+    if _profiler is None:
+        return contextlib.nullcontext(Stage(name))
+    return _profiler.stage(name)
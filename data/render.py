@@ -0,0 +1,156 @@
+# Renders a batch of figures with one command. The manifest is a JSON list of
+# entries, each naming a plot script, the directory or archive to read and the
+# other arguments to its main(), e.g.
+#   [{"script": "allreduce/plot_allreduce_latency.py",
+#     "directory": "allreduce/64-workers.tar.gz",
+#     "options": {"save_filename": "64-workers.png"}}]
+# Relative paths are resolved against the manifest's directory. Figures and
+# CSVs are written to --output-dir, a scratch directory by default, or with
+# --in-place next to the script, as when running it by hand, which replaces
+# the checked-in ones.
+#
+# Entries are rendered with the Agg backend by a pool of worker processes.
+# Entries that read the same directory go to the same worker, one after the
+# other, and workers share parsed files through the parse cache (see
+# cache.py), so each result file is parsed once per batch.
+import contextlib
+import importlib.util
+import io
+import json
+import os
+import sys
+import tempfile
+import traceback
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+
+import matplotlib
+import matplotlib.pyplot as plt
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import cache
+
+REPORT_DIR = os.path.join(tempfile.gettempdir(), 'lineage-stash-report')
+
+_scripts = {}
+
+
+def load_manifest(manifest_filename):
+    root = os.path.dirname(os.path.abspath(manifest_filename))
+    with open(manifest_filename) as f:
+        entries = json.load(f)
+    for entry in entries:
+        entry['script'] = os.path.join(root, entry['script'])
+        entry['directory'] = os.path.join(root, entry['directory'])
+        entry.setdefault('options', {})
+        assert entry['options'].get('save_filename') is not None, \
+            "{} has no save_filename, so it would not render anything".format(entry['script'])
+    return entries
+
+
+def load_script(script):
+    # Each script is imported once per worker. Several scripts share a
+    # basename, so name the modules after their full path.
+    if script not in _scripts:
+        name = 'render_' + os.path.splitext(script)[0].strip(os.sep).replace(os.sep, '_')
+        spec = importlib.util.spec_from_file_location(name, script)
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+        _scripts[script] = module
+    return _scripts[script]
+
+
+def render(entry, output_dir):
+    # Returns the entry's printed output and, if it failed, the traceback.
+    output = io.StringIO()
+    error = None
+    cwd = os.getcwd()
+    try:
+        os.chdir(output_dir or os.path.dirname(entry['script']))
+        # Every figure starts from the default style, as in a fresh process.
+        plt.switch_backend('Agg')
+        matplotlib.rcdefaults()
+        with contextlib.redirect_stdout(output):
+            load_script(entry['script']).main(entry['directory'], **entry['options'])
+    except Exception:
+        error = traceback.format_exc()
+    finally:
+        plt.close('all')
+        os.chdir(cwd)
+    return output.getvalue(), error
+
+
+def render_group(entries, output_dir, cache_dir, cache_size_mb):
+    cache.configure(cache_dir, cache_size_mb)
+    return [render(entry, output_dir) for entry in entries]
+
+
+def main(manifest_filename, output_dir, jobs, cache_dir, cache_size_mb):
+    entries = load_manifest(manifest_filename)
+    # Create the cache directory before the workers race to.
+    cache.configure(cache_dir, cache_size_mb)
+    if output_dir is not None:
+        output_dir = os.path.abspath(output_dir)
+        if not os.path.isdir(output_dir):
+            os.makedirs(output_dir)
+
+    groups = OrderedDict()
+    for entry in entries:
+        groups.setdefault(entry['directory'], []).append(entry)
+
+    rendered = {}
+    with ProcessPoolExecutor(jobs) as executor:
+        futures = [(group, executor.submit(render_group, group, output_dir,
+                                           cache_dir, cache_size_mb))
+                   for group in groups.values()]
+        for group, future in futures:
+            for entry, result in zip(group, future.result()):
+                rendered[id(entry)] = result
+
+    return print_rendered(entries, [rendered[id(entry)] for entry in entries])
+
+
+def print_rendered(entries, rendered):
+    # Prints each entry's output, in order. Returns the number that failed.
+    num_failed = 0
+    for entry, (output, error) in zip(entries, rendered):
+        print("==> {} {} {}".format(
+            os.path.relpath(entry['script']), os.path.relpath(entry['directory']),
+            json.dumps(entry['options'], sort_keys=True)))
+        sys.stdout.write(output)
+        if error is not None:
+            num_failed += 1
+            sys.stdout.write(error)
+    print("Rendered {} of {} entries".format(len(entries) - num_failed, len(entries)))
+    return num_failed
+
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(description='Render a batch of figures.')
+    parser.add_argument(
+            '--manifest',
+            type=str,
+            default=os.path.join(os.path.dirname(os.path.abspath(__file__)), 'figures.json'),
+            help="JSON list of {script, directory, options} entries.")
+    parser.add_argument(
+            '--output-dir',
+            type=str,
+            default=REPORT_DIR,
+            help="Directory to write all figures to.")
+    parser.add_argument(
+            '--in-place',
+            action='store_true',
+            help="Write each figure to its script's directory instead, replacing the checked-in figures and CSVs.")
+    parser.add_argument(
+            '--jobs',
+            type=int,
+            default=os.cpu_count(),
+            help="Number of worker processes.")
+    cache.add_arguments(parser)
+    args = parser.parse_args()
+
+    cache_dir = None if args.no_cache else args.cache_dir
+    output_dir = None if args.in_place else args.output_dir
+    num_failed = main(args.manifest, output_dir, args.jobs, cache_dir, args.cache_size_mb)
+    sys.exit(1 if num_failed else 0)
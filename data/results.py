@@ -0,0 +1,191 @@
+# Access to a set of experiment result files. The plot scripts take a
+# --directory argument which can either be a directory on disk or one of the
+# .tar.gz archives that the results are shipped in. Archive members are read
+# directly out of the tarball, so the results never have to be extracted.
+import io
+import mmap
+import os
+import re
+import tarfile
+from collections import OrderedDict
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+# Map from path to its results, once share() is called.
+_shared = None
+
+
+class _StreamedMember(io.RawIOBase):
+    # A member of an archive opened in stream mode. tarfile's own file object
+    # is not usable by io.TextIOWrapper in that mode since it cannot report
+    # whether it is seekable.
+    def __init__(self, f):
+        self._f = f
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        data = self._f.read(len(b))
+        b[:len(data)] = data
+        return len(data)
+
+
+class ResultsDirectory(object):
+    def __init__(self, path):
+        self.path = path
+
+    def listdir(self):
+        return os.listdir(self.path)
+
+    def open(self, filename, mode='r'):
+        return open(os.path.join(self.path, filename), mode)
+
+    def buffer(self, filename):
+        # The file's contents as a read-only, memory-mapped buffer.
+        with self.open(filename, 'rb') as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                return b''
+            return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def stat(self, filename):
+        st = os.stat(os.path.join(self.path, filename))
+        return st.st_size, st.st_mtime
+
+    def files(self, regex=None, mode='r'):
+        # Yield (filename, file) for each file whose name matches the regex.
+        for filename in self.listdir():
+            if regex is not None and re.match(regex, filename) is None:
+                continue
+            with self.open(filename, mode) as f:
+                yield filename, f
+
+    def map(self, parse, regex=None, jobs=1):
+        # Yield (filename, parse(file)) for each file whose name matches the
+        # regex. See map_files.
+        tasks = ((filename, (self.path, filename, None))
+                 for filename in self.listdir()
+                 if regex is None or re.match(regex, filename) is not None)
+        return map_files(self, parse, regex, jobs, tasks)
+
+
+class ResultsArchive(object):
+    def __init__(self, path):
+        self.path = path
+        # Map from filename to its TarInfo, in archive order.
+        self._members = None
+        # Opened lazily for random access to members.
+        self._tar = None
+
+    def listdir(self):
+        if self._members is None:
+            members = OrderedDict()
+            with tarfile.open(self.path, 'r|gz') as tar:
+                for member in tar:
+                    if member.isfile():
+                        members[os.path.basename(member.name)] = member
+            self._members = members
+        return list(self._members)
+
+    def open(self, filename, mode='r'):
+        if self._tar is None:
+            self._tar = tarfile.open(self.path, 'r:gz')
+        self.listdir()
+        f = self._tar.extractfile(self._members[filename].name)
+        if 'b' not in mode:
+            f = io.TextIOWrapper(f)
+        return f
+
+    def buffer(self, filename):
+        # Members are compressed, so they cannot be memory-mapped.
+        with self.open(filename, 'rb') as f:
+            return f.read()
+
+    def stat(self, filename):
+        self.listdir()
+        member = self._members[filename]
+        return member.size, member.mtime
+
+    def files(self, regex=None, mode='r'):
+        # Yield (filename, file) for each member whose name matches the regex.
+        # The archive is streamed in a single pass, so each file is only valid
+        # until the next one is yielded.
+        members = OrderedDict()
+        with tarfile.open(self.path, 'r|gz') as tar:
+            for member in tar:
+                if not member.isfile():
+                    continue
+                filename = os.path.basename(member.name)
+                members[filename] = member
+                if regex is not None and re.match(regex, filename) is None:
+                    continue
+                f = io.BufferedReader(_StreamedMember(tar.extractfile(member)))
+                if 'b' not in mode:
+                    f = io.TextIOWrapper(f)
+                yield filename, f
+        if self._members is None:
+            self._members = members
+
+    def map(self, parse, regex=None, jobs=1):
+        # Yield (filename, parse(file)) for each member whose name matches
+        # the regex. See map_files. The archive is still only streamed once;
+        # each member's contents are handed to a worker process to parse.
+        tasks = ((filename, (None, filename, f.read()))
+                 for filename, f in self.files(regex, 'rb'))
+        return map_files(self, parse, regex, jobs, tasks)
+
+
+def _parse_file(parse, path, filename, contents):
+    if contents is None:
+        with open(os.path.join(path, filename), 'r') as f:
+            return parse(f)
+    return parse(io.TextIOWrapper(io.BytesIO(contents)))
+
+
+def map_files(results, parse, regex, jobs, tasks):
+    # Parse files in a pool of `jobs` processes. parse must be picklable,
+    # e.g. a module-level function or a functools.partial of one, and should
+    # return something compact such as a NumPy array. Results are yielded in
+    # the same order as the files are listed, no matter which worker finishes
+    # first, and only a few files per worker are in flight at a time.
+    if jobs <= 1:
+        for filename, f in results.files(regex):
+            yield filename, parse(f)
+        return
+
+    with ProcessPoolExecutor(jobs) as pool:
+        pending = deque()
+        for filename, args in tasks:
+            pending.append((filename, pool.submit(_parse_file, parse, *args)))
+            if len(pending) >= 2 * jobs:
+                filename, future = pending.popleft()
+                yield filename, future.result()
+        while pending:
+            filename, future = pending.popleft()
+            yield filename, future.result()
+
+
+def share():
+    # From now on, return the same object every time a path is opened, so
+    # that several plots made in one process list each archive once.
+    global _shared
+    if _shared is None:
+        _shared = {}
+
+
+def open_results(path):
+    # If the directory was never extracted, fall back to the archive.
+    if not os.path.exists(path):
+        for extension in ['.tar.gz', '.tgz']:
+            if os.path.exists(path + extension):
+                path += extension
+                break
+    if _shared is not None and os.path.abspath(path) in _shared:
+        return _shared[os.path.abspath(path)]
+    if os.path.isdir(path):
+        results = ResultsDirectory(path)
+    else:
+        results = ResultsArchive(path)
+    if _shared is not None:
+        _shared[os.path.abspath(path)] = results
+    return results
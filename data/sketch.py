@@ -0,0 +1,170 @@
+# Fixed-memory, mergeable summary of a latency distribution. Values are
+# counted in logarithmically sized buckets (as in HDR histogram or DDSketch),
+# so every percentile and every point on the CDF is reported within a
+# relative error of `error` of the true value. Memory depends only on the
+# error and the [min_value, max_value] range, not on how many values are
+# added. Negative values, such as Flink's latencies when clocks are skewed,
+# are counted in the same buckets mirrored below zero, and values within
+# min_value of zero in a bucket of their own that is reported as 0. Values
+# beyond max_value, either way, are clamped into the outermost bucket; the
+# exact min, max, count and sum are always tracked.
+import numpy as np
+
+# Default number of points to draw a CDF with.
+CDF_POINTS = 2000
+
+
+class LatencySketch(object):
+    def __init__(self, error=0.01, min_value=1e-3, max_value=1e7):
+        assert 0 < error < 1
+        assert 0 < min_value < max_value
+        self.error = error
+        self.min_value = min_value
+        self.max_value = max_value
+        self._log_gamma = np.log((1 + error) / (1 - error))
+        self._offset = int(np.floor(np.log(min_value) / self._log_gamma))
+        self._num_buckets = int(np.ceil(np.log(max_value) / self._log_gamma)) - self._offset + 1
+        # The negative buckets, from the most negative up, then the zero
+        # bucket, then the positive buckets, so that counts are in the order
+        # of their values.
+        self.counts = np.zeros(2 * self._num_buckets + 1, dtype=np.int64)
+        self.count = 0
+        self.total = 0.0
+        self.min = np.inf
+        self.max = -np.inf
+
+    def __len__(self):
+        return self.count
+
+    def add(self, values):
+        values = np.asarray(values, dtype=np.float64).ravel()
+        if len(values) == 0:
+            return
+        self.count += len(values)
+        self.total += values.sum()
+        self.min = min(self.min, values.min())
+        self.max = max(self.max, values.max())
+        magnitudes = np.clip(np.abs(values), self.min_value, self.max_value)
+        index = np.ceil(np.log(magnitudes) / self._log_gamma).astype(np.int64) - self._offset
+        index = np.where(values < 0, self._num_buckets - 1 - index, self._num_buckets + 1 + index)
+        index[np.abs(values) <= self.min_value] = self._num_buckets
+        self.counts += np.bincount(index, minlength=len(self.counts))
+
+    def merge(self, other):
+        assert (self.error, self.min_value, self.max_value) == \
+            (other.error, other.min_value, other.max_value), \
+            "Can only merge sketches with the same parameters"
+        self.counts += other.counts
+        self.count += other.count
+        self.total += other.total
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        return self
+
+    def _magnitudes(self):
+        # The upper bound of the magnitude of the values in each positive
+        # bucket, or in its mirror below zero.
+        return np.exp((np.arange(self._num_buckets) + self._offset) * self._log_gamma)
+
+    def _bounds(self):
+        # The upper bound of each bucket.
+        magnitudes = self._magnitudes()
+        return np.concatenate([-magnitudes[::-1] / np.exp(self._log_gamma), [self.min_value], magnitudes])
+
+    def _midpoints(self):
+        # The value reported for each bucket: its middle, in relative terms.
+        midpoints = self._magnitudes() * 2 / (1 + np.exp(self._log_gamma))
+        return np.concatenate([-midpoints[::-1], [0.0], midpoints])
+
+    def _value_at(self, rank):
+        # The value of the element with the given rank, in sorted order.
+        index = np.searchsorted(np.cumsum(self.counts), rank, side='right')
+        index = np.minimum(index, len(self.counts) - 1)
+        return np.clip(self._midpoints()[index], self.min, self.max)
+
+    def histogram(self):
+        # Returns the value reported for each non-empty bucket, and its count.
+        nonempty = self.counts > 0
+        return np.clip(self._midpoints()[nonempty], self.min, self.max), self.counts[nonempty]
+
+    def mean(self):
+        return self.total / self.count
+
+    def percentile(self, q):
+        # Same interface as np.percentile, with q in [0, 100].
+        q = np.asarray(q, dtype=np.float64)
+        rank = q / 100 * (self.count - 1)
+        # Like np.percentile, interpolate linearly between the two closest
+        # ranks. Each is within the error bound, so the result is too.
+        lower = self._value_at(np.floor(rank))
+        upper = self._value_at(np.ceil(rank))
+        values = lower + (upper - lower) * (rank - np.floor(rank))
+        values = np.where(q <= 0, self.min, values)
+        values = np.where(q >= 100, self.max, values)
+        if values.ndim == 0:
+            return float(values)
+        return values
+
+    def cdf(self):
+        # Returns (x, y) points on the CDF, one per non-empty bucket.
+        nonempty = self.counts > 0
+        x = np.clip(self._bounds()[nonempty], self.min, self.max)
+        y = np.cumsum(self.counts)[nonempty] / self.count
+        return np.concatenate([[self.min], x]), np.concatenate([[0], y])
+
+
+def _cdf_ranks(n, max_points):
+    # Ranks to keep out of n sorted values: evenly spaced ones for the body
+    # of the distribution, plus ones that get geometrically closer to either
+    # end so that the tails keep their shape.
+    if n <= max_points:
+        return np.arange(n)
+    even = np.linspace(0, n - 1, max_points // 2)
+    tail = np.geomspace(1, n, max_points // 4)
+    ranks = np.round(np.concatenate([even, tail - 1, n - tail])).astype(np.int64)
+    return np.unique(np.clip(ranks, 0, n - 1))
+
+
+def ecdf(values, max_points=CDF_POINTS):
+    # Returns (x, y) points on the empirical CDF of an array or a sketch, to
+    # be drawn as steps (drawstyle='steps-post'). Keeps at most about
+    # max_points of them, so that drawing does not depend on the number of
+    # values.
+    if isinstance(values, LatencySketch):
+        x, y = values.cdf()
+    else:
+        x = np.sort(values)
+        y = np.arange(1, len(x) + 1) / len(x)
+    keep = _cdf_ranks(len(x), max_points)
+    x = x[keep]
+    y = y[keep]
+    if len(x) and y[0] > 0:
+        # Start from 0 at the smallest value.
+        x = np.concatenate([[x[0]], x])
+        y = np.concatenate([[0], y])
+    return x, y
+
+
+def percentile(values, q):
+    # np.percentile for either an array of values or a sketch.
+    if isinstance(values, LatencySketch):
+        return values.percentile(q)
+    return np.percentile(values, q)
+
+
+def mean(values):
+    if isinstance(values, LatencySketch):
+        return values.mean()
+    return np.mean(values)
+
+
+def minimum(values):
+    if isinstance(values, LatencySketch):
+        return values.min
+    return np.min(values)
+
+
+def maximum(values):
+    if isinstance(values, LatencySketch):
+        return values.max
+    return np.max(values)
@@ -0,0 +1,196 @@
+# Summary statistics shared by the plot scripts.
+from concurrent.futures import ProcessPoolExecutor
+import hashlib
+import numpy as np
+
+import sketch
+
+# Bootstrap confidence intervals.
+REPLICATES = 1000
+CONFIDENCE = 0.95
+PERCENTILES = [50, 99]
+# Maximum number of resampled counts or indices to hold in memory at a time.
+BATCH_SIZE = 1 << 22
+
+
+def _sorted_weights(values, weights):
+    values = np.asarray(values)
+    weights = np.asarray(weights)
+    order = np.argsort(values, kind='stable')
+    return values[order], np.cumsum(weights[order])
+
+
+def _value_at(values, cumulative_weights, rank):
+    # The element with the given rank in np.repeat(values, weights).
+    return values[np.searchsorted(cumulative_weights, rank, side='right')]
+
+
+def weighted_quantile(values, weights, q):
+    # Same as np.quantile(np.repeat(values, weights), q), but in time and
+    # memory proportional to the number of distinct values rather than to the
+    # total weight.
+    values, cumulative_weights = _sorted_weights(values, weights)
+    n = cumulative_weights[-1] if len(cumulative_weights) else 0
+    if n == 0:
+        return np.nan
+    index = (n - 1) * np.asarray(q, dtype=np.float64)
+    lower = np.floor(index)
+    upper = np.minimum(lower + 1, n - 1)
+    t = index - lower
+    a = _value_at(values, cumulative_weights, lower).astype(np.float64)
+    b = _value_at(values, cumulative_weights, upper).astype(np.float64)
+    # Interpolate the same way as NumPy so that the results are identical.
+    diff = b - a
+    return np.where(t >= 0.5, b - diff * (1 - t), a + diff * t)[()]
+
+
+def weighted_median(values, weights):
+    # Same as np.median(np.repeat(values, weights)).
+    values, cumulative_weights = _sorted_weights(values, weights)
+    n = cumulative_weights[-1] if len(cumulative_weights) else 0
+    if n == 0:
+        return np.nan
+    a = _value_at(values, cumulative_weights, (n - 1) // 2).astype(np.float64)
+    b = _value_at(values, cumulative_weights, n // 2).astype(np.float64)
+    return (a + b) / 2
+
+
+def add_arguments(parser):
+    parser.add_argument(
+            '--bootstrap-replicates',
+            type=int,
+            default=REPLICATES,
+            help="Number of bootstrap replicates for the confidence intervals in the CSV. 0 to skip them.")
+    parser.add_argument(
+            '--confidence',
+            type=float,
+            default=CONFIDENCE,
+            help="Confidence level of the bootstrap intervals.")
+
+
+def _interpolate(a, b, t):
+    # Interpolate between neighbouring ranks the same way as NumPy.
+    diff = b - a
+    return np.where(t >= 0.5, b - diff * (1 - t), a + diff * t)
+
+
+def _ranks(n, q):
+    index = (n - 1) * q
+    lower = int(np.floor(index))
+    return lower, min(lower + 1, n - 1), index - lower
+
+
+def _resample_counts(rng, distinct, counts, n, percentiles, batch_size):
+    # Each replicate is a row of how many copies of each distinct value it
+    # drew. Yields the mean and the percentiles of each replicate in a batch.
+    probabilities = counts / float(n)
+    resampled = rng.multinomial(n, probabilities, size=batch_size)
+    means = resampled.dot(distinct) / n
+    cumulative_weights = np.cumsum(resampled, axis=1)
+    quantiles = []
+    for p in percentiles:
+        lower, upper, t = _ranks(n, p / 100.0)
+        # The value with a given rank, as in _value_at.
+        a = distinct[(cumulative_weights <= lower).sum(axis=1)]
+        b = distinct[(cumulative_weights <= upper).sum(axis=1)]
+        quantiles.append(_interpolate(a, b, t))
+    return means, quantiles
+
+
+def _resample_indices(rng, sorted_values, n, percentiles, batch_size):
+    # Each replicate is a row of indices into the sorted values. Since the
+    # values are sorted, the value with a given rank in a replicate is the
+    # one at the index with that rank, which np.partition finds in linear
+    # time.
+    indices = rng.integers(0, n, size=(batch_size, n))
+    means = sorted_values[indices].mean(axis=1)
+    ranks = [_ranks(n, p / 100.0) for p in percentiles]
+    kth = sorted(set(rank for lower, upper, _ in ranks for rank in (lower, upper)))
+    indices.partition(kth, axis=1)
+    quantiles = [_interpolate(sorted_values[indices[:, lower]], sorted_values[indices[:, upper]], t)
+                 for lower, upper, t in ranks]
+    return means, quantiles
+
+
+def interval_names(percentiles=PERCENTILES):
+    return ['mean'] + ['p{:g}'.format(p) for p in percentiles]
+
+
+def sample_seed(distinct, counts):
+    # A seed that depends only on the values, so that the same sample always
+    # gets the same intervals, wherever it is in a list.
+    digest = hashlib.sha1(np.ascontiguousarray(distinct, dtype=np.float64).tobytes() +
+                          np.ascontiguousarray(counts, dtype=np.int64).tobytes()).digest()
+    return int.from_bytes(digest[:8], 'little')
+
+
+def bootstrap(values, percentiles=PERCENTILES, replicates=REPLICATES, confidence=CONFIDENCE, seed=None):
+    # Bootstrap confidence intervals for the mean and percentiles of the
+    # values, either an array or a LatencySketch. Returns a map from 'mean',
+    # 'p50', ... to (low, high). The values are resampled individually, so
+    # for the samples of one run (the rounds of an allreduce run, or the task
+    # latencies of a microbenchmark run), the intervals reflect the noise
+    # within that run, not the variation between repeated runs. Unless a
+    # seed is given, it is derived from the values.
+    #
+    # Replicates are drawn and summarized a batch at a time, with a few array
+    # operations per batch. When there are few distinct values, as with
+    # rounded latencies or the buckets of a sketch, resampling n values with
+    # replacement is done as drawing how many copies of each distinct value
+    # to take from a multinomial. A sketch is resampled from its buckets, so
+    # its intervals are within the sketch's error.
+    if isinstance(values, sketch.LatencySketch):
+        distinct, counts = values.histogram()
+    else:
+        distinct, counts = np.unique(np.asarray(values, dtype=np.float64), return_counts=True)
+    n = counts.sum()
+    names = interval_names(percentiles)
+    if n == 0 or replicates == 0:
+        return dict((name, (np.nan, np.nan)) for name in names)
+
+    rng = np.random.default_rng(sample_seed(distinct, counts) if seed is None else seed)
+    by_counts = len(distinct) * 8 <= n
+    if not by_counts:
+        sorted_values = np.repeat(distinct, counts)
+    batch_size = max(1, BATCH_SIZE // (len(distinct) if by_counts else n))
+    estimates = dict((name, []) for name in names)
+    for start in range(0, replicates, batch_size):
+        size = min(batch_size, replicates - start)
+        if by_counts:
+            means, quantiles = _resample_counts(rng, distinct, counts, n, percentiles, size)
+        else:
+            means, quantiles = _resample_indices(rng, sorted_values, n, percentiles, size)
+        estimates['mean'].append(means)
+        for name, quantile in zip(names[1:], quantiles):
+            estimates[name].append(quantile)
+
+    tail = (1 - confidence) / 2 * 100
+    return dict((name, tuple(np.percentile(np.concatenate(estimates[name]), [tail, 100 - tail])))
+                for name in names)
+
+
+def _bootstrap(values, kwargs):
+    return bootstrap(values, **kwargs)
+
+
+def bootstrap_all(samples, jobs=1, **kwargs):
+    # bootstrap() for each of a list of samples, in a pool of `jobs`
+    # processes. Each sample is seeded from its values, so the results
+    # depend neither on the number of jobs nor on the order of the samples.
+    if jobs <= 1:
+        return [_bootstrap(values, kwargs) for values in samples]
+    with ProcessPoolExecutor(jobs) as pool:
+        return list(pool.map(_bootstrap, samples, [kwargs] * len(samples)))
+
+
+def interval_fields(percentiles=PERCENTILES):
+    # CSV columns for the intervals returned by bootstrap().
+    return [name + suffix for name in interval_names(percentiles) for suffix in ['_low', '_high']]
+
+
+def interval_row(intervals):
+    row = {}
+    for name, (low, high) in intervals.items():
+        row[name + '_low'] = low
+        row[name + '_high'] = high
+    return row
@@ -1,40 +1,76 @@
 import os
+import sys
 import numpy as np
 import matplotlib.pyplot as plt
-import csv
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+from results import open_results
+import aggregate
+import cache
+import profiling
+import sketch
 
 WARMUP_SECONDS = 35
 
-def parse_latencies(filename):
+# Bump this whenever the parser below changes, to invalidate cached results.
+PARSER_VERSION = 1
+
+def parse_latencies(results, filename):
+    return parse_latency_columns(results, filename, WARMUP_SECONDS)['latency']
+
+@cache.columns('streaming-latency-cdf', PARSER_VERSION)
+def parse_latency_columns(results, filename, warmup_seconds):
+    with results.open(filename, 'rb') as f:
+        return {'latency': parse_latency_file(f, warmup_seconds)}
+
+def sketch_latencies(results, filename, error, memory_mb=aggregate.MEMORY_MB):
+    # Like parse_latencies, but summarizes the latencies in a fixed-memory
+    # sketch instead of keeping every sample.
+    latency_sketch = sketch.LatencySketch(error)
+    with results.open(filename, 'rb') as f:
+        for latencies in iter_latency_chunks(f, WARMUP_SECONDS, memory_mb):
+            latency_sketch.add(latencies)
+    return latency_sketch
+
+def parse_latency_file(f, warmup_seconds=WARMUP_SECONDS):
+    points = list(iter_latency_chunks(f, warmup_seconds))
+    if not points:
+        return np.array([])
+    return np.concatenate(points)
+
+def iter_latency_chunks(f, warmup_seconds, memory_mb=aggregate.MEMORY_MB):
+    in_seconds = aggregate.timestamps_in_seconds(f)
+    warmup = warmup_seconds
+    if not in_seconds:
+        warmup *= 1000
+
     operator = None
-    points = []
     first_timestamp = None
-    max_timestamp = None
-    with open(filename, 'r') as f:
-        reader = csv.DictReader(f)
-        for row in reader:
-            record_timestamp = row['timestamp']
-            in_seconds = '.' in record_timestamp
-            record_timestamp = float(record_timestamp)
-
-            if operator != row['sink_id']:
-                operator = row['sink_id']
-                first_timestamp = record_timestamp
-                max_timestamp = record_timestamp
-
-            if row['sink_id'] == operator:
-                # Skip records during warmup.
-                if in_seconds:
-                    if record_timestamp - max_timestamp < WARMUP_SECONDS:
-                        continue
-                elif record_timestamp - max_timestamp < WARMUP_SECONDS * 1000:
-                    continue
-
-                latency = float(row['latency'])
-                if in_seconds:
-                    latency *= 1000
-                points.append(latency)
-    return points
+    chunks = aggregate.read_csv_chunks(
+        f, {'sink_id': str, 'timestamp': np.float64, 'latency': np.float64}, memory_mb)
+    for chunk in chunks:
+        sink_ids = chunk['sink_id'].values
+        timestamps = chunk['timestamp'].values
+        latencies = chunk['latency'].values
+
+        # The warmup period restarts every time the sink changes.
+        new_operator = np.empty(len(sink_ids), dtype=bool)
+        new_operator[0] = sink_ids[0] != operator
+        new_operator[1:] = sink_ids[1:] != sink_ids[:-1]
+        starts = np.where(new_operator, np.arange(len(sink_ids)), 0)
+        np.maximum.accumulate(starts, out=starts)
+        first_timestamps = timestamps[starts]
+        if not new_operator[0]:
+            # These records continue the run from the previous chunk.
+            first_timestamps[starts == 0] = first_timestamp
+        operator = sink_ids[-1]
+        first_timestamp = first_timestamps[-1]
+
+        # Skip records during warmup.
+        latencies = latencies[timestamps - first_timestamps >= warmup]
+        if in_seconds:
+            latencies = latencies * 1000
+        yield latencies
 
 def plot_latencies(all_latencies, save_filename):
     fig, ax = plt.subplots(figsize=(4, 2))
@@ -42,10 +78,8 @@ def plot_latencies(all_latencies, save_filename):
     lines = []
     labels = []
     for label, latencies in all_latencies:
-        n, bin, patches = plt.hist(latencies, 1000, normed=True, cumulative=True,
-                                   histtype='step', alpha=0.8, linewidth=2)
-        patches[0].set_xy(patches[0].get_xy()[:-1])
-        line, = plt.plot([], [], color=patches[0].get_edgecolor())
+        x, y = sketch.ecdf(latencies)
+        line, = plt.plot(x, y, drawstyle='steps-post', alpha=0.8, linewidth=2)
         lines.append(line)
         labels.append(label)
     
@@ -63,20 +97,23 @@ def plot_latencies(all_latencies, save_filename):
     else:
         plt.show()
 
-def main(directory, save_filename):
-    flink_filename = None
-    lineage_stash_filename = None
-    writefirst_filename = None
-    for filename in os.listdir(directory):
-        if filename.startswith('flink-latency'):
-            assert flink_filename is None
-            flink_filename = os.path.join(directory, filename)
-        elif filename.startswith('latency'):
-            assert lineage_stash_filename is None
-            lineage_stash_filename = os.path.join(directory, filename)
-        elif filename.startswith('writefirst-latency'):
-            assert writefirst_filename is None
-            writefirst_filename = os.path.join(directory, filename)
+def main(directory, save_filename, sketch_error=None, memory_mb=aggregate.MEMORY_MB):
+    with profiling.stage('list') as listed:
+        results = open_results(directory)
+        flink_filename = None
+        lineage_stash_filename = None
+        writefirst_filename = None
+        for filename in results.listdir():
+            listed.records += 1
+            if filename.startswith('flink-latency'):
+                assert flink_filename is None
+                flink_filename = filename
+            elif filename.startswith('latency'):
+                assert lineage_stash_filename is None
+                lineage_stash_filename = filename
+            elif filename.startswith('writefirst-latency'):
+                assert writefirst_filename is None
+                writefirst_filename = filename
 
     filenames = [
         ('Flink', flink_filename),
@@ -85,20 +122,28 @@ def main(directory, save_filename):
     ]
     all_latencies = []
     for label, filename in filenames:
-        latencies = parse_latencies(filename)
+        with profiling.stage('parse') as parsed:
+            if sketch_error is None:
+                latencies = parse_latencies(results, filename)
+            else:
+                latencies = sketch_latencies(results, filename, sketch_error, memory_mb)
+            parsed.records += len(latencies)
         all_latencies.append((label, latencies))
 
-    for label, latencies in all_latencies:
-        print(label)
-        print(np.min(latencies), np.max(latencies))
-        print("mean={}, p0={}, p50={}, p90={}, p99={}, len={}".format(
-            np.mean(latencies),
-            np.percentile(latencies, 0),
-            np.percentile(latencies, 50),
-            np.percentile(latencies, 90),
-            np.percentile(latencies, 99),
-            len(latencies)))
-    plot_latencies(all_latencies, save_filename)
+    with profiling.stage('aggregate') as aggregated:
+        for label, latencies in all_latencies:
+            aggregated.records += len(latencies)
+            print(label)
+            print(sketch.percentile(latencies, 0), sketch.percentile(latencies, 100))
+            print("mean={}, p0={}, p50={}, p90={}, p99={}, len={}".format(
+                sketch.mean(latencies),
+                sketch.percentile(latencies, 0),
+                sketch.percentile(latencies, 50),
+                sketch.percentile(latencies, 90),
+                sketch.percentile(latencies, 99),
+                len(latencies)))
+    with profiling.stage('render'):
+        plot_latencies(all_latencies, save_filename)
 
 
 if __name__ == '__main__':
@@ -107,11 +152,22 @@ if __name__ == '__main__':
     parser.add_argument(
             '--directory',
             type=str,
-            default='32-workers')
+            default='32-workers',
+            help="Directory or .tar.gz archive with the data files.")
     parser.add_argument(
             '--save-filename',
             type=str,
             default=None)
+    parser.add_argument(
+            '--sketch-error',
+            type=float,
+            default=None,
+            help="If set, summarize latencies in a fixed-memory sketch with this relative error instead of keeping every sample.")
+    aggregate.add_arguments(parser)
+    cache.add_arguments(parser)
+    profiling.add_arguments(parser)
     args = parser.parse_args()
+    cache.configure_from_args(args)
+    profiling.configure_from_args(args)
 
-    main(args.directory, args.save_filename)
+    main(args.directory, args.save_filename, args.sketch_error, args.memory_mb)
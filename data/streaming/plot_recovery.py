@@ -1,20 +1,43 @@
 import os
+import sys
 DIRECTORY = 'data'
 import csv
 import numpy as np
 import matplotlib.pyplot as plt
-from collections import defaultdict
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+from results import open_results
+from follow import newer_than_seen
+import aggregate
+import cache
+import changepoint
+import profiling
+import sketch
 
 
 START_X = 20
 END_X = 115
+# The published latencies during and after recovery are over the seconds
+# after FAILURE_TIME and before RECOVERY_TIME, and after RECOVERY_TIME. A
+# detected failure more than WINDOW_SLACK seconds away, or a recovery after
+# RECOVERY_TIME, is reported.
+FAILURE_TIME = 48
+RECOVERY_TIME = 100
+WINDOW_SLACK = 5
+
+# Bump this whenever the parsers below change, to invalidate cached results.
+PARSER_VERSION = 1
 
-def parse_latencies(filename, flink, flink_offset):
+@cache.columns('streaming-recovery-latency', PARSER_VERSION)
+def parse_latency_points(results, filename, flink):
+    # Returns the latency of each record from the first sink, along with the
+    # second since the start of the run that it was sent in.
     operator = None
-    points = defaultdict(list)
+    times = []
+    points = []
     first_timestamp = None
     max_timestamp = None
-    with open(filename, 'r') as f:
+    with results.open(filename) as f:
         reader = csv.DictReader(f)
         for row in reader:
             record_timestamp = row['timestamp']
@@ -45,27 +68,129 @@ def parse_latencies(filename, flink, flink_offset):
                 else:
                     current_time /= 1000
                 current_time = int(current_time)
-                if flink:
-                    current_time += flink_offset
-                if current_time > START_X and current_time < END_X:
-                    points[current_time].append(latency)
+                times.append(current_time)
+                points.append(latency)
             else:
                 break
-    means = []
-    for time, latencies in points.items():
-        median = np.median(latencies)
-        means.append((time, median, median - np.quantile(latencies, 0.25), np.quantile(latencies, 0.75) - median, latencies))
-    means.sort(key=lambda item: item[0])
+    return {
+        'time': np.array(times, dtype=np.int64),
+        'latency': np.array(points, dtype=np.float64),
+    }
+
+def group_quantile(sorted_values, starts, counts, q):
+    # np.quantile with linear interpolation, for each group of an array that
+    # has been sorted within each group. Interpolates the same way as NumPy so
+    # that the results are identical.
+    index = (counts - 1) * q
+    lower = np.floor(index).astype(np.int64)
+    upper = np.minimum(lower + 1, counts - 1)
+    t = index - lower
+    a = sorted_values[starts + lower]
+    b = sorted_values[starts + upper]
+    diff = b - a
+    return np.where(t >= 0.5, b - diff * (1 - t), a + diff * t)
+
+def group_mean(values, starts, counts):
+    # np.mean of each group of consecutive values. Groups with the same size
+    # are averaged together as the rows of a matrix, which sums them in the
+    # same order as np.mean does for a single group.
+    means = np.empty(len(starts))
+    for count in np.unique(counts):
+        groups = np.flatnonzero(counts == count)
+        rows = values[starts[groups, None] + np.arange(count)]
+        means[groups] = rows.mean(axis=1)
     return means
 
-def parse_throughputs(filename, flink, flink_offset):
+def parse_latencies(results, filename, flink, offset):
+    # offset is added to every second, to line up the failures of different
+    # systems.
+    columns = parse_latency_points(results, filename, flink)
+    times = columns['time'] + offset
+    latencies = columns['latency']
+    in_window = (times > START_X) & (times < END_X)
+    times = times[in_window]
+    latencies = latencies[in_window]
+
+    # Group the records by second, keeping them in their original order
+    # within each second.
+    order = np.argsort(times, kind='stable')
+    times = times[order]
+    latencies = latencies[order]
+    seconds, starts, counts = np.unique(times, return_index=True, return_counts=True)
+    sorted_latencies = latencies[np.lexsort((latencies, times))]
+    medians = (sorted_latencies[starts + (counts - 1) // 2] + sorted_latencies[starts + counts // 2]) / 2
+    quantile_1 = group_quantile(sorted_latencies, starts, counts, 0.25)
+    quantile_3 = group_quantile(sorted_latencies, starts, counts, 0.75)
+    return list(zip(seconds.tolist(),
+                    medians.tolist(),
+                    (medians - quantile_1).tolist(),
+                    (quantile_3 - medians).tolist(),
+                    np.split(latencies, starts[1:])))
+
+def sketch_latencies(results, filename, flink, offset, error, memory_mb=aggregate.MEMORY_MB):
+    # Like parse_latencies, but reads the file in chunks and folds each one
+    # into a sketch per second instead of keeping every record, so memory does
+    # not grow with the size of the file. Each row ends with its second's
+    # sketch in place of the latencies.
+    bins = aggregate.SecondBins(error)
     operator = None
+    with results.open(filename, 'rb') as f:
+        in_seconds = aggregate.timestamps_in_seconds(f)
+        chunks = aggregate.read_csv_chunks(
+            f, {'sink_id': str, 'timestamp': np.float64, 'latency': np.float64}, memory_mb)
+        for chunk in chunks:
+            sink_ids = chunk['sink_id'].values
+            timestamps = chunk['timestamp'].values
+            latencies = chunk['latency'].values
+            if operator is None:
+                operator = sink_ids[0]
+                first_timestamp = timestamps[0]
+                max_timestamp = first_timestamp
+
+            # Stop at the first record from another sink.
+            other = np.flatnonzero(sink_ids != operator)
+            done = len(other) > 0
+            if done:
+                timestamps = timestamps[:other[0]]
+                latencies = latencies[:other[0]]
+
+            if flink and len(timestamps):
+                # Skip Flink records replayed during recovery.
+                newer, max_timestamp = newer_than_seen(timestamps, max_timestamp)
+                timestamps = timestamps[newer]
+                latencies = latencies[newer]
+            times = timestamps - first_timestamp
+            if in_seconds:
+                latencies = latencies * 1000
+            else:
+                times /= 1000
+            times = times.astype(np.int64) + offset
+            in_window = (times > START_X) & (times < END_X)
+            bins.add(times[in_window], latencies[in_window])
+            if done:
+                break
+
+    rows = []
+    for second in bins.seconds():
+        latency_sketch = bins[second]
+        quantile_1, median, quantile_3 = latency_sketch.percentile([25, 50, 75])
+        rows.append((second, median, median - quantile_1, quantile_3 - median, latency_sketch))
+    return rows
+
+@cache.columns('streaming-recovery-throughput', PARSER_VERSION)
+def parse_throughput_points(results, filename):
+    # Returns the throughput reported in each record, along with the sink
+    # that reported it and the second since the sink started.
+    operator = None
+    operator_ids = {}
+    operators = []
+    times = []
+    points = []
     first_timestamp = None
     max_timestamp = None
 
-    with open(filename, 'r') as f:
+    with results.open(filename) as f:
         reader = csv.DictReader(f)
-        operator_throughputs = defaultdict(lambda: defaultdict(list))
         for row in reader:
             timestamp = row['cur_time']
             in_seconds = '.' in timestamp
@@ -90,37 +215,77 @@ def parse_throughputs(filename, flink, flink_offset):
                     timestamp /= 1000
                 timestamp = int(timestamp)
                 throughput = float(row['throughput'])
-                if flink:
-                    timestamp += flink_offset
-                if timestamp > START_X and timestamp < END_X:
-                    operator_throughputs[operator][timestamp].append(throughput)
-    throughputs = defaultdict(int)
-    for operator_id, operator_throughput in operator_throughputs.items():
-        operator_throughput = dict((timestamp, np.mean(tputs)) for timestamp, tputs in operator_throughput.items())
-        # Find the missing timestamps for this operator.
-        min_timestamp = min(operator_throughput)
-        max_timestamp = max(operator_throughput)
-        missing_timestamps = []
-        for timestamp in range(min_timestamp, max_timestamp + 1):
-            if timestamp not in operator_throughput:
-                missing_timestamps.append(timestamp)
-        # Fill out the missing throughputs.
-        for timestamp in missing_timestamps:
-            # If either the timestamp before or after is also missing, then this operator was down.
-            # Otherwise, we just missed a throughput measurement when logging.
-            if timestamp - 1 in missing_timestamps or timestamp + 1 in missing_timestamps:
-                operator_throughput[timestamp] = 0
-            else:
-                operator_throughput[timestamp] = np.mean((operator_throughput[timestamp - 1],
-                                                        operator_throughput[timestamp + 1]))
+                operators.append(operator_ids.setdefault(operator, len(operator_ids)))
+                times.append(timestamp)
+                points.append(throughput)
+    return {
+        'operator': np.array(operators, dtype=np.int64),
+        'time': np.array(times, dtype=np.int64),
+        'throughput': np.array(points, dtype=np.float64),
+    }
 
-        for timestamp, tput in operator_throughput.items():
-            throughputs[timestamp] += np.mean(tput)
+def parse_throughputs(results, filename, flink, offset):
+    columns = parse_throughput_points(results, filename)
+    operators = columns['operator']
+    timestamps = columns['time'] + offset
+    in_window = (timestamps > START_X) & (timestamps < END_X)
+    operators = operators[in_window]
+    timestamps = timestamps[in_window]
+    tputs = columns['throughput'][in_window]
+    if len(tputs) == 0:
+        return []
 
+    # Number the operators in the order that they first report a throughput.
+    operator_ids, first_index = np.unique(operators, return_index=True)
+    ranks = np.empty(len(operator_ids), dtype=np.int64)
+    ranks[np.argsort(first_index)] = np.arange(len(operator_ids))
+    operators = ranks[np.searchsorted(operator_ids, operators)]
 
-    throughputs = list(throughputs.items())
-    throughputs.sort(key=lambda item: item[0])
-    return throughputs
+    # Mean throughput per operator per second.
+    order = np.lexsort((timestamps, operators))
+    operators = operators[order]
+    timestamps = timestamps[order]
+    tputs = tputs[order]
+    new_group = np.ones(len(order), dtype=bool)
+    new_group[1:] = (operators[1:] != operators[:-1]) | (timestamps[1:] != timestamps[:-1])
+    starts = np.flatnonzero(new_group)
+    counts = np.diff(np.append(starts, len(order)))
+    means = group_mean(tputs, starts, counts)
+    operators = operators[starts]
+    timestamps = timestamps[starts]
+
+    # Lay out each operator's seconds from its first to its last timestamp.
+    num_operators = len(operator_ids)
+    min_timestamps = np.full(num_operators, END_X)
+    max_timestamps = np.full(num_operators, START_X)
+    np.minimum.at(min_timestamps, operators, timestamps)
+    np.maximum.at(max_timestamps, operators, timestamps)
+    lengths = max_timestamps - min_timestamps + 1
+    offsets = np.concatenate([[0], np.cumsum(lengths)[:-1]])
+    operator_throughputs = np.zeros(lengths.sum())
+    missing = np.ones(lengths.sum(), dtype=bool)
+    index = offsets[operators] + timestamps - min_timestamps[operators]
+    operator_throughputs[index] = means
+    missing[index] = False
+
+    # Fill out the missing throughputs. Each operator's first and last seconds
+    # are never missing, so neighbours never cross into another operator.
+    # If either the timestamp before or after is also missing, then this operator was down.
+    # Otherwise, we just missed a throughput measurement when logging.
+    gaps = np.flatnonzero(missing)
+    down = missing[gaps - 1] | missing[gaps + 1]
+    operator_throughputs[gaps] = np.where(down, 0, (operator_throughputs[gaps - 1] + operator_throughputs[gaps + 1]) / 2)
+
+    # Sum over the operators, in order.
+    throughputs = np.zeros(END_X - START_X + 1)
+    covered = np.zeros(END_X - START_X + 1, dtype=bool)
+    for operator in range(num_operators):
+        start = min_timestamps[operator] - START_X
+        end = start + lengths[operator]
+        throughputs[start:end] += operator_throughputs[offsets[operator]:offsets[operator] + lengths[operator]]
+        covered[start:end] = True
+    seconds = np.flatnonzero(covered)
+    return list(zip((seconds + START_X).tolist(), throughputs[seconds].tolist()))
 
 def plot_latencies(rows, save_filename):
     fig, ax = plt.subplots()
@@ -167,35 +332,72 @@ def plot_throughputs(rows, save_filename):
         plt.show()
 
 
-def split_latencies(all_latencies):
-    failure_time = 48
-    recovery_time = 100
+def detect_recovery(latencies, throughputs):
+    # Returns the second at which the failure started and the second by which
+    # the system recovered, or None if no failure was found. The failure is
+    # the block of seconds where throughput changed. Latency can stay high
+    # for a while after throughput recovers, while the backlog is processed,
+    # so recovery ends when the latency also settles. The backlog shows in
+    # the tail of each second's latencies, not in the median, so this looks
+    # at the mean.
+    seconds = np.array([second for second, _ in throughputs], dtype=np.int64)
+    block = changepoint.failure_block([throughput for _, throughput in throughputs])
+    if block is None:
+        return None
+    start, end = block
+    failure_time = seconds[start]
+    recovery_time = seconds[end] if end < len(seconds) else seconds[-1] + 1
+
+    latency_seconds = np.array([row[0] for row in latencies], dtype=np.int64)
+    means = np.array([sketch.mean(row[4]) for row in latencies], dtype=np.float64)
+    after = latency_seconds >= failure_time
+    means = means[after]
+    shift = changepoint.level_shift(means, log=True)
+    if shift is not None and means[:shift].mean() > means[shift:].mean():
+        shift = changepoint.settled(means, shift)
+        recovery_time = max(recovery_time, latency_seconds[after][shift])
+    return int(failure_time), int(recovery_time)
+
+def split_latencies(all_latencies, failure_time, recovery_time):
+    # The seconds of the failure and of the recovery themselves are in
+    # neither.
     failure_latencies = []
     normal_latencies = []
     for timestamp, _, _, _, latencies in all_latencies:
         if timestamp > failure_time and timestamp < recovery_time:
-            failure_latencies += latencies
+            failure_latencies.append(latencies)
         if timestamp > recovery_time:
-            normal_latencies += latencies
-    return failure_latencies, normal_latencies
-
-def main(directory, save_filename, flink_offset):
-    flink_filename = None
-    lineage_stash_filename = None
-    writefirst_filename = None
-    for filename in os.listdir(directory):
-        if filename.startswith('failure-flink-latency'):
-            if flink_filename is not None:
-                print("WARNING: multiple Flink filenames found, skipping {}".format(flink_filename))
-            flink_filename = os.path.join(directory, filename)
-        elif filename.startswith('failure-latency'):
-            if lineage_stash_filename is None:
-                print("WARNING: multiple lineage stash filenames found, skipping {}".format(lineage_stash_filename))
-            lineage_stash_filename = os.path.join(directory, filename)
-        elif filename.startswith('writefirst-failure-latency'):
-            if writefirst_filename is None:
-                print("WARNING: multiple WriteFirst filenames found, skipping {}".format(writefirst_filename))
-            writefirst_filename = os.path.join(directory, filename)
+            normal_latencies.append(latencies)
+    return combine_latencies(failure_latencies), combine_latencies(normal_latencies)
+
+def combine_latencies(groups):
+    # Concatenates the latencies of several seconds, or merges their
+    # sketches.
+    if groups and isinstance(groups[0], sketch.LatencySketch):
+        return aggregate.merge(groups, groups[0].error)
+    return np.concatenate([np.array([])] + groups)
+
+def main(directory, save_filename, flink_offset=None, sketch_error=None, memory_mb=aggregate.MEMORY_MB,
+         detected_window=False):
+    with profiling.stage('list') as listed:
+        results = open_results(directory)
+        flink_filename = None
+        lineage_stash_filename = None
+        writefirst_filename = None
+        for filename in results.listdir():
+            listed.records += 1
+            if filename.startswith('failure-flink-latency'):
+                if flink_filename is not None:
+                    print("WARNING: multiple Flink filenames found, skipping {}".format(flink_filename))
+                flink_filename = filename
+            elif filename.startswith('failure-latency'):
+                if lineage_stash_filename is None:
+                    print("WARNING: multiple lineage stash filenames found, skipping {}".format(lineage_stash_filename))
+                lineage_stash_filename = filename
+            elif filename.startswith('writefirst-failure-latency'):
+                if writefirst_filename is None:
+                    print("WARNING: multiple WriteFirst filenames found, skipping {}".format(writefirst_filename))
+                writefirst_filename = filename
 
     flink_throughput_filename = flink_filename.replace('latency', 'throughput')
     lineage_stash_throughput_filename = lineage_stash_filename.replace('latency', 'throughput')
@@ -215,22 +417,72 @@ def main(directory, save_filename, flink_offset):
         lineage_stash_throughput_filename,
         False),
     ]
+    def parse(latency_filename, throughput_filename, is_flink, offset):
+        with profiling.stage('parse') as parsed:
+            if sketch_error is None:
+                latencies = parse_latencies(results, latency_filename, is_flink, offset)
+            else:
+                latencies = sketch_latencies(results, latency_filename, is_flink, offset,
+                                             sketch_error, memory_mb)
+            throughputs = parse_throughputs(results, throughput_filename, is_flink, offset)
+            parsed.records += sum(len(row[4]) for row in latencies)
+        return latencies, throughputs
+
+    # Find each system's failure, then shift the systems so that their
+    # failures line up with the lineage stash's.
+    parsed = {}
+    recoveries = {}
+    for label, latency_filename, throughput_filename, is_flink in FILENAMES:
+        parsed[label] = parse(latency_filename, throughput_filename, is_flink, 0)
+        with profiling.stage('detect') as detected:
+            recoveries[label] = detect_recovery(*parsed[label])
+            detected.records += len(parsed[label][0]) + len(parsed[label][1])
+    if flink_offset is None:
+        offsets = changepoint.align(dict((label, recovery and recovery[0])
+                                         for label, recovery in recoveries.items()), 'Lineage stash')
+    else:
+        offsets = dict((label, flink_offset if is_flink else 0) for label, _, _, is_flink in FILENAMES)
+
     stats = []
     for label, latency_filename, throughput_filename, is_flink in FILENAMES:
-        latencies = parse_latencies(latency_filename, is_flink, flink_offset)
+        latencies, throughputs = parsed[label]
+        if offsets[label] != 0:
+            latencies, throughputs = parse(latency_filename, throughput_filename, is_flink, offsets[label])
+            if recoveries[label] is not None:
+                recoveries[label] = tuple(t + offsets[label] for t in recoveries[label])
         print(label, len(latencies), "latency samples")
-        throughputs = parse_throughputs(throughput_filename, is_flink, flink_offset)
         stats.append((label, latencies, throughputs))
 
-    plot_latencies(stats, save_filename)
-    plot_throughputs(stats, save_filename)
+    with profiling.stage('render'):
+        plot_latencies(stats, save_filename)
+        plot_throughputs(stats, save_filename)
 
-    for label, latency, _ in stats:
-        failure_latencies, normal_latencies = split_latencies(latency)
-        print(label, "mean latency during recovery:", np.mean(failure_latencies))
-        print(label, "mean latency during execution:", np.mean(normal_latencies))
-        print(label, "max latency:", np.max(failure_latencies))
-        print(label, "min latency:", np.min(normal_latencies))
+    with profiling.stage('aggregate') as aggregated:
+        for label, latency, _ in stats:
+            if recoveries[label] is None:
+                print(label, "no failure detected")
+                if detected_window:
+                    continue
+            else:
+                print(label, "offset:", offsets[label], "failure at:", recoveries[label][0],
+                      "recovered at:", recoveries[label][1])
+            failure_time, recovery_time = FAILURE_TIME, RECOVERY_TIME
+            if detected_window:
+                failure_time, recovery_time = recoveries[label]
+            elif recoveries[label] is not None and (
+                    abs(recoveries[label][0] - FAILURE_TIME) > WINDOW_SLACK or
+                    recoveries[label][1] > RECOVERY_TIME):
+                print("WARNING: {} failed at {} and recovered at {}, which the window from {} to {} "
+                      "does not match. See --detected-window.".format(
+                          label, recoveries[label][0], recoveries[label][1], FAILURE_TIME, RECOVERY_TIME))
+            failure_latencies, normal_latencies = split_latencies(latency, failure_time, recovery_time)
+            aggregated.records += len(failure_latencies) + len(normal_latencies)
+            if len(failure_latencies) == 0 or len(normal_latencies) == 0:
+                continue
+            print(label, "mean latency during recovery:", sketch.mean(failure_latencies))
+            print(label, "mean latency during execution:", sketch.mean(normal_latencies))
+            print(label, "max latency:", sketch.maximum(failure_latencies))
+            print(label, "min latency:", sketch.minimum(normal_latencies))
 
 
 if __name__ == '__main__':
@@ -239,16 +491,32 @@ if __name__ == '__main__':
     parser.add_argument(
             '--directory',
             type=str,
-            default='32-workers')
+            default='32-workers',
+            help="Directory or .tar.gz archive with the data files.")
     parser.add_argument(
             '--flink-offset',
             type=int,
-            default=0,
-            help="When plotting, the amount to offset Flink by. This is used to align the plots since the nodes do not fail at exactly the specified time.")
+            default=None,
+            help="When plotting, the amount to offset Flink by. By default, the failures are detected and the systems aligned automatically.")
     parser.add_argument(
             '--save-filename',
             type=str,
             default=None)
+    parser.add_argument(
+            '--sketch-error',
+            type=float,
+            default=None,
+            help="If set, summarize each second's latencies in a fixed-memory sketch with this relative error instead of keeping every sample.")
+    parser.add_argument(
+            '--detected-window',
+            action='store_true',
+            help="Summarize the latencies during and after recovery from each system's detected failure and recovery, instead of seconds {} to {}.".format(FAILURE_TIME, RECOVERY_TIME))
+    aggregate.add_arguments(parser)
+    cache.add_arguments(parser)
+    profiling.add_arguments(parser)
     args = parser.parse_args()
+    cache.configure_from_args(args)
+    profiling.configure_from_args(args)
 
-    main(args.directory, args.save_filename, args.flink_offset)
+    main(args.directory, args.save_filename, args.flink_offset, args.sketch_error, args.memory_mb,
+         args.detected_window)
@@ -0,0 +1,440 @@
+# Synthetic experiment results, with the same file names and formats as the
+# real runs, for exercising the scripts at cluster sizes and run lengths that
+# we have no data for. The amount of data in each file grows with the number
+# of workers in the same way as in the real experiments.
+#
+# Runs can include a warmup period with higher latencies, a failure followed
+# by recovery, and seconds in which nothing was logged. Each file is written
+# by its own task, with a seed derived from its name, so the files are the
+# same no matter how many processes write them:
+#   python synthetic.py --directory 1024-workers --workers 1024 --jobs 16
+import os
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+
+DATE = '19-08-26-03-20-32'
+STREAMING_DATE = 'Aug-14-01-40-37'
+
+KINDS = ['streaming', 'microbenchmark-latency', 'microbenchmark-lineage', 'allreduce', 'mpi']
+
+# Every num_float32 size that the allreduce benchmarks were run with.
+ALLREDUCE_SIZES = [2500000, 25000000, 250000000]
+ALLREDUCE_ITERATIONS = 100
+ALLREDUCE_FAILURE_ITERATIONS = 300
+# MPI checkpoints every CHECKPOINT_INTERVAL iterations and rolls back to the
+# last checkpoint after a failure.
+CHECKPOINT_INTERVAL = 150
+
+STREAMING_START = 1565746862.143224
+# Flink checkpoints every 30s and replays the records since the last
+# checkpoint after a failure.
+FLINK_CHECKPOINT_SECONDS = 30
+
+
+def file_seed(seed, filename):
+    return (seed + zlib.crc32(filename.encode())) % (2 ** 32)
+
+
+def format_rows(fmt, columns):
+    if not len(columns[0]):
+        return ''
+    return '\n'.join(fmt % row for row in zip(*columns)) + '\n'
+
+
+def write_rows(path, header, fmt, columns):
+    with open(path, 'w') as f:
+        if header is not None:
+            f.write(header + '\n')
+        f.write(format_rows(fmt, columns))
+
+
+def sink_ids(num_sinks, flink):
+    # Flink sinks are numbered by worker. Ray names its sinks with letters,
+    # e.g. AM, AN.
+    if flink:
+        return [str(i) for i in range(num_sinks)]
+    letters = 'ABCDEFGHIJKLMNOPQRSTUVWXYZ'
+    ids = []
+    for i in range(num_sinks):
+        sink_id = ''
+        i += len(letters)
+        while i:
+            i, j = divmod(i, len(letters))
+            sink_id = letters[j] + sink_id
+        ids.append(sink_id)
+    return ids
+
+
+def streaming_filename(system, metric, num_workers, failure):
+    # system is one of 'flink', 'writefirst' or 'lineage-stash'.
+    tput = 8000 * num_workers
+    if system == 'flink':
+        suffix = '{}-workers-{}-tput-'.format(num_workers, tput)
+    else:
+        suffix = '{}-workers-8-shards-1000-batch-{}-tput-'.format(num_workers, tput)
+    if failure:
+        suffix += '{}-checkpoint-'.format(FLINK_CHECKPOINT_SECONDS)
+    name = metric + '-' + suffix + STREAMING_DATE + '.csv'
+    if system == 'flink':
+        name = 'flink-' + name
+    if failure:
+        name = 'failure-' + name
+    if system == 'writefirst':
+        name = 'writefirst-' + name
+    return name
+
+
+def streaming_sink(rng, flink, duration, rate, warmup_seconds, failure_time,
+                   recovery_seconds, missing_seconds):
+    # Returns the (timestamp, cur_time) of each record that one sink logs, in
+    # log order, with times in seconds since the start of the run.
+    timestamps = np.sort(rng.uniform(0, duration, int(duration * rate)))
+    latencies = rng.lognormal(np.log(0.15), 0.3, len(timestamps))
+    if warmup_seconds:
+        # Latencies start out higher and settle by the end of the warmup.
+        warmup = np.clip(1 - timestamps / warmup_seconds, 0, 1)
+        latencies *= 1 + 4 * warmup
+    cur_times = timestamps + latencies
+    if failure_time is not None:
+        # Records sent while the failed worker recovers are delivered once it
+        # is back.
+        recovered = failure_time + recovery_seconds
+        failed = (cur_times >= failure_time) & (timestamps < recovered)
+        cur_times[failed] = recovered + rng.exponential(0.5, failed.sum())
+        if flink:
+            # Flink also replays every record since its last checkpoint.
+            checkpoint = failure_time - failure_time % FLINK_CHECKPOINT_SECONDS
+            replayed = (timestamps >= checkpoint) & (timestamps < failure_time)
+            timestamps = np.append(timestamps, timestamps[replayed])
+            cur_times = np.append(cur_times, recovered + rng.exponential(0.5, replayed.sum()))
+    if missing_seconds:
+        logged = ~np.isin(np.floor(cur_times).astype(np.int64), missing_seconds)
+        timestamps = timestamps[logged]
+        cur_times = cur_times[logged]
+    order = np.argsort(cur_times, kind='stable')
+    return timestamps[order], cur_times[order]
+
+
+def write_streaming_file(path, system, metric, num_workers, duration, rate, warmup_seconds,
+                         failure_time, recovery_seconds, missing_seconds, seed):
+    rng = np.random.RandomState(seed)
+    flink = system == 'flink'
+    with open(path, 'w') as f:
+        f.write('sink_id,timestamp,cur_time,{}\n'.format(metric))
+        for sink_id in sink_ids(num_workers, flink):
+            timestamps, cur_times = streaming_sink(
+                rng, flink, duration, rate, warmup_seconds, failure_time,
+                recovery_seconds, missing_seconds)
+            if metric == 'throughput':
+                # Sinks log their throughput about twice a second, about the
+                # latest record they have seen.
+                reports = np.unique(np.searchsorted(cur_times, np.arange(0, duration, 0.5)))
+                reports = reports[reports < len(cur_times)]
+                timestamps = timestamps[reports]
+                cur_times = cur_times[reports]
+                values = rng.normal(8000 / 2.0, 200, len(reports))
+                if flink:
+                    # Flink's first report covers a single record.
+                    values[0] = 1
+            else:
+                values = cur_times - timestamps
+            timestamps = STREAMING_START + timestamps
+            cur_times = STREAMING_START + cur_times
+            if flink:
+                # Flink logs integer milliseconds.
+                timestamps = (timestamps * 1000).astype(np.int64)
+                cur_times = (cur_times * 1000).astype(np.int64)
+                if metric == 'latency':
+                    values = cur_times - timestamps
+                columns = [timestamps, cur_times, values.astype(np.int64)]
+                fmt = sink_id + ',%d,%d,%d'
+            else:
+                columns = [timestamps, cur_times, values]
+                fmt = sink_id + ',%.6f,%.6f,%.6f'
+            f.write(format_rows(fmt, columns))
+
+
+def streaming_tasks(directory, num_workers, duration=120, rate=100, warmup_seconds=35,
+                    failure_time=48, recovery_seconds=10, missing_seconds=(), seed=0):
+    # The runs that plot_latency_cdf.py and plot_recovery.py read: each
+    # system with and without a failure.
+    tasks = []
+    for system in ['flink', 'writefirst', 'lineage-stash']:
+        for failure in [False, True]:
+            for metric in ['latency', 'throughput']:
+                filename = streaming_filename(system, metric, num_workers, failure)
+                tasks.append((write_streaming_file, (
+                    os.path.join(directory, filename), system, metric, num_workers,
+                    duration, rate, warmup_seconds, failure_time if failure else None,
+                    recovery_seconds, list(missing_seconds), file_seed(seed, filename))))
+    return tasks
+
+
+def microbenchmark_labels(num_workers):
+    # The same configurations as the 64-worker runs in the repo, as
+    # (shards, gcs, gcsdelay, nondeterminism, task, failures).
+    labels = []
+    for gcsdelay in [0, 1, 5]:
+        labels.append((1, 0, gcsdelay, 0, 0, 1))
+        labels.append((1, 0, gcsdelay, 1, 0, -1))
+        labels.append((1, 0, gcsdelay, 1, 0, num_workers // 8))
+    for gcsdelay in [0, 1, 5]:
+        for nondeterminism in [0, 1]:
+            labels.append((1, 1, gcsdelay, nondeterminism, 0, 1))
+    return labels
+
+
+def write_microbenchmark_latency_file(path, num_workers, gcsdelay, failures, tasks_per_worker,
+                                      warmup_tasks, recovery_seconds, seed):
+    rng = np.random.RandomState(seed)
+    latencies = rng.lognormal(np.log(1 + gcsdelay), 0.5, num_workers * tasks_per_worker)
+    if warmup_tasks:
+        latencies[:warmup_tasks * num_workers] *= 3
+    if failures > 0:
+        # The task that was running on each failed worker is re-executed.
+        failed = rng.choice(len(latencies), min(failures, len(latencies)), replace=False)
+        latencies[failed] += recovery_seconds * 1000 * rng.rand(len(failed))
+    write_rows(path, 'latency', '%.6g', [latencies])
+
+
+def microbenchmark_latency_tasks(directory, num_workers, tasks_per_worker=100, warmup_tasks=0,
+                                 recovery_seconds=1, seed=0):
+    tasks = []
+    for shards, gcs, gcsdelay, nondeterminism, task, failures in microbenchmark_labels(num_workers):
+        filename = 'latency-{}-workers-{}-shards-{}-gcs-{}-gcsdelay-{}-nondeterminism-{}-task-{}-failures-{}.csv'.format(
+            num_workers, shards, gcs, gcsdelay, nondeterminism, task, failures, DATE)
+        tasks.append((write_microbenchmark_latency_file, (
+            os.path.join(directory, filename), num_workers, gcsdelay, failures,
+            tasks_per_worker, warmup_tasks, recovery_seconds, file_seed(seed, filename))))
+    return tasks
+
+
+def write_microbenchmark_lineage_file(path, num_workers, task, samples_per_worker, seed):
+    rng = np.random.RandomState(seed)
+    workers = ['172.30.{}.{}'.format(i // 256, i % 256) for i in range(num_workers)]
+    timestamps = 1566775781399 + 100 * np.arange(samples_per_worker)
+    num_tasks = rng.poisson(50 + task, (num_workers, samples_per_worker))
+    sizes = rng.poisson(1 + task, (num_workers, samples_per_worker))
+    write_rows(path, 'worker,timestamp,num_tasks,uncommitted_lineage', '%s,%d,%d,%d',
+               [np.repeat(workers, samples_per_worker), np.tile(timestamps, num_workers),
+                num_tasks.ravel(), sizes.ravel()])
+
+
+def microbenchmark_lineage_tasks(directory, num_workers, samples_per_worker=64, seed=0):
+    tasks = []
+    for task in [0, 1, 2, 5, 10, 20, 50, 100]:
+        for failures in [-1, 8, 16, 32]:
+            filename = 'lineage-{}-workers-1-shards-0-gcs-100-gcsdelay-1-nondeterminism-{:03d}-task-{}-failures-{}.csv'.format(
+                num_workers, task, failures, DATE)
+            tasks.append((write_microbenchmark_lineage_file, (
+                os.path.join(directory, filename), num_workers, task, samples_per_worker,
+                file_seed(seed, filename))))
+    return tasks
+
+
+def iteration_times(rng, mean, stddev, num_iterations, warmup_iterations, failure_iteration,
+                    recovery_seconds):
+    times = np.abs(rng.normal(mean, stddev, num_iterations))
+    times[:warmup_iterations] *= 3
+    if failure_iteration is not None and failure_iteration < num_iterations:
+        times[failure_iteration] += recovery_seconds
+    return times
+
+
+def write_finished_log(path, num_workers, mean, num_iterations, warmup_iterations,
+                       failure_iteration, recovery_seconds, seed):
+    # A Ray worker log with the benchmark's command line, a line per worker
+    # as it connects and one "Finished" line per iteration.
+    rng = np.random.RandomState(seed)
+    times = iteration_times(rng, mean, 0.02, num_iterations, warmup_iterations,
+                            failure_iteration, recovery_seconds)
+    with open(path, 'w') as f:
+        f.write('python allreduce.py --num-workers {}\n'.format(num_workers))
+        f.writelines('2019-08-14 20:10:56,720\tINFO worker.py:1495 -- Connected to worker {}\n'.format(i)
+                     for i in range(num_workers))
+        f.write(format_rows('INFO:__main__:Finished in %.6f', [times]))
+
+
+def write_mpi_log(path, num_workers, mean, num_iterations, warmup_iterations,
+                  failure_iteration, recovery_seconds, seed):
+    # An mpi-latency log: the command line, a greeting per rank and then
+    # "<step>,<ms>,<time>" per allreduce. After a failure, MPI restarts from
+    # its last checkpoint and logs those steps again.
+    rng = np.random.RandomState(seed)
+    steps = np.arange(num_iterations)
+    if failure_iteration is not None and failure_iteration < num_iterations:
+        checkpoint = failure_iteration - failure_iteration % CHECKPOINT_INTERVAL
+        steps = np.concatenate([np.arange(failure_iteration + 1), np.arange(checkpoint, num_iterations)])
+    millis = iteration_times(rng, mean * 1000, 2, len(steps), warmup_iterations, None, 0)
+    if failure_iteration is not None and failure_iteration < num_iterations:
+        millis[failure_iteration + 1] += recovery_seconds * 1000
+    times = 1565812465678 + np.cumsum(millis).astype(np.int64)
+    with open(path, 'w') as f:
+        f.write('/usr/bin/mpiexec.openmpi -np {} -N 1 ./allreduce\n'.format(num_workers))
+        f.writelines('Hello world from processor worker-{0}, rank {0} out of {1} processors\n'.format(i, num_workers)
+                     for i in range(num_workers))
+        f.write('Starting from round 0\n' * num_workers)
+        f.write(format_rows('%d,%.6f,%d', [steps, millis, times]))
+
+
+def allreduce_tasks(directory, num_workers, warmup_iterations=0, failure_iteration=280,
+                    recovery_seconds=20, seed=0):
+    # Lineage stash and MPI allreduce logs for every size, plus the failure
+    # runs that plot_allreduce_recovery.py reads.
+    tasks = []
+    for size in ALLREDUCE_SIZES:
+        mean = size * 4 / 1e9 + 0.3
+        for gcs in [0, 1]:
+            for gcsdelay in [0, 5]:
+                filename = 'latency-{}-workers-1-shards-{}-gcs-{}-gcsdelay-{}-bytes-{}.txt'.format(
+                    num_workers, gcs, gcsdelay, size, DATE)
+                tasks.append((write_finished_log, (
+                    os.path.join(directory, filename), num_workers, mean, ALLREDUCE_ITERATIONS,
+                    warmup_iterations, None, 0, file_seed(seed, filename))))
+        filename = 'mpi-latency-{}-workers-{}-bytes-{}.txt'.format(num_workers, size, DATE)
+        tasks.append((write_mpi_log, (
+            os.path.join(directory, filename), num_workers, mean - 0.24, ALLREDUCE_ITERATIONS,
+            warmup_iterations, None, 0, file_seed(seed, filename))))
+
+    size = ALLREDUCE_SIZES[1]
+    mean = size * 4 / 1e9 + 0.4
+    for gcs in [0, 1]:
+        filename = 'failure-latency-{}-workers-1-shards-{}-gcs-0-gcsdelay-{}-bytes-{}.txt'.format(
+            num_workers, gcs, size, DATE)
+        tasks.append((write_finished_log, (
+            os.path.join(directory, filename), num_workers, mean, ALLREDUCE_FAILURE_ITERATIONS,
+            warmup_iterations, failure_iteration, recovery_seconds, file_seed(seed, filename))))
+    filename = 'failure-mpi-latency-{}-workers-{}-bytes-{}.txt'.format(num_workers, size, DATE)
+    tasks.append((write_mpi_log, (
+        os.path.join(directory, filename), num_workers, mean, ALLREDUCE_FAILURE_ITERATIONS,
+        warmup_iterations, failure_iteration, recovery_seconds * 3, file_seed(seed, filename))))
+    return tasks
+
+
+def write_mpi_results(path, num_workers, runs_per_size, seed):
+    # The per-node results that mpi-bench/gen_stats.py summarizes: one row
+    # per run for every size and every cluster size up to num_workers.
+    rng = np.random.RandomState(seed)
+    columns = [[], [], []]
+    num_nodes = 2
+    while num_nodes <= num_workers:
+        for size in ALLREDUCE_SIZES:
+            columns[0].append(np.full(runs_per_size, num_nodes))
+            columns[1].append(np.full(runs_per_size, size))
+            columns[2].append(rng.normal(size * 4 / 1e6 + num_nodes, 2, runs_per_size))
+        num_nodes *= 2
+    write_rows(path, 'num_nodes,num_float32,millis', '%d,%d,%.3f',
+               [np.concatenate(column) for column in columns])
+
+
+def mpi_tasks(directory, num_workers, runs_per_size=100, seed=0):
+    filename = 'mpi-results-pernode.txt'
+    return [(write_mpi_results, (os.path.join(directory, filename), num_workers, runs_per_size,
+                                 file_seed(seed, filename)))]
+
+
+def _run(task):
+    write, args = task
+    write(*args)
+    return args[0]
+
+
+def run_tasks(tasks, jobs=1):
+    # Write the files in `jobs` processes. Returns the paths that were written.
+    if jobs <= 1:
+        return [_run(task) for task in tasks]
+    with ProcessPoolExecutor(jobs) as pool:
+        return list(pool.map(_run, tasks))
+
+
+def generate(directory, num_workers, kinds=KINDS, jobs=1, seed=0, duration=120, rate=100,
+             warmup_seconds=35, failure_time=48, recovery_seconds=10, missing_seconds=()):
+    # Write every kind of result for one cluster size into a subdirectory of
+    # `directory` per kind. The streaming failure and recovery times are in
+    # seconds; the allreduce failure runs fail at iteration 280 and take
+    # twice the streaming recovery time to recover.
+    tasks = []
+    for kind in kinds:
+        kind_dir = os.path.join(directory, kind)
+        if not os.path.isdir(kind_dir):
+            os.makedirs(kind_dir)
+        if kind == 'streaming':
+            tasks += streaming_tasks(kind_dir, num_workers, duration, rate, warmup_seconds,
+                                     failure_time, recovery_seconds, missing_seconds, seed)
+        elif kind == 'microbenchmark-latency':
+            tasks += microbenchmark_latency_tasks(kind_dir, num_workers, seed=seed)
+        elif kind == 'microbenchmark-lineage':
+            tasks += microbenchmark_lineage_tasks(kind_dir, num_workers, seed=seed)
+        elif kind == 'allreduce':
+            tasks += allreduce_tasks(kind_dir, num_workers, recovery_seconds=2 * recovery_seconds, seed=seed)
+        elif kind == 'mpi':
+            tasks += mpi_tasks(kind_dir, num_workers, seed=seed)
+    return run_tasks(tasks, jobs)
+
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(description='Generate synthetic results.')
+    parser.add_argument(
+            '--directory',
+            type=str,
+            required=True,
+            help="Directory to write the results to, with a subdirectory per kind.")
+    parser.add_argument(
+            '--workers',
+            type=int,
+            default=64)
+    parser.add_argument(
+            '--kinds',
+            type=str,
+            nargs='+',
+            default=KINDS,
+            choices=KINDS)
+    parser.add_argument(
+            '--duration',
+            type=int,
+            default=120,
+            help="Length of the streaming runs in seconds.")
+    parser.add_argument(
+            '--rate',
+            type=float,
+            default=100,
+            help="Latency records logged per second by each streaming sink.")
+    parser.add_argument(
+            '--warmup-seconds',
+            type=int,
+            default=35,
+            help="Seconds at the start of each streaming run with higher latencies.")
+    parser.add_argument(
+            '--failure-time',
+            type=int,
+            default=48,
+            help="Second at which a worker fails in the streaming failure runs.")
+    parser.add_argument(
+            '--recovery-seconds',
+            type=int,
+            default=10,
+            help="How long the streaming failure runs take to recover.")
+    parser.add_argument(
+            '--missing-seconds',
+            type=int,
+            nargs='*',
+            default=[],
+            help="Seconds in which the streaming sinks log nothing.")
+    parser.add_argument(
+            '--jobs',
+            type=int,
+            default=os.cpu_count(),
+            help="Number of files to write at once.")
+    parser.add_argument(
+            '--seed',
+            type=int,
+            default=0)
+    args = parser.parse_args()
+
+    paths = generate(args.directory, args.workers, args.kinds, args.jobs, args.seed,
+                     args.duration, args.rate, args.warmup_seconds, args.failure_time,
+                     args.recovery_seconds, args.missing_seconds)
+    print("Wrote {} files, {:.1f} MB".format(
+        len(paths), sum(os.path.getsize(path) for path in paths) / 1e6))
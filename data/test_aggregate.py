@@ -0,0 +1,32 @@
+import os
+import sys
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import aggregate
+
+COLUMNS = {'sink_id': str, 'timestamp': np.float64, 'latency': np.float64}
+
+
+def read(path):
+    with open(path, 'rb') as f:
+        return aggregate.timestamps_in_seconds(f), list(aggregate.read_csv_chunks(f, COLUMNS))
+
+
+def test_no_records(tmp_path):
+    # As when a run is collected before any sink logged.
+    path = str(tmp_path / 'latency.csv')
+    with open(path, 'w') as f:
+        f.write("sink_id,timestamp,cur_time,latency\n")
+    assert read(path) == (False, [])
+    open(path, 'w').close()
+    assert read(path) == (False, [])
+
+
+def test_blank_first_row(tmp_path):
+    path = str(tmp_path / 'latency.csv')
+    with open(path, 'w') as f:
+        f.write("sink_id,timestamp,cur_time,latency\n\nAM,1.5,1.6,0.1\n")
+    in_seconds, chunks = read(path)
+    assert in_seconds
+    assert [len(chunk) for chunk in chunks] == [1]
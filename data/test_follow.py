@@ -0,0 +1,110 @@
+import os
+import sys
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import follow
+
+LATENCY_HEADER = "sink_id,timestamp,cur_time,latency\n"
+THROUGHPUT_HEADER = "sink_id,timestamp,cur_time,throughput\n"
+
+
+def latency_rows(start, num_seconds, per_second=10):
+    rows = []
+    for i in range(num_seconds * per_second):
+        timestamp = start + i / per_second
+        latency = 0.1 + (i % per_second) / 100
+        rows.append("AM,{:.6f},{:.6f},{:.6f}\n".format(timestamp, timestamp + latency, latency))
+    return rows
+
+
+def test_latency_truncated(tmp_path):
+    path = str(tmp_path / 'latency.csv')
+    with open(path, 'w') as f:
+        f.write(LATENCY_HEADER)
+        f.writelines(latency_rows(1000.0, 5))
+    follower = follow.LatencyFollower(path, flink=False)
+    follower.refresh()
+    assert follower.count == 50
+
+    # A new run writes the file again from the header.
+    with open(path, 'w') as f:
+        f.write(LATENCY_HEADER)
+        f.writelines(latency_rows(2000.0, 2))
+    follower.refresh()
+    assert follower.tail.restarted
+    assert follower.count == 20
+    assert follower.first_timestamp == 2000.0
+    assert sorted(follower.latencies) == [0, 1]
+
+
+def test_latency_replaced(tmp_path):
+    path = str(tmp_path / 'latency.csv')
+    with open(path, 'w') as f:
+        f.write(LATENCY_HEADER)
+        f.writelines(latency_rows(1000.0, 1))
+    follower = follow.LatencyFollower(path, flink=False)
+    follower.refresh()
+
+    # Replaced by a longer file, so the size alone does not show it.
+    replacement = str(tmp_path / 'replacement.csv')
+    with open(replacement, 'w') as f:
+        f.write(LATENCY_HEADER)
+        f.writelines(latency_rows(2000.0, 3))
+    os.rename(replacement, path)
+    follower.refresh()
+    assert follower.count == 30
+    assert follower.first_timestamp == 2000.0
+
+
+def test_latency_appended(tmp_path):
+    path = str(tmp_path / 'latency.csv')
+    rows = latency_rows(1000.0, 20)
+    with open(path, 'w') as f:
+        f.write(LATENCY_HEADER)
+    follower = follow.LatencyFollower(path, flink=False, window=5)
+    for i in range(0, len(rows), 30):
+        with open(path, 'a') as f:
+            f.writelines(rows[i:i + 30])
+        follower.refresh()
+    assert not follower.tail.restarted
+    assert follower.count == len(rows)
+    assert sorted(follower.latencies) == [15, 16, 17, 18, 19]
+    latencies = np.array([float(row.split(',')[3]) * 1000 for row in rows[150:]])
+    assert abs(follower.percentile(50) - np.percentile(latencies, 50)) <= 0.02 * np.percentile(latencies, 50)
+
+
+def test_throughput_changed_seconds(tmp_path):
+    path = str(tmp_path / 'throughput.csv')
+    with open(path, 'w') as f:
+        f.write(THROUGHPUT_HEADER)
+        f.write("AM,1000.0,1000.0,5\nAM,1000.5,1000.5,10\nAN,1000.0,1000.0,5\nAN,1000.6,1000.6,20\n")
+    follower = follow.ThroughputFollower(path)
+    follower.refresh()
+    assert follower.throughputs() == [(0, 30.0)]
+    assert follower.throughputs() == []
+
+    with open(path, 'a') as f:
+        f.write("AM,1001.5,1001.5,30\n")
+    follower.refresh()
+    assert follower.throughputs() == [(1, 30.0)]
+
+    with open(path, 'w') as f:
+        f.write(THROUGHPUT_HEADER)
+        f.write("AM,2000.0,2000.0,5\nAM,2000.5,2000.5,7\n")
+    follower.refresh()
+    assert follower.throughputs() == [(0, 7.0)]
+    assert follower.totals == {0: 7.0}
+
+
+def test_finished_truncated(tmp_path):
+    path = str(tmp_path / 'allreduce.txt')
+    with open(path, 'w') as f:
+        f.write("INFO Finished 1.5\nINFO Finished 2.5\n")
+    follower = follow.FinishedFollower(path)
+    follower.refresh()
+    assert follower.times == [1.5, 2.5]
+    with open(path, 'w') as f:
+        f.write("INFO Finished 3.5\n")
+    follower.refresh()
+    assert follower.times == [3.5]
@@ -0,0 +1,26 @@
+import os
+import sys
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import sketch
+
+
+def test_negative_and_zero_latencies():
+    # As in Flink's latencies, where skewed clocks give values down to -18.
+    values = np.concatenate([np.arange(-18, 1), np.full(100, 0.0), np.linspace(1, 2000, 1000)])
+    latency_sketch = sketch.LatencySketch(0.01)
+    latency_sketch.add(values[::2])
+    other = sketch.LatencySketch(0.01)
+    other.add(values[1::2])
+    latency_sketch.merge(other)
+
+    q = [0, 0.5, 1, 5, 10, 50, 99, 100]
+    exact = np.percentile(values, q)
+    approx = latency_sketch.percentile(q)
+    assert np.all(np.abs(approx - exact) <= 0.01 * np.abs(exact) + 1e-9)
+    assert latency_sketch.percentile(8) == 0
+
+    x, y = latency_sketch.cdf()
+    assert x[0] == -18 and np.all(np.diff(x) >= 0)
+    assert abs(y[np.searchsorted(x, 0)] - np.mean(values <= 0)) < 1e-9
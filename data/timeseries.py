@@ -0,0 +1,440 @@
+# Multi-resolution time series for long runs. plot_recovery.py plots one
+# point per second over a short window, which gets slow and unreadable over
+# an hour-long run. A TimeSeries instead folds the records into a pyramid of
+# levels, with buckets of 1, 10, 60, 600 and 3600 seconds, and keeps the
+# count, sum, min and max of the values in each bucket, plus a LatencySketch
+# for quantiles if given an error, separately for each sink. Reading a window
+# then takes time proportional to the number of buckets read, not to the
+# number of records:
+#   - series() returns one row per bucket at the finest level that gives at
+#     most max_points of them;
+#   - summary() covers the window with as few buckets as possible, coarsest
+#     first, and combines them.
+# The pyramid that a file is folded into is saved in the parse cache (see
+# cache.py), so later runs over the same file load its levels instead of
+# reading the file again.
+# Run this file to plot the latency and throughput of each system over a
+# whole streaming run:
+#   python timeseries.py --directory 4-workers --sketch-error 0.01 --save-filename run.png
+from collections import OrderedDict
+import os
+import sys
+import numpy as np
+import pandas as pd
+import matplotlib.pyplot as plt
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from follow import newer_than_seen
+import aggregate
+import cache
+import profiling
+import sketch
+
+LEVELS = [1, 10, 60, 600, 3600]
+MAX_POINTS = 1000
+
+# Bump this whenever read_series or the columns of to_columns change, to
+# invalidate cached pyramids.
+PARSER_VERSION = 2
+
+
+class Level(object):
+    # The aggregates of one sink's values in buckets of `width` seconds.
+    # Buckets are numbered from second 0 and the arrays grow as later ones
+    # are added.
+    def __init__(self, width, error=None):
+        self.width = width
+        self.end = 0
+        self.count = np.zeros(0, dtype=np.int64)
+        self.total = np.zeros(0)
+        self.min = np.zeros(0)
+        self.max = np.zeros(0)
+        self.sketches = None if error is None else aggregate.SecondBins(error)
+
+    def _grow(self, size):
+        if size <= len(self.count):
+            return
+        pad = max(size, 2 * len(self.count)) - len(self.count)
+        self.count = np.concatenate([self.count, np.zeros(pad, dtype=np.int64)])
+        self.total = np.concatenate([self.total, np.zeros(pad)])
+        self.min = np.concatenate([self.min, np.full(pad, np.inf)])
+        self.max = np.concatenate([self.max, np.full(pad, -np.inf)])
+
+    def add(self, seconds, values):
+        buckets = seconds // self.width
+        self.end = max(self.end, int(buckets.max()) + 1)
+        self._grow(self.end)
+        new_buckets, inverse = np.unique(buckets, return_inverse=True)
+        self.count[new_buckets] += np.bincount(inverse)
+        self.total[new_buckets] += np.bincount(inverse, values)
+        np.minimum.at(self.min, buckets, values)
+        np.maximum.at(self.max, buckets, values)
+        if self.sketches is not None:
+            self.sketches.add(buckets, values)
+
+    def sketch(self, bucket):
+        if bucket in self.sketches.sketches:
+            return self.sketches[bucket]
+        return None
+
+
+class TimeSeries(object):
+    def __init__(self, error=None, levels=LEVELS):
+        # The finest level is the raw resolution of the records.
+        assert levels[0] == 1
+        self.error = error
+        self.levels = levels
+        # Map from sink to its levels, finest first.
+        self.sinks = OrderedDict()
+
+    def add(self, sink, seconds, values):
+        # Adds the values recorded by a sink at the given seconds since the
+        # start of the run.
+        if len(seconds) == 0:
+            return
+        seconds = np.asarray(seconds, dtype=np.int64)
+        values = np.asarray(values, dtype=np.float64)
+        assert seconds.min() >= 0
+        if sink not in self.sinks:
+            self.sinks[sink] = [Level(width, self.error) for width in self.levels]
+        for level in self.sinks[sink]:
+            level.add(seconds, values)
+
+    def end(self):
+        # One past the last second with a record.
+        return max([levels[0].end for levels in self.sinks.values()] or [0])
+
+    def resolution(self, start, end, max_points=MAX_POINTS):
+        # The finest level with at most max_points buckets in [start, end).
+        for i, width in enumerate(self.levels):
+            if -(-(end - start) // width) <= max_points:
+                return i
+        return len(self.levels) - 1
+
+    def _combine(self, i, first, last, sinks):
+        # Combines buckets [first, last) of level i over the sinks, into one
+        # row per bucket.
+        n = last - first
+        count = np.zeros(n, dtype=np.int64)
+        total = np.zeros(n)
+        minimum = np.full(n, np.inf)
+        maximum = np.full(n, -np.inf)
+        sketches = []
+        for sink in sinks:
+            level = self.sinks[sink][i]
+            end = min(last, level.end)
+            if end > first:
+                count[:end - first] += level.count[first:end]
+                total[:end - first] += level.total[first:end]
+                np.minimum(minimum[:end - first], level.min[first:end], out=minimum[:end - first])
+                np.maximum(maximum[:end - first], level.max[first:end], out=maximum[:end - first])
+            if level.sketches is not None:
+                sketches.append([level.sketch(bucket) for bucket in range(first, last)])
+        return count, total, minimum, maximum, sketches
+
+    def _columns(self, count, total, minimum, maximum, sketches):
+        empty = count == 0
+        with np.errstate(divide='ignore', invalid='ignore'):
+            columns = {
+                'count': count,
+                'sum': total,
+                'mean': np.where(empty, np.nan, total / count),
+                'min': np.where(empty, np.nan, minimum),
+                'max': np.where(empty, np.nan, maximum),
+            }
+        if self.error is not None:
+            merged = []
+            for bucket_sketches in zip(*sketches or [[None] * len(count)]):
+                bucket_sketches = [s for s in bucket_sketches if s is not None]
+                merged.append(aggregate.merge(bucket_sketches, self.error) if bucket_sketches else None)
+            columns['sketch'] = merged
+        return columns
+
+    def series(self, start, end, max_points=MAX_POINTS, sinks=None):
+        # Returns the bucket width and a dict of columns with one row per
+        # bucket that overlaps [start, end): 'time' (the start of the
+        # bucket), 'count', 'sum', 'mean', 'min', 'max' and, if kept,
+        # 'sketch' (None for empty buckets). Rows combine the given sinks,
+        # all of them by default.
+        if sinks is None:
+            sinks = list(self.sinks)
+        i = self.resolution(start, end, max_points)
+        width = self.levels[i]
+        first = start // width
+        last = -(-end // width)
+        columns = self._columns(*self._combine(i, first, last, sinks))
+        columns['time'] = np.arange(first, last) * width
+        return width, columns
+
+    def _cover(self, start, end, i):
+        # Yields (level index, first bucket, last bucket) that exactly cover
+        # [start, end), using the coarsest buckets that fit.
+        if start >= end:
+            return
+        width = self.levels[i]
+        first = -(-start // width)
+        last = end // width
+        if i == 0 or first < last:
+            yield i, first, last
+            if i > 0:
+                for piece in self._cover(start, first * width, i - 1):
+                    yield piece
+                for piece in self._cover(last * width, end, i - 1):
+                    yield piece
+        else:
+            for piece in self._cover(start, end, i - 1):
+                yield piece
+
+    def summary(self, start, end, sinks=None):
+        # Returns the count, sum, mean, min, max and, if kept, the merged
+        # sketch of every value in [start, end), over the given sinks.
+        if sinks is None:
+            sinks = list(self.sinks)
+        count = 0
+        total = 0.0
+        minimum = np.inf
+        maximum = -np.inf
+        summary_sketches = []
+        for i, first, last in self._cover(start, end, len(self.levels) - 1):
+            c, t, lo, hi, sketches = self._combine(i, first, last, sinks)
+            count += c.sum()
+            total += t.sum()
+            minimum = min(minimum, lo.min(initial=np.inf))
+            maximum = max(maximum, hi.max(initial=-np.inf))
+            summary_sketches += [s for bucket_sketches in sketches for s in bucket_sketches if s is not None]
+        columns = self._columns(np.array([count]), np.array([total]), np.array([minimum]),
+                                np.array([maximum]), [summary_sketches])
+        summary = dict((name, values[0]) for name, values in columns.items() if name != 'sketch')
+        if self.error is not None:
+            summary['sketch'] = aggregate.merge(summary_sketches, self.error) if summary_sketches else None
+        return summary
+
+
+def read_series(results, filename, value_column, skip_replayed, error=None, memory_mb=aggregate.MEMORY_MB,
+                series=None):
+    # Folds a streaming latency or throughput file into a TimeSeries, by sink,
+    # with the same rules as plot_recovery.py and follow.py: times are
+    # seconds since the sink's first record, and with skip_replayed, records
+    # that are not newer than every earlier record of the sink are skipped.
+    if series is None:
+        series = TimeSeries(error)
+    time_column = 'cur_time' if value_column == 'throughput' else 'timestamp'
+    columns = OrderedDict([('sink_id', str), ('timestamp', np.float64), (value_column, np.float64)])
+    columns[time_column] = np.float64
+    # Map from sink to (first time, newest timestamp seen).
+    operators = {}
+    with results.open(filename, 'rb') as f:
+        in_seconds = aggregate.timestamps_in_seconds(f)
+        for chunk in aggregate.read_csv_chunks(f, columns, memory_mb):
+            # Group the chunk's records by sink, keeping them in order.
+            codes, operator_ids = pd.factorize(chunk['sink_id'])
+            order = np.argsort(codes, kind='stable')
+            starts = np.searchsorted(codes[order], np.arange(len(operator_ids) + 1))
+            for code, operator in enumerate(operator_ids):
+                mine = order[starts[code]:starts[code + 1]]
+                timestamps = chunk['timestamp'].values[mine]
+                times = chunk[time_column].values[mine]
+                values = chunk[value_column].values[mine]
+                if operator not in operators:
+                    # As in plot_recovery.py, the first record is not newer
+                    # than itself, so it is skipped along with replays.
+                    operators[operator] = (times[0], timestamps[0])
+                first_time, max_timestamp = operators[operator]
+                if skip_replayed:
+                    newer, max_timestamp = newer_than_seen(timestamps, max_timestamp)
+                    operators[operator] = (first_time, max_timestamp)
+                    times = times[newer]
+                    values = values[newer]
+                seconds = times - first_time
+                if not in_seconds:
+                    seconds = seconds / 1000
+                if in_seconds and value_column == 'latency':
+                    values = values * 1000
+                series.add(operator, seconds.astype(np.int64), values)
+    return series
+
+
+def to_columns(series):
+    # Flattens a TimeSeries into a dict of arrays that the parse cache can
+    # save. For each level, the buckets of every sink up to its end are
+    # concatenated in sink order. A sketch is saved as the (bucket, index,
+    # count) of its non-empty sketch buckets; its count, sum, min and max are
+    # those of the level's bucket.
+    columns = {'sinks': np.array(list(series.sinks), dtype=str)}
+    for i, width in enumerate(series.levels):
+        levels = [sink_levels[i] for sink_levels in series.sinks.values()]
+        prefix = '{}s-'.format(width)
+        columns[prefix + 'end'] = np.array([level.end for level in levels], dtype=np.int64)
+        for name in ['count', 'total', 'min', 'max']:
+            columns[prefix + name] = np.concatenate(
+                [getattr(level, name)[:level.end] for level in levels] or [np.zeros(0)])
+        if series.error is None:
+            continue
+        buckets, indices, counts = [], [], []
+        offset = 0
+        for level in levels:
+            for bucket in level.sketches.seconds():
+                index = np.flatnonzero(level.sketches[bucket].counts)
+                buckets.append(np.full(len(index), offset + bucket, dtype=np.int64))
+                indices.append(index)
+                counts.append(level.sketches[bucket].counts[index])
+            offset += level.end
+        columns[prefix + 'sketch-bucket'] = np.concatenate(buckets or [np.zeros(0, dtype=np.int64)])
+        columns[prefix + 'sketch-index'] = np.concatenate(indices or [np.zeros(0, dtype=np.int64)])
+        columns[prefix + 'sketch-count'] = np.concatenate(counts or [np.zeros(0, dtype=np.int64)])
+    return columns
+
+
+def from_columns(columns, error=None, levels=LEVELS):
+    # The inverse of to_columns. Copies the arrays, which may be memory-mapped
+    # from the cache, so that more records can be added.
+    series = TimeSeries(error, levels)
+    sinks = columns['sinks'].tolist()
+    for sink in sinks:
+        series.sinks[sink] = [Level(width, error) for width in levels]
+    for i, width in enumerate(levels):
+        prefix = '{}s-'.format(width)
+        ends = columns[prefix + 'end']
+        starts = np.concatenate([[0], np.cumsum(ends)])
+        for j, sink in enumerate(sinks):
+            level = series.sinks[sink][i]
+            level.end = int(ends[j])
+            level.count = np.array(columns[prefix + 'count'][starts[j]:starts[j + 1]], dtype=np.int64)
+            for name in ['total', 'min', 'max']:
+                setattr(level, name, np.array(columns[prefix + name][starts[j]:starts[j + 1]]))
+        if error is None:
+            continue
+        buckets = np.asarray(columns[prefix + 'sketch-bucket'])
+        indices = np.asarray(columns[prefix + 'sketch-index'])
+        counts = np.asarray(columns[prefix + 'sketch-count'])
+        unique_buckets, first = np.unique(buckets, return_index=True)
+        for bucket, group in zip(unique_buckets.tolist(), np.split(np.arange(len(buckets)), first[1:])):
+            j = int(np.searchsorted(starts, bucket, side='right')) - 1
+            level = series.sinks[sinks[j]][i]
+            local = bucket - int(starts[j])
+            latency_sketch = sketch.LatencySketch(error)
+            latency_sketch.counts[indices[group]] = counts[group]
+            latency_sketch.count = int(level.count[local])
+            latency_sketch.total = float(level.total[local])
+            latency_sketch.min = float(level.min[local])
+            latency_sketch.max = float(level.max[local])
+            level.sketches.sketches[local] = latency_sketch
+    return series
+
+
+@cache.columns('timeseries', PARSER_VERSION)
+def parse_series(results, filename, value_column, skip_replayed, error, memory_mb):
+    return to_columns(read_series(results, filename, value_column, skip_replayed, error, memory_mb))
+
+
+def read_latencies(results, filename, flink, error=None, memory_mb=aggregate.MEMORY_MB):
+    # Only Flink replays records during recovery.
+    return from_columns(parse_series(results, filename, 'latency', flink, error, memory_mb), error)
+
+
+def read_throughputs(results, filename, memory_mb=aggregate.MEMORY_MB):
+    return from_columns(parse_series(results, filename, 'throughput', True, None, memory_mb))
+
+
+def total_throughput(series, start, end, max_points=MAX_POINTS):
+    # The sum over sinks of the mean throughput that each reported, per bucket.
+    totals = None
+    for sink in series.sinks:
+        width, columns = series.series(start, end, max_points, [sink])
+        means = np.nan_to_num(columns['mean'])
+        totals = means if totals is None else totals + means
+    return columns['time'], totals
+
+
+def main(directory, save_filename, start=0, end=None, max_points=MAX_POINTS, sketch_error=None,
+         memory_mb=aggregate.MEMORY_MB):
+    from results import open_results
+    with profiling.stage('list') as listed:
+        results = open_results(directory)
+        filenames = OrderedDict()
+        for filename in results.listdir():
+            listed.records += 1
+            for label, prefix, flink in [('Flink', 'failure-flink-latency', True),
+                                         ('WriteFirst', 'writefirst-failure-latency', False),
+                                         ('Lineage stash', 'failure-latency', False)]:
+                if filename.startswith(prefix):
+                    filenames[label] = (filename, filename.replace('latency', 'throughput'), flink)
+
+    all_series = []
+    for label, (latency_filename, throughput_filename, flink) in filenames.items():
+        with profiling.stage('parse') as parsed:
+            latencies = read_latencies(results, latency_filename, flink, sketch_error, memory_mb)
+            throughputs = read_throughputs(results, throughput_filename, memory_mb)
+            parsed.records += latencies.summary(0, latencies.end())['count']
+        all_series.append((label, latencies, throughputs))
+
+    with profiling.stage('render'):
+        fig, (latency_ax, throughput_ax) = plt.subplots(2, sharex=True, figsize=(8, 6))
+        for label, latencies, throughputs in all_series:
+            window_end = end if end is not None else max(latencies.end(), throughputs.end())
+            width, columns = latencies.series(start, window_end, max_points)
+            if sketch_error is None:
+                y = columns['mean']
+            else:
+                y = [np.nan if s is None else s.percentile(50) for s in columns['sketch']]
+            latency_ax.plot(columns['time'], y, label=label, linewidth=1)
+            x, y = total_throughput(throughputs, start, window_end, max_points)
+            throughput_ax.plot(x, y / 100000, label=label, linewidth=1)
+
+            summary = latencies.summary(start, window_end)
+            print(label, "{}s buckets".format(width), "records:", summary['count'],
+                  "mean latency:", summary['mean'], "max latency:", summary['max'])
+
+        latency_ax.set_yscale('log')
+        latency_ax.set_ylabel('Latency (ms)' if sketch_error is None else 'Median latency (ms)')
+        throughput_ax.set_ylabel('Throughput \n(100k records/s)')
+        throughput_ax.set_xlabel('Time since start (s)')
+        latency_ax.legend()
+        plt.tight_layout()
+        if save_filename is not None:
+            plt.savefig(save_filename)
+        else:
+            plt.show()
+
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(description='Plot the latency and throughput of a whole streaming run.')
+    parser.add_argument(
+            '--directory',
+            type=str,
+            default='32-workers',
+            help="Directory or .tar.gz archive with the data files.")
+    parser.add_argument(
+            '--save-filename',
+            type=str,
+            default=None)
+    parser.add_argument(
+            '--start',
+            type=int,
+            default=0,
+            help="First second to plot.")
+    parser.add_argument(
+            '--end',
+            type=int,
+            default=None,
+            help="Second to plot up to. Defaults to the end of the run.")
+    parser.add_argument(
+            '--max-points',
+            type=int,
+            default=MAX_POINTS,
+            help="Plot at the finest resolution with at most this many points per line.")
+    parser.add_argument(
+            '--sketch-error',
+            type=float,
+            default=None,
+            help="If set, keep a sketch per bucket with this relative error and plot median latencies instead of means.")
+    aggregate.add_arguments(parser)
+    cache.add_arguments(parser)
+    profiling.add_arguments(parser)
+    args = parser.parse_args()
+    cache.configure_from_args(args)
+    profiling.configure_from_args(args)
+
+    main(args.directory, args.save_filename, args.start, args.end, args.max_points,
+         args.sketch_error, args.memory_mb)
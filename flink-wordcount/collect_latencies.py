@@ -0,0 +1,148 @@
+# Collects the latency and throughput that the sinks log on each worker into
+# two CSVs, with the schema that the plot scripts in data/streaming read:
+#   sink_id,timestamp,cur_time,latency
+#   sink_id,timestamp,cur_time,throughput
+# where sink_id is the worker's index in the Flink slaves file.
+#
+# Workers are read concurrently. The byte offset reached in each log is saved
+# next to the latency CSV, so running the collector again during or after a
+# job only fetches and appends what was logged since the last run.
+import json
+import os
+import re
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from fnmatch import fnmatch
+
+from transport import LocalTransport
+from transport import SSHTransport
+
+FLINK_DIR = "/home/ubuntu/flink-1.8.1"
+FLINK_SLAVES = os.path.join(FLINK_DIR, "conf", "slaves")
+FLINK_LOG_DIR = os.path.join(FLINK_DIR, "log")
+
+# Every task executor logs latencies, only the first logs throughputs.
+LATENCY_LOGS = "flink-ubuntu-taskexecutor-*.log"
+THROUGHPUT_LOGS = "flink-ubuntu-taskexecutor-0-*.log"
+
+# The sinks log "LATENCY <id> (<timestamp>,...) <now>" and
+# "THROUGHPUT <id> (<timestamp>,...) <now> <throughput>".
+LATENCY_RE = re.compile(br'LATENCY [0-9]* \(([0-9]*)[^\n]*\) ([0-9]*)')
+THROUGHPUT_RE = re.compile(br'THROUGHPUT [0-9]* \(([0-9]*)[^\n]*\) ([0-9]*) ([0-9]*)')
+
+LATENCY_HEADER = "sink_id,timestamp,cur_time,latency\n"
+THROUGHPUT_HEADER = "sink_id,timestamp,cur_time,throughput\n"
+
+
+def parse_log(sink_id, data, throughput):
+    # Returns the latency and throughput CSV rows in a chunk of complete lines.
+    latencies = ["{},{},{},{}\n".format(sink_id, int(timestamp), int(now), int(now) - int(timestamp))
+                 for timestamp, now in LATENCY_RE.findall(data)]
+    throughputs = []
+    if throughput:
+        throughputs = ["{},{},{},{}\n".format(sink_id, int(timestamp), int(now), int(tput))
+                       for timestamp, now, tput in THROUGHPUT_RE.findall(data)]
+    return latencies, throughputs
+
+
+def collect_worker(transport, sink_id, worker, offsets):
+    # Returns the new rows from one worker and the offsets reached in its logs.
+    latencies = []
+    throughputs = []
+    offsets = dict(offsets)
+    for filename, size in transport.list(worker, LATENCY_LOGS):
+        offset = offsets.get(filename, 0)
+        if size < offset:
+            # The log was truncated, e.g. by run_job.sh clearing the logs.
+            offset = 0
+        if size == offset:
+            continue
+        data = transport.read(worker, filename, offset)
+        # Leave a partially written last line for the next collection.
+        data = data[:data.rfind(b'\n') + 1]
+        offsets[filename] = offset + len(data)
+        new_latencies, new_throughputs = parse_log(sink_id, data, fnmatch(filename, THROUGHPUT_LOGS))
+        latencies += new_latencies
+        throughputs += new_throughputs
+    return latencies, throughputs, offsets
+
+
+def append_rows(filename, header, rows):
+    with open(filename, 'a') as f:
+        if f.tell() == 0:
+            f.write(header)
+        f.writelines(rows)
+
+
+def save_offsets(filename, offsets):
+    # Replace the file in one rename, so that it is never half written.
+    with open(filename + '.tmp', 'w') as f:
+        json.dump(offsets, f)
+    os.rename(filename + '.tmp', filename)
+
+
+def main(latency_filename, throughput_filename, workers, transport, jobs):
+    # Returns the workers that could not be collected from.
+    offsets_filename = latency_filename + '.offsets'
+    offsets = {}
+    if os.path.exists(offsets_filename):
+        with open(offsets_filename) as f:
+            offsets = json.load(f)
+
+    failed = []
+    with ThreadPoolExecutor(jobs) as executor:
+        futures = [executor.submit(collect_worker, transport, i, worker, offsets.get(worker, {}))
+                   for i, worker in enumerate(workers)]
+        # Append in the same order as the workers are listed.
+        for worker, future in zip(workers, futures):
+            try:
+                latencies, throughputs, worker_offsets = future.result()
+            except Exception as e:
+                # Its offsets are unchanged, so the next run fetches its rows.
+                print(worker, "FAILED:", e)
+                failed.append(worker)
+                continue
+            print(worker, len(latencies), "latencies", len(throughputs), "throughputs")
+            append_rows(latency_filename, LATENCY_HEADER, latencies)
+            append_rows(throughput_filename, THROUGHPUT_HEADER, throughputs)
+            # Save the offsets as soon as the rows are written, so that a
+            # later failure does not make the next run append them again.
+            offsets[worker] = worker_offsets
+            save_offsets(offsets_filename, offsets)
+    return failed
+
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(description='Collect latencies from the workers.')
+    parser.add_argument(
+            'latency_filename',
+            type=str)
+    parser.add_argument(
+            'throughput_filename',
+            type=str)
+    parser.add_argument(
+            '--workers',
+            type=str,
+            default=FLINK_SLAVES,
+            help="File with one worker address per line.")
+    parser.add_argument(
+            '--local-dir',
+            type=str,
+            default=None,
+            help="Read each worker's logs from <local-dir>/<worker> instead of over ssh.")
+    parser.add_argument(
+            '--jobs',
+            type=int,
+            default=32,
+            help="Number of workers to collect from at once.")
+    args = parser.parse_args()
+
+    with open(args.workers, 'r') as f:
+        workers = [worker.strip() for worker in f.readlines() if worker.strip()]
+    if args.local_dir is not None:
+        transport = LocalTransport(args.local_dir)
+    else:
+        transport = SSHTransport(FLINK_LOG_DIR)
+    failed = main(args.latency_filename, args.throughput_filename, workers, transport, args.jobs)
+    sys.exit(1 if failed else 0)
@@ -1,3 +1,24 @@
+# Renders the Flink and Hadoop configs and the slaves/workers files on the
+# master. With --distribute, also renders them for each worker and pushes them
+# to all of the workers at once, over ssh or, with --local-dir, into one local
+# directory per worker. Templates can refer to {master_ip}, and to {node_ip}
+# and {node_index} for the node that the config is rendered for.
+#
+# The hash of the files pushed to each worker is saved on the worker itself,
+# after the files, and workers that already have the hash of their configs
+# are skipped. A worker that was reprovisioned, or only written to by another
+# transport, has no hash and is pushed to.
+import hashlib
+import os
+import sys
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from transport import LocalTransport
+from transport import SSHTransport
+
+HOME = "/home/ubuntu"
+
 FLINK_CONF_TEMPLATE = "/home/ubuntu/flink-wordcount/flink-conf.yaml.template"
 FLINK_CONF = "/home/ubuntu/flink-1.8.1/conf/flink-conf.yaml"
 
@@ -8,32 +29,109 @@ WORKERS = "/home/ubuntu/workers.txt"
 HADOOP_SLAVES = "/home/ubuntu/hadoop-3.1.2/etc/hadoop/workers"
 FLINK_SLAVES = "/home/ubuntu/flink-1.8.1/conf/slaves"
 
+CONFIG_HASH = "/home/ubuntu/.config-hash"
+
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, 'data'))
+import profiling
+
+
+def read_templates():
+    templates = OrderedDict()
+    for template, conf in [(FLINK_CONF_TEMPLATE, FLINK_CONF), (HADOOP_CONF_TEMPLATE, HADOOP_CONF)]:
+        with open(template, 'r') as f:
+            templates[conf] = f.read()
+    return templates
+
+
+def render_node(templates, master_ip, workers, num_nodes, node_index):
+    # Returns a map from path to the contents of each file on one node.
+    files = OrderedDict()
+    for conf, template in templates.items():
+        files[conf] = template.format(
+            master_ip=master_ip, node_ip=workers[node_index], node_index=node_index)
+    # Skip the master node for flink's jobmanager.
+    files[FLINK_SLAVES] = ''.join(worker + '\n' for worker in workers[1:num_nodes + 1])
+    files[HADOOP_SLAVES] = ''.join(worker + '\n' for worker in workers)
+    return files
+
+
+def files_hash(files):
+    sha = hashlib.sha256()
+    for path, contents in sorted(files.items()):
+        sha.update(path.encode())
+        sha.update(b'\0')
+        sha.update(contents.encode())
+        sha.update(b'\0')
+    return sha.hexdigest()
+
+
+def pushed_hash(transport, worker):
+    # The hash of the files last pushed to the worker, or None if it has none.
+    try:
+        return transport.read(worker, os.path.relpath(CONFIG_HASH, HOME), 0).decode().strip()
+    except Exception:
+        return None
+
 
-def format_config(master_ip, conf_template, conf):
-    with open(conf_template, 'r') as f:
-        template = f.read()
-    template = template.format(master_ip=master_ip)
-    with open(conf, 'w+') as f:
-        f.write(template)
-
-def main(master_ip, num_nodes):
-    format_config(master_ip, FLINK_CONF_TEMPLATE, FLINK_CONF)
-    format_config(master_ip, HADOOP_CONF_TEMPLATE, HADOOP_CONF)
-
-    # Write the worker IP addresses.
-    workers = []
-    with open(WORKERS, 'r') as f:
-        for worker in f.readlines():
-            workers.append(worker)
-    assert len(workers) > num_nodes
-    with open(FLINK_SLAVES, 'w+') as f:
-        # Skip the master node for flink's jobmanager.
-        for worker in workers[1:num_nodes + 1]:
-            f.write(worker)
-
-    with open(HADOOP_SLAVES, 'w+') as f:
-        for worker in workers:
-            f.write(worker)
+def push_node(transport, worker, files, force=False):
+    # Returns whether the files were pushed. The hash is written last, so a
+    # push that fails partway is done again next time.
+    digest = files_hash(files)
+    if not force and pushed_hash(transport, worker) == digest:
+        return False
+    for path, contents in files.items():
+        transport.write(worker, os.path.relpath(path, HOME), contents.encode())
+    transport.write(worker, os.path.relpath(CONFIG_HASH, HOME), (digest + '\n').encode())
+    return True
+
+
+def distribute(transport, workers, nodes, jobs, force=False):
+    # Pushes each worker's files, skipping workers that already have them.
+    # Returns the workers that failed.
+    failed = []
+    num_updated = 0
+    with ThreadPoolExecutor(jobs) as executor:
+        futures = [executor.submit(push_node, transport, worker, files, force)
+                   for worker, files in zip(workers, nodes)]
+        for worker, future in zip(workers, futures):
+            try:
+                updated = future.result()
+            except Exception as e:
+                print(worker, "FAILED:", e)
+                failed.append(worker)
+                continue
+            if updated:
+                print(worker, "updated")
+                num_updated += 1
+    print(len(workers) - num_updated - len(failed), "of", len(workers), "workers were up to date")
+    return failed
+
+
+def main(master_ip, num_nodes, transport=None, jobs=32, force=False):
+    with profiling.stage('workers') as listed:
+        with open(WORKERS, 'r') as f:
+            workers = [worker.strip() for worker in f.readlines() if worker.strip()]
+        assert len(workers) > num_nodes
+        listed.records += len(workers)
+
+    # The first node is the master, which this runs on.
+    with profiling.stage('render') as rendered:
+        templates = read_templates()
+        nodes = [render_node(templates, master_ip, workers, num_nodes, i)
+                 for i in range(len(workers) if transport is not None else 1)]
+        rendered.records += sum(len(files) for files in nodes)
+
+    for path, contents in nodes[0].items():
+        with open(path, 'w+') as f:
+            f.write(contents)
+    if transport is None:
+        return []
+
+    with profiling.stage('distribute') as distributed:
+        failed = distribute(transport, workers[1:], nodes[1:], jobs, force)
+        distributed.records += len(workers) - 1
+    return failed
 
 if __name__ == '__main__':
     import argparse
@@ -46,6 +144,33 @@ if __name__ == '__main__':
             '--num-nodes',
             type=int,
             required=True)
+    parser.add_argument(
+            '--distribute',
+            action='store_true',
+            help="Also push the configs to every other node in the workers file.")
+    parser.add_argument(
+            '--local-dir',
+            type=str,
+            default=None,
+            help="With --distribute, write each worker's configs under <local-dir>/<worker> instead of over ssh.")
+    parser.add_argument(
+            '--force',
+            action='store_true',
+            help="Push the configs to every worker, even if they have not changed.")
+    parser.add_argument(
+            '--jobs',
+            type=int,
+            default=32,
+            help="Number of workers to push to at once.")
+    profiling.add_arguments(parser)
     args = parser.parse_args()
+    profiling.configure_from_args(args)
 
-    main(args.master_ip, args.num_nodes)
+    transport = None
+    if args.distribute:
+        if args.local_dir is not None:
+            transport = LocalTransport(args.local_dir)
+        else:
+            transport = SSHTransport(HOME)
+    failed = main(args.master_ip, args.num_nodes, transport, args.jobs, args.force)
+    sys.exit(1 if failed else 0)
@@ -33,13 +33,7 @@ if [[ $RESTART_HDFS -eq 1 ]]; then
 fi
 
 # Sync the config with all workers.
-python $DIR/format_config.py --master-ip $MASTER_IP --num-nodes $NUM_WORKERS
-num_workers=$(( `wc -l ~/workers.txt | awk '{ print $1 }'` - 1 ))
-for worker in `tail -n $num_workers ~/workers.txt`; do
-    echo $worker
-    rsync -e "ssh -o StrictHostKeyChecking=no -i ~/ray_bootstrap_key.pem" -az "/home/ubuntu/flink-1.8.1" $worker:/home/ubuntu & sleep 0.5
-done
-wait
+python $DIR/format_config.py --master-ip $MASTER_IP --num-nodes $NUM_WORKERS --distribute
 
 # Start HDFS.
 if [[ $RESTART_HDFS -eq 1 ]]; then
@@ -86,4 +80,4 @@ fi
 wait
 
 echo "Collecting stats from workers..."
-$DIR/collect_latencies.sh $DIR/$latency_file $DIR/$throughput_file
+python $DIR/collect_latencies.py $DIR/$latency_file $DIR/$throughput_file
@@ -0,0 +1,68 @@
+# Access to files on the workers. SSHTransport runs commands on the workers
+# over ssh, with the same options as the shell scripts. LocalTransport stands
+# in for a cluster with one local directory per worker, for testing. Paths are
+# relative to the transport's directory.
+import glob
+import os
+import shlex
+import subprocess
+
+SSH_KEY = "~/ray_bootstrap_key.pem"
+
+
+class SSHTransport(object):
+    def __init__(self, directory, key=SSH_KEY):
+        self.directory = directory
+        self.key = os.path.expanduser(key)
+
+    def _run(self, worker, command, data=None):
+        return subprocess.check_output([
+            'ssh', '-C', '-o', 'StrictHostKeyChecking=no', '-i', self.key,
+            worker, command], input=data)
+
+    def list(self, worker, pattern):
+        # Returns (filename, size) for each file matching the glob pattern.
+        output = self._run(worker, "cd {} && stat -c '%n %s' {} 2>/dev/null || true".format(
+            shlex.quote(self.directory), pattern))
+        files = []
+        for line in output.decode().splitlines():
+            filename, size = line.rsplit(' ', 1)
+            files.append((filename, int(size)))
+        return sorted(files)
+
+    def read(self, worker, filename, offset):
+        # Returns the contents of the file from the given byte offset.
+        return self._run(worker, "tail -c +{} {}".format(
+            offset + 1, shlex.quote(os.path.join(self.directory, filename))))
+
+    def write(self, worker, filename, data):
+        # Replaces the file with data, creating its directory if needed. The
+        # file is renamed into place so that it is never seen half written.
+        path = os.path.join(self.directory, filename)
+        self._run(worker, "mkdir -p {0} && cat > {1}.tmp && mv {1}.tmp {1}".format(
+            shlex.quote(os.path.dirname(path)), shlex.quote(path)), data)
+
+
+class LocalTransport(object):
+    def __init__(self, directory):
+        self.directory = directory
+
+    def _path(self, worker, filename):
+        return os.path.join(self.directory, worker, filename)
+
+    def list(self, worker, pattern):
+        return sorted((os.path.basename(path), os.path.getsize(path))
+                      for path in glob.glob(self._path(worker, pattern)))
+
+    def read(self, worker, filename, offset):
+        with open(self._path(worker, filename), 'rb') as f:
+            f.seek(offset)
+            return f.read()
+
+    def write(self, worker, filename, data):
+        path = self._path(worker, filename)
+        if not os.path.isdir(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        with open(path + '.tmp', 'wb') as f:
+            f.write(data)
+        os.rename(path + '.tmp', path)
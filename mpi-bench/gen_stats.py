@@ -1,25 +1,110 @@
+import glob
+import os
 import pickle
+import sys
 import pandas as pd
 import numpy as np
 import matplotlib.pyplot as plt
 
+SIZES = [2500000, 25000000, 250000000]
+PERCENTILES = [50, 90, 99]
+
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, 'data'))
+import profiling
+
+
+def read_results(patterns):
+    # Concatenate the results in every file that matches one of the glob
+    # patterns.
+    filenames = []
+    for pattern in patterns:
+        matches = sorted(glob.glob(pattern))
+        assert matches, "No files match {}".format(pattern)
+        filenames += matches
+    return pd.concat([pd.read_csv(filename, usecols=["num_nodes", "num_float32", "millis"])
+                      for filename in filenames], ignore_index=True)
+
+
+def group_stats(data, sizes=None, percentiles=PERCENTILES):
+    # Stats of the times for every (num_float32, num_nodes), in one group-by
+    # over all of the data. Returns a frame indexed by both, in sorted order.
+    if sizes is not None:
+        data = data[data["num_float32"].isin(sizes)]
+    millis = data.groupby(["num_float32", "num_nodes"])["millis"]
+    stats = pd.DataFrame({
+        "mean": millis.mean(),
+        # Population std, as with np.std.
+        "std": millis.std(ddof=0),
+        "count": millis.count(),
+    })
+    for p in percentiles:
+        stats["p{:g}".format(p)] = millis.quantile(p / 100.0)
+    return stats
+
+
+def print_stats(stats, for_paper=True):
+    for float_size in stats.index.get_level_values("num_float32").unique():
+        print("")
+        for num_nodes, row in stats.loc[float_size].iterrows():
+            mean = row["mean"].round()
+            std = row["std"].round()
+            if for_paper:
+                print("({},{}),".format(mean, std))
+            else:
+                # system,num_workers,size,num_iterations,mean,std
+                print("mpi,{},{},{},{},{}".format(num_nodes, float_size*4, 10, mean, std))
+
 
 def output_stats(in_filename, float_size, for_paper=True):
-    print("")
-    data = pd.read_csv(in_filename)
-
-    mpi_data = data[data["num_float32"] == float_size].sort_values("num_nodes")
-
-    for num_nodes in pd.unique(mpi_data["num_nodes"]):
-        values = mpi_data[mpi_data["num_nodes"] == num_nodes]["millis"].values
-        mean = values.mean().round()
-        std = values.std().round()
-        if for_paper:
-            print("({},{}),".format(mean, std))
-        else:
-            # system,num_workers,size,num_iterations,mean,std
-            print("mpi,{},{},{},{},{}".format(num_nodes, float_size*4, 10, mean, std))
-
-output_stats("mpi-results-pernode.txt", 2500000, False)
-output_stats("mpi-results-pernode.txt", 25000000, False)
-output_stats("mpi-results-pernode.txt", 250000000, False)
+    print_stats(group_stats(read_results([in_filename]), [float_size]), for_paper)
+
+
+def main(patterns, sizes, for_paper, percentiles=PERCENTILES, csv_filename=None):
+    with profiling.stage('parse') as parsed:
+        data = read_results(patterns)
+        parsed.records += len(data)
+    with profiling.stage('aggregate') as aggregated:
+        stats = group_stats(data, sizes, percentiles)
+        aggregated.records += len(data)
+    with profiling.stage('save'):
+        print_stats(stats, for_paper)
+        if csv_filename is not None:
+            stats.to_csv(csv_filename)
+    return stats
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(description='Summarize the MPI allreduce times.')
+    parser.add_argument(
+            'filenames',
+            type=str,
+            nargs='*',
+            default=["mpi-results-pernode.txt"],
+            help="Result files or glob patterns. All of them are summarized together.")
+    parser.add_argument(
+            '--sizes',
+            type=int,
+            nargs='*',
+            default=SIZES,
+            help="Values of num_float32 to summarize. Pass no values for all of them.")
+    parser.add_argument(
+            '--percentiles',
+            type=float,
+            nargs='*',
+            default=PERCENTILES,
+            help="Percentiles of the times to include in the CSV.")
+    parser.add_argument(
+            '--for-paper',
+            action='store_true',
+            help="Print (mean,std), pairs instead of CSV rows.")
+    parser.add_argument(
+            '--csv-filename',
+            type=str,
+            default=None,
+            help="Also write every statistic for each size and number of nodes to this CSV.")
+    profiling.add_arguments(parser)
+    args = parser.parse_args()
+    profiling.configure_from_args(args)
+
+    main(args.filenames, args.sizes or None, args.for_paper, args.percentiles, args.csv_filename)
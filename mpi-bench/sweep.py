@@ -0,0 +1,218 @@
+# Runs a benchmark for every configuration in a parameter grid, e.g. the
+# sweep in bench.sh:
+#   python sweep.py --param workers=64 --param bytes=2500000,25000000,250000000
+# or a fake benchmark, to try out a sweep without a cluster:
+#   python sweep.py --hosts '' --max-workers 4 --prefix latency- \
+#       --param workers=1,2 --param gcs=0,1 --command 'echo {gcs} {workers}'
+# Each run logs the command and its output to a file named like the results
+# that the plot scripts read, <prefix><value>-<field>-...-<date>.txt, with the
+# fields in the order that they are given.
+#
+# Configurations that already have a log in the output directory are skipped,
+# so a sweep that was interrupted can be resumed by running it again. A log is
+# written as .partial and only renamed once the command succeeds, which also
+# removes the .partial logs of earlier attempts at it. Runs are started
+# concurrently as long as there are enough free hosts: each run takes
+# {workers} of the hosts for itself, and is passed them as {hosts}. As in
+# bench.sh, each MPI run first removes the checkpoints on its hosts.
+import datetime
+import itertools
+import os
+import re
+import subprocess
+import sys
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+WORKERS = "~/workers.txt"
+MPI_COMMAND = ("/usr/bin/mpiexec.openmpi --mca plm_rsh_no_tree_spawn 1 --mca btl_tcp_if_include ens5 "
+               "--host {hosts} -np {workers} -N 1 ./allreduce {bytes} {iterations} {iterations}")
+MPI_BEFORE = ("parallel-ssh -t 0 -i -P -H \"$(echo {hosts} | tr , ' ')\" -O StrictHostKeyChecking=no "
+              "'rm /tmp/mpi-checkpoint-*' || true")
+DATE_FORMAT = "%y-%m-%d-%H-%M-%S"
+DATE_REGEX = r"[0-9]{2}(-[0-9]{2}){5}"
+
+
+def parse_param(param):
+    # "name=v1,v2,..." -> (name, [v1, v2, ...])
+    name, values = param.split('=', 1)
+    return name, values.split(',')
+
+
+def expand(grid):
+    # Every combination of the values in the grid, an OrderedDict of field to
+    # values, as OrderedDicts in the same field order. Values that are listed
+    # twice are only run once.
+    configs = []
+    for values in itertools.product(*[list(OrderedDict.fromkeys(v)) for v in grid.values()]):
+        configs.append(OrderedDict(zip(grid, values)))
+    return configs
+
+
+def label(prefix, config):
+    return prefix + ''.join('{}-{}-'.format(val, field) for field, val in config.items())
+
+
+def completed(directory, prefix, extension):
+    # The labels of the runs that already have a log in the directory.
+    return set(logs(directory, prefix, extension))
+
+
+def logs(directory, prefix, extension):
+    # Map from label to the logs in the directory with that label.
+    regex = re.compile('^(' + re.escape(prefix) + '.*-)' + DATE_REGEX + re.escape(extension) + '$')
+    labels = {}
+    if os.path.isdir(directory):
+        for filename in sorted(os.listdir(directory)):
+            g = regex.match(filename)
+            if g is not None:
+                labels.setdefault(g.group(1), []).append(filename)
+    return labels
+
+
+def iterations(num_bytes):
+    # As in bench.sh.
+    return 100 if int(num_bytes) <= 25000000 else 20
+
+
+class Hosts(object):
+    # A pool of hosts that runs take for themselves while they run. Without
+    # host addresses, the pool only counts slots.
+    def __init__(self, hosts):
+        self.free = list(hosts)
+        self.size = len(self.free)
+        self.cond = threading.Condition()
+
+    def acquire(self, n):
+        with self.cond:
+            self.cond.wait_for(lambda: len(self.free) >= n)
+            hosts, self.free = self.free[:n], self.free[n:]
+            return hosts
+
+    def release(self, hosts):
+        with self.cond:
+            self.free += hosts
+            self.cond.notify_all()
+
+
+def run(config, name, command, directory, hosts, before=None, partials=()):
+    # Returns whether the run succeeded. Once it has, removes the partials,
+    # the logs of earlier attempts that failed or were interrupted.
+    num_hosts = int(config.get('workers', 1))
+    acquired = hosts.acquire(num_hosts)
+    try:
+        fields = dict(config)
+        fields.setdefault('iterations', iterations(config['bytes']) if 'bytes' in config else None)
+        fields['hosts'] = ','.join(host for host in acquired if host)
+        fields['output'] = name
+        path = os.path.join(directory, name)
+        with open(path + '.partial', 'w') as f:
+            for cmd in ([before] if before else []) + [command]:
+                cmd = cmd.format(**fields)
+                f.write(cmd + '\n')
+                f.flush()
+                returncode = subprocess.call(cmd, shell=True, cwd=directory, stdout=f, stderr=subprocess.STDOUT)
+                if returncode != 0:
+                    print(name, "FAILED with exit status", returncode, "see", path + '.partial')
+                    return False
+        os.rename(path + '.partial', path)
+        for partial in partials:
+            os.remove(os.path.join(directory, partial))
+        print(name, "done")
+        return True
+    finally:
+        hosts.release(acquired)
+
+
+def main(grid, command, prefix, directory, hosts, extension='.txt', before=None, dry_run=False):
+    # Returns the number of runs that failed.
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+    done = completed(directory, prefix, extension)
+    partials = logs(directory, prefix, extension + '.partial')
+    pending = []
+    for config in expand(grid):
+        if label(prefix, config) in done:
+            continue
+        assert int(config.get('workers', 1)) <= hosts.size, \
+            "Not enough hosts for {}".format(label(prefix, config))
+        pending.append(config)
+    print(len(done), "runs already done,", len(pending), "to run")
+    if dry_run:
+        for config in pending:
+            print(label(prefix, config))
+        return 0
+
+    # Every run of the sweep is dated when it started. Names are still
+    # unique, since no two configurations have the same label.
+    date = datetime.datetime.now()
+    with ThreadPoolExecutor(max(1, hosts.size)) as executor:
+        futures = []
+        for config in pending:
+            name = label(prefix, config) + date.strftime(DATE_FORMAT) + extension
+            futures.append(executor.submit(run, config, name, command, directory, hosts, before,
+                                           partials.get(label(prefix, config), [])))
+        return sum(not future.result() for future in futures)
+
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(description='Run a benchmark over a grid of parameters.')
+    parser.add_argument(
+            '--param',
+            type=str,
+            action='append',
+            required=True,
+            help="A field of the grid and its values, as name=v1,v2,... Can be given several times.")
+    parser.add_argument(
+            '--command',
+            type=str,
+            default=MPI_COMMAND,
+            help="Command to run for each configuration, formatted with the fields, {hosts} and {output}.")
+    parser.add_argument(
+            '--before',
+            type=str,
+            default=None,
+            help="Command to run before each configuration, formatted the same way. Defaults to removing the MPI checkpoints on {hosts} if --command is the default, and to nothing otherwise. Pass '' to run nothing.")
+    parser.add_argument(
+            '--prefix',
+            type=str,
+            default='mpi-latency-',
+            help="Prefix of the log filenames.")
+    parser.add_argument(
+            '--output-dir',
+            type=str,
+            default='.',
+            help="Directory to write the logs to and run the commands in.")
+    parser.add_argument(
+            '--hosts',
+            type=str,
+            default=WORKERS,
+            help="File with one host per line, of which the first is this node and is not used. Pass '' to only count --max-workers slots.")
+    parser.add_argument(
+            '--max-workers',
+            type=int,
+            default=None,
+            help="Most workers to use at once. Defaults to the number of hosts.")
+    parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help="Only print the runs that are not done yet.")
+    args = parser.parse_args()
+
+    grid = OrderedDict(parse_param(param) for param in args.param)
+    before = args.before
+    if before is None and args.command == MPI_COMMAND:
+        before = MPI_BEFORE
+    if args.hosts:
+        with open(os.path.expanduser(args.hosts), 'r') as f:
+            addresses = [host.strip() for host in f.readlines() if host.strip()][1:]
+        if args.max_workers is not None:
+            addresses = addresses[:args.max_workers]
+    else:
+        assert args.max_workers is not None, "--max-workers is needed without --hosts"
+        addresses = [''] * args.max_workers
+    num_failed = main(grid, args.command, args.prefix, args.output_dir, Hosts(addresses),
+                      before=before, dry_run=args.dry_run)
+    sys.exit(1 if num_failed else 0)